@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import AIInteraction
+
+@admin.register(AIInteraction)
+class AIInteractionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'endpoint', 'query_preview', 'processing_time', 'prompt_tokens', 'completion_tokens')
+    list_filter = ('endpoint', 'use_rag', 'created_at')
+    search_fields = ('user_query', 'chat_id')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at',)
+    
+    def query_preview(self, obj):
+        return obj.user_query[:50] + '...' if len(obj.user_query) > 50 else obj.user_query
+    query_preview.short_description = 'Query'
@@ -0,0 +1,60 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from services.analytics import summarize
+
+
+class Command(BaseCommand):
+    help = 'Latency percentiles, throughput and token / cache figures of recorded AI interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='window length, ending now (default 24)')
+        parser.add_argument('--since', help='window start (ISO 8601); overrides --hours')
+        parser.add_argument('--until', help='window end (ISO 8601, default now)')
+        parser.add_argument('--bucket', choices=['minute', 'hour', 'day'], default='hour',
+                            help='throughput bucket size (default hour)')
+        parser.add_argument('--endpoint', help='only this endpoint, e.g. send_message')
+        parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+
+    def _time(self, value, name):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'--{name}: not an ISO 8601 date/time: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def handle(self, *args, **options):
+        until = self._time(options['until'], 'until') if options['until'] else timezone.now()
+        since = self._time(options['since'], 'since') if options['since'] else until - timedelta(hours=options['hours'])
+        if since >= until:
+            raise CommandError('The window is empty: --since must be before --until')
+        summary = summarize(since, until, bucket=options['bucket'], endpoint=options['endpoint'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        self.stdout.write(f"{summary['since']} .. {summary['until']}")
+        self.stdout.write(f"Interactions: {summary['interactions']} ({summary['per_minute']}/min)")
+        if not summary['interactions']:
+            return
+        latency = summary['latency_ms']
+        self.stdout.write('Latency ms:   ' + '  '.join(f'{name} {value}' for name, value in latency.items()))
+        tokens = summary['tokens']
+        self.stdout.write(f"Tokens:       prompt {tokens['prompt']}  completion {tokens['completion']}")
+        for name, rate in summary['cache_hit_rate'].items():
+            self.stdout.write(f'Cache hits:   {name} {rate:.1%}')
+        for name, endpoint in summary['endpoints'].items():
+            self.stdout.write(f"Endpoint:     {name}: {endpoint['interactions']} at {endpoint['mean_ms']} ms mean")
+        for name, route in summary['routes'].items():
+            self.stdout.write(
+                f"Route:        {name}: {route['interactions']} at {route['mean_ms']} ms mean, "
+                f"{route['mean_completion_tokens']} completion tokens mean"
+            )
+        self.stdout.write(f"Per {options['bucket']}:")
+        for bucket in summary['buckets']:
+            self.stdout.write(
+                f"  {bucket['start']}  {bucket['interactions']:>6}  mean {bucket['mean_ms']} ms  max {bucket['max_ms']} ms"
+            )
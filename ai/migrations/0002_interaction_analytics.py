@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="cache_hits",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="chat_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="completion_tokens",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="endpoint",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="prompt_tokens",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="stage_timings",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="use_rag",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name="aiinteraction",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aiinteraction",
+            index=models.Index(
+                fields=["created_at", "processing_time"], name="ai_interaction_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="aiinteraction",
+            index=models.Index(
+                fields=["endpoint", "created_at"], name="ai_interaction_endpoint_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0002_interaction_analytics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aiinteraction",
+            name="route",
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
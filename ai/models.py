@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class AIInteraction(models.Model):
     """Model to track AI interactions for analytics"""
@@ -6,8 +7,24 @@ class AIInteraction(models.Model):
     ai_response = models.TextField()
     sources_used = models.JSONField(default=list, blank=True)
     processing_time = models.FloatField()  # in seconds
-    created_at = models.DateTimeField(auto_now_add=True)
-    
+    endpoint = models.CharField(max_length=32, blank=True)
+    chat_id = models.CharField(max_length=255, blank=True)
+    use_rag = models.BooleanField(default=True)
+    route = models.CharField(max_length=16, blank=True)  # chat.routing intent
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    stage_timings = models.JSONField(default=dict, blank=True)  # stage -> milliseconds
+    cache_hits = models.JSONField(default=dict, blank=True)  # cache name -> hit?
+    # Rows are written in bulk after the request (services.analytics), so the
+    # time is set when the interaction happens, not when it is saved
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Time-window scans, and latency percentiles within a window
+            models.Index(fields=['created_at', 'processing_time'], name='ai_interaction_time_idx'),
+            models.Index(fields=['endpoint', 'created_at'], name='ai_interaction_endpoint_idx'),
+        ]
+
     def __str__(self):
         return f"AI Interaction - {self.created_at}"
-
@@ -0,0 +1,142 @@
+"""
+Approximate (IVF) vs exact local search over a large packed scope segment.
+
+    python -m benchmarks.ann [--rows 100000,200000] [--dim 384] [--nprobe 4,8,16,32,64]
+                             [--queries 200] [--output path.json]
+
+Synthetic chunk vectors (clustered, as sentence embeddings are; queries are
+perturbed copies of stored vectors) are written as per-document segments of
+--chunks rows and packed into one user-scope segment by
+services.segments.SegmentStore, once as a flat matrix and once with the IVF
+layout. Reported per corpus size:
+
+    exact        brute-force top-10 over the flat packed segment
+    ivf          per --nprobe: recall@10 against exact, p50 latency and QPS
+    build_ms     packing time, flat and IVF (k-means training included)
+    retrain_ms   repacking the IVF segment after 10% more documents, which
+                 reuses the trained centroids
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
+
+import django
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.conf import settings  # noqa: E402
+from services.scopes import RetrievalScope  # noqa: E402
+from services.segments import SegmentStore  # noqa: E402
+from benchmarks.vector_storage import make_vectors  # noqa: E402
+
+
+def timed(fn, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(statistics.median(latencies), 2),
+        'qps': round(len(latencies) / (sum(latencies) / 1000), 1),
+    }, results
+
+
+def recall(exact, approximate):
+    found = [len({chunk_id for chunk_id, _ in a} & {chunk_id for chunk_id, _ in e}) / max(1, len(e))
+             for e, a in zip(exact, approximate)]
+    return round(statistics.mean(found), 4)
+
+
+def run(rows, args):
+    documents = rows // args.chunks
+    extra = max(1, documents // 10)
+    data = make_vectors((documents + extra) * args.chunks, args.dim, max(16, rows // 100), args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picked = rng.integers(0, documents * args.chunks, args.queries)
+    queries = list(data[picked] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+    scope = RetrievalScope.user(1)
+    with tempfile.TemporaryDirectory(prefix='ann-') as directory:
+        store = SegmentStore(directory=directory, max_open=documents + extra + 1)
+        os.makedirs(store.directory, exist_ok=True)
+        for content_id in range(1, documents + extra + 1):
+            block = slice((content_id - 1) * args.chunks, content_id * args.chunks)
+            ids_path, vectors_path = store._paths(content_id)
+            np.save(vectors_path, data[block])
+            np.save(ids_path, np.arange(block.start, block.stop, dtype=np.int64))
+        contents = list(range(1, documents + 1))
+
+        settings.LOCAL_ANN_MIN_ROWS = 0
+        started = time.perf_counter()
+        store.pack(scope, contents)
+        flat_ms = (time.perf_counter() - started) * 1000
+        store.search_scope(queries[0], scope, contents, args.top_k)
+        exact_stats, exact = timed(lambda q: store.search_scope(q, scope, contents, args.top_k), queries)
+
+        settings.LOCAL_ANN_MIN_ROWS = 1
+        started = time.perf_counter()
+        store.pack(scope, contents)
+        ivf_ms = (time.perf_counter() - started) * 1000
+        store.search_scope(queries[0], scope, contents, args.top_k)
+        lists = store._load_packed(scope.label).manifest['ann']['lists']
+        ivf = []
+        for nprobe in args.nprobe:
+            stats, results = timed(
+                lambda q: store.search_scope(q, scope, contents, args.top_k, nprobe=nprobe), queries
+            )
+            ivf.append(dict(nprobe=nprobe, recall_at_10=recall(exact, results), **stats,
+                            speedup=round(exact_stats['p50_ms'] / stats['p50_ms'], 1)))
+
+        grown = list(range(1, documents + extra + 1))
+        started = time.perf_counter()
+        store.pack(scope, grown)
+        retrain_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        'rows': documents * args.chunks,
+        'lists': lists,
+        'build_ms': {'flat': round(flat_ms, 1), 'ivf': round(ivf_ms, 1)},
+        'retrain_ms': round(retrain_ms, 1),
+        'exact': exact_stats,
+        'ivf': ivf,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='100000,200000', help='comma-separated corpus sizes')
+    parser.add_argument('--chunks', type=int, default=200, help='chunks per document')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--nprobe', default='4,8,16,32,64', help='comma-separated lists to scan')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+    args.nprobe = [int(n) for n in args.nprobe.split(',')]
+
+    # Packing is driven by the benchmark, not scheduled by the searches
+    settings.SCOPE_SEGMENT_MAX_DELTA = 10 ** 9
+    settings.SCOPE_SEGMENT_MAX_DEAD = 1.0
+    report = {
+        'benchmark': 'ann',
+        'python': sys.version.split()[0],
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': [run(int(n), args) for n in args.rows.split(',')],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
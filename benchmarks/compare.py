@@ -0,0 +1,53 @@
+"""
+Compare two loadtest result files.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def rows(baseline, candidate):
+    base, cand = baseline['result'], candidate['result']
+    yield 'rps', base.get('rps'), cand.get('rps')
+    yield 'errors', base.get('errors'), cand.get('errors')
+    for pct in ('p50', 'p95', 'p99'):
+        yield f'latency {pct} ms', base['latency_ms'].get(pct), cand['latency_ms'].get(pct)
+    for name in sorted(set(base.get('stages_ms', {})) | set(cand.get('stages_ms', {}))):
+        yield (f'stage {name} mean ms',
+               base.get('stages_ms', {}).get(name, {}).get('mean'),
+               cand.get('stages_ms', {}).get(name, {}).get('mean'))
+
+
+def format_change(old, new):
+    if old is None or new is None:
+        return 'n/a'
+    if old == 0:
+        return '=' if new == 0 else 'new'
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two loadtest result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args(argv)
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    if baseline['config'] != candidate['config']:
+        changed = sorted(k for k in baseline['config'] if baseline['config'].get(k) != candidate['config'].get(k))
+        print(f"note: configs differ in {', '.join(changed)}")
+    print(f"{'metric':<32}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name, old, new in rows(baseline, candidate):
+        print(f"{name:<32}{str(old):>12}{str(new):>12}{format_change(old, new):>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+WSGI threads vs ASGI event loop for the chat turn, at rising concurrency.
+
+    python -m benchmarks.concurrency --levels 2 8 32 --hf-latency-ms 1500 \\
+        --output benchmarks/results/concurrency.json
+
+Runs benchmarks.loadtest once per (server, concurrency) pair, each in its own
+process (Django settings are process-global), with a slow LLM stub so requests
+spend most of their time waiting on upstream I/O. The WSGI server gets the
+Procfile's 8 threads; the ASGI server a single event loop.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run_one(server, concurrency, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    command = [
+        sys.executable, '-m', 'benchmarks.loadtest',
+        '--server', server,
+        '--scenario', args.scenario,
+        '--concurrency', str(concurrency),
+        '--requests', str(max(args.min_requests, concurrency * args.requests_per_client)),
+        '--chats', str(max(4, concurrency)),
+        '--seed-messages', '4',
+        '--server-threads', str(args.server_threads),
+        '--hf-latency-ms', str(args.hf_latency_ms),
+        '--hf-embed-latency-ms', str(args.hf_embed_latency_ms),
+        '--pinecone-latency-ms', str(args.pinecone_latency_ms),
+        '--output', output,
+    ]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)['result']
+    finally:
+        os.unlink(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--servers', nargs='+', choices=('wsgi', 'asgi'), default=['wsgi', 'asgi'])
+    parser.add_argument('--scenario', choices=('send_message', 'send_message_stream'), default='send_message')
+    parser.add_argument('--requests-per-client', type=int, default=3)
+    parser.add_argument('--min-requests', type=int, default=10)
+    parser.add_argument('--server-threads', type=int, default=8)
+    parser.add_argument('--hf-latency-ms', type=float, default=1500.0)
+    parser.add_argument('--hf-embed-latency-ms', type=float, default=50.0)
+    parser.add_argument('--pinecone-latency-ms', type=float, default=30.0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for concurrency in args.levels:
+        for server in args.servers:
+            result = run_one(server, concurrency, args)
+            rows.append({'server': server, 'concurrency': concurrency, **result})
+            print(f"{server:5} c={concurrency:<4} rps={result['rps']:<7} "
+                  f"p50={result['latency_ms'].get('p50')} ms  p99={result['latency_ms'].get('p99')} ms  "
+                  f"errors={result['errors']}", file=sys.stderr)
+
+    report = {
+        'benchmark': 'concurrency',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': rows,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Bytes over the wire and repeat-visit cost of the chat page and its reads.
+
+    python -m benchmarks.delivery [--turns 20] [--pdf large] [--rtt-ms 50] [--mbps 10]
+                                  [--repeat 5] [--output path.json]
+
+Serves the app (WSGI, stub upstreams, scratch database) with static files
+collected into a scratch STATIC_ROOT, for a user with one chat of --turns
+question / answer pairs citing a --pdf document, and reports:
+
+    api      get_messages, get_chat_documents and a view_document window:
+             body bytes with no Accept-Encoding, gzip and (with the brotli
+             package) brotli; median server time of a full response and of a
+             revalidation with If-None-Match (304 when the data is unchanged)
+    static   the assets the dashboard links: plain vs pre-compressed bytes,
+             and the Cache-Control of their hashed and unhashed names
+    page     the dashboard HTML, plain and gzipped
+    visit    first and repeat visit: requests, bytes and the load time they
+             imply at --rtt-ms and --mbps (the page, then its assets in
+             parallel, then the API reads in parallel) for the previous
+             delivery (uncompressed HTML and JSON except view_document,
+             unhashed assets with a 60 s max-age, a cache-busted stylesheet,
+             no API validators) and the current one
+
+The fixture text repeats a small vocabulary, so it compresses better than
+typical prose; compare ratios between runs rather than with production.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from http.client import HTTPConnection
+
+from benchmarks.fixtures import ensure_fixtures, page_text
+from benchmarks.loadtest import (
+    Client, configure_environment, create_chats, create_user_session, start_wsgi_server,
+)
+from benchmarks.stubs import HFInferenceStub, PineconeStub
+
+STATIC_LINK = re.compile(r'(?:href|src)="(/static/[^"?]+)')
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}(\.[\w.]+)$')
+
+
+def fetch(port, path, cookie, headers=None):
+    conn = HTTPConnection('127.0.0.1', port, timeout=600)
+    started = time.perf_counter()
+    try:
+        conn.request('GET', path, headers={'Cookie': cookie, **(headers or {})})
+        response = conn.getresponse()
+        body = response.read()
+        return {
+            'status': response.status,
+            'body': body,
+            'bytes': len(body),
+            'ms': (time.perf_counter() - started) * 1000,
+            'headers': {name.lower(): value for name, value in response.getheaders()},
+        }
+    finally:
+        conn.close()
+
+
+def seed_chat(client, chat_id, pdf_path, turns):
+    """Upload the PDF and add turns whose answers cite three of its chunks"""
+    from chat.models import Chat, Message
+    from documents.models import Document, DocumentChunk
+
+    client.upload('/documents/upload/{chat_id}/', chat_id, pdf_path)
+    document = Document.objects.get(chat__supabase_id=chat_id)
+    chunks = list(DocumentChunk.objects.filter(source=document.content).values_list('chunk_id', 'page_number'))
+    rng = random.Random(0)
+    chat = Chat.objects.get(supabase_id=chat_id)
+    messages = []
+    for turn in range(turns):
+        messages.append(Message(chat=chat, role='user', content=f'Question {turn}: what does page {turn} say?'))
+        messages.append(Message(
+            chat=chat, role='assistant', content=page_text(rng, turn, words=250),
+            sources=[{'content_id': document.content_id, 'chunk_id': chunk_id, 'page': page,
+                      'score': round(rng.random(), 4)} for chunk_id, page in rng.sample(chunks, 3)],
+        ))
+    Message.objects.bulk_create(messages)
+    return document.id
+
+
+def measure_api(port, cookie, path, encodings, repeat):
+    sizes = {name: fetch(port, path, cookie, {'Accept-Encoding': accept})['bytes']
+             for name, accept in encodings.items()}
+    best = list(encodings.values())[-1]
+    full = [fetch(port, path, cookie, {'Accept-Encoding': best}) for _ in range(repeat)]
+    etag = full[-1]['headers'].get('etag')
+    revalidated = [fetch(port, path, cookie, {'Accept-Encoding': best, 'If-None-Match': etag or '"none"'})
+                   for _ in range(repeat)]
+    return {
+        'bytes': sizes,
+        'etag': etag,
+        'cache_control': full[-1]['headers'].get('cache-control'),
+        'full_ms': round(statistics.median(r['ms'] for r in full), 2),
+        'revalidate_status': revalidated[-1]['status'],
+        'revalidate_bytes': revalidated[-1]['bytes'],
+        'revalidate_ms': round(statistics.median(r['ms'] for r in revalidated), 2),
+    }
+
+
+def measure_static(port, cookie, page):
+    assets = {}
+    for url in dict.fromkeys(STATIC_LINK.findall(page)):
+        plain_url = HASHED_NAME.sub(r'\1', url)
+        hashed = fetch(port, url, cookie, {'Accept-Encoding': 'br, gzip'})
+        plain = fetch(port, plain_url, cookie, {'Accept-Encoding': 'identity'})
+        assets[plain_url] = {
+            'url': url,
+            'bytes': plain['bytes'],
+            'compressed_bytes': hashed['bytes'],
+            'encoding': hashed['headers'].get('content-encoding', 'identity'),
+            'cache_control': hashed['headers'].get('cache-control'),
+            'unhashed_cache_control': plain['headers'].get('cache-control'),
+        }
+    return assets
+
+
+def visit(requests, args):
+    """{requests, bytes, ms} for [(round, bytes)]: one round trip per round,
+    plus the transfer time of all the bytes"""
+    total = sum(size for _, size in requests)
+    rounds = len({round_ for round_, _ in requests})
+    return {
+        'requests': len(requests),
+        'bytes': total,
+        'ms': round(rounds * args.rtt_ms + total * 8 / (args.mbps * 1e6) * 1000, 1),
+    }
+
+
+def visits(page, api, assets, args):
+    # Before: view_document was already gzipped; the stylesheet carried a
+    # ?v=<now> cache buster; other assets revalidated once their 60 s were up
+    previous_api = [('api', result['bytes']['gzip' if name == 'view_document' else 'identity'])
+                    for name, result in api.items()]
+    previous_assets = [('assets', asset['bytes']) for asset in assets.values()]
+    previous_repeat_assets = [('assets', asset['bytes'] if 'chatgpt' in name else 0) for name, asset in assets.items()]
+    current_api = [('api', min(result['bytes'].values())) for result in api.values()]
+    current_assets = [('assets', asset['compressed_bytes']) for asset in assets.values()]
+    current_repeat_api = [('api', result['revalidate_bytes']) for result in api.values()]
+    previous_page, current_page = [('page', page['identity'])], [('page', page['gzip'])]
+    return {
+        'previous': {
+            'first': visit(previous_page + previous_assets + previous_api, args),
+            'repeat': visit(previous_page + previous_repeat_assets + previous_api, args),
+        },
+        'current': {
+            'first': visit(current_page + current_assets + current_api, args),
+            # Hashed assets are fresh for a year: no requests at all
+            'repeat': visit(current_page + current_repeat_api, args),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=20, help='question / answer pairs in the chat')
+    parser.add_argument('--pdf', choices=('large', 'medium', 'small'), default='large')
+    parser.add_argument('--pages', type=int, default=20, help='pages per view_document window')
+    parser.add_argument('--repeat', type=int, default=5, help='timed requests per measurement')
+    parser.add_argument('--rtt-ms', type=float, default=50.0, help='round trip time for the visit model')
+    parser.add_argument('--mbps', type=float, default=10.0, help='bandwidth for the visit model')
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    hf_stub = HFInferenceStub(latency_ms=1).start()
+    pinecone_stub = PineconeStub(latency_ms=1).start()
+    workdir = tempfile.mkdtemp(prefix='rag-bench-')
+    env = argparse.Namespace(server='wsgi', rate_limits=False, llm_max_concurrency=0, llm_max_queue=8,
+                             llm_max_queued_per_client=2, no_retrieval_cache=False, no_routing=False)
+    # Serve the hashed, pre-compressed assets as deployed
+    os.environ['STATIC_MANIFEST'] = 'true'
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            configure_environment(env, hf_stub, pinecone_stub, workdir)
+            from django.conf import settings
+            from django.core.management import call_command
+            settings.STATIC_ROOT = os.path.join(workdir, 'static')
+            call_command('collectstatic', interactive=False, verbosity=0)
+            try:
+                import brotli  # noqa: F401
+                encodings = {'identity': 'identity', 'gzip': 'gzip', 'br': 'br, gzip'}
+            except ImportError:
+                encodings = {'identity': 'identity', 'gzip': 'gzip'}
+
+            port, stop_server = start_wsgi_server(4)
+            user, session_key = create_user_session()
+            client = Client(port, session_key)
+            chat_id = create_chats(user, 1, 0)[0]
+            document_id = seed_chat(client, chat_id, ensure_fixtures()[args.pdf], args.turns)
+
+            paths = {
+                'get_messages': f'/api/chat/{chat_id}/messages/',
+                'get_chat_documents': f'/documents/api/chat/{chat_id}/documents/',
+                'view_document': f'/documents/api/view/{document_id}/?page=0&count={args.pages}',
+            }
+            api = {name: measure_api(port, client.cookie, path, encodings, args.repeat)
+                   for name, path in paths.items()}
+            plain_page = fetch(port, '/chat/', client.cookie, {'Accept-Encoding': 'identity'})
+            page = {'identity': plain_page['bytes'],
+                    'gzip': fetch(port, '/chat/', client.cookie, {'Accept-Encoding': 'gzip'})['bytes']}
+            assets = measure_static(port, client.cookie, plain_page['body'].decode('utf-8'))
+            stop_server()
+    finally:
+        hf_stub.stop()
+        pinecone_stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'delivery',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'api': api,
+        'page_bytes': page,
+        'static': assets,
+        'visits': visits(page, api, assets, args),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Embedding throughput: the hosted feature-extraction API vs the in-process
+ONNX backend (services.embeddings).
+
+    python -m benchmarks.embeddings [--model-dir DIR] [--hf-latency-ms 150] [--output path.json]
+
+Three workloads per backend:
+
+    query       one short text per call, one caller (the chat path)
+    concurrent  one short text per call from --concurrency threads at once
+    batched     the concurrent workload through the query MicroBatcher
+                (--window-ms, --max-batch, --batch-workers)
+    ingest      --chunks chunk-sized texts through AIService.generate_embeddings
+
+The HTTP path talks to the stub from benchmarks.stubs with --hf-latency-ms per
+request, so its numbers are the network bound. For the ONNX path, --model-dir
+should hold a sentence-transformers ONNX export (EMBEDDING_ONNX_FILE plus
+tokenizer.json). Without it a stand-in model is generated: a 12-layer
+feed-forward stack with all-mpnet-base-v2's sizes (768 hidden, 3072 inner),
+int8-quantized like the default export. It has roughly the same
+FLOPs per token as the real model but no attention. Use the numbers to compare
+the two paths, not as the real model's speed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
+
+import django
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.conf import settings  # noqa: E402
+from benchmarks.fixtures import WORDS, page_text  # noqa: E402
+from benchmarks.loadtest import QUESTIONS, summarize  # noqa: E402
+from benchmarks.stubs import HFInferenceStub  # noqa: E402
+from services import embeddings  # noqa: E402
+from services.batching import MicroBatcher  # noqa: E402
+
+STANDIN_FILE = 'model_quint8.onnx'
+
+
+def make_standin_model(out_dir, layers=12, hidden=768, inner=3072, seed=0):
+    """Write an int8 stand-in model and a word-level tokenizer.json to out_dir"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    vocab = {'<pad>': 0, '<unk>': 1}
+    for word in WORDS + [f'{w}.' for w in WORDS] + [w.capitalize() for w in WORDS] + ['Page']:
+        vocab.setdefault(word, len(vocab))
+    for n in range(1000):
+        vocab.setdefault(str(n), len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer.save(os.path.join(out_dir, 'tokenizer.json'))
+
+    rng = np.random.default_rng(seed)
+    init = [numpy_helper.from_array(
+        (rng.standard_normal((len(vocab), hidden)) * 0.02).astype(np.float32), 'embeddings')]
+    nodes = [helper.make_node('Gather', ['embeddings', 'input_ids'], ['x0'])]
+    for layer in range(layers):
+        x, w1, w2 = f'x{layer}', f'w1_{layer}', f'w2_{layer}'
+        init.append(numpy_helper.from_array(
+            (rng.standard_normal((hidden, inner)) / np.sqrt(hidden)).astype(np.float32), w1))
+        init.append(numpy_helper.from_array(
+            (rng.standard_normal((inner, hidden)) / np.sqrt(inner)).astype(np.float32), w2))
+        nodes += [
+            helper.make_node('MatMul', [x, w1], [f'h{layer}']),
+            helper.make_node('Relu', [f'h{layer}'], [f'r{layer}']),
+            helper.make_node('MatMul', [f'r{layer}', w2], [f'o{layer}']),
+            helper.make_node('Add', [x, f'o{layer}'], [f'x{layer + 1}']),
+        ]
+    nodes.append(helper.make_node('Identity', [f'x{layers}'], ['last_hidden_state']))
+    graph = helper.make_graph(
+        nodes, 'standin',
+        [helper.make_tensor_value_info('input_ids', TensorProto.INT64, ['batch', 'sequence']),
+         helper.make_tensor_value_info('attention_mask', TensorProto.INT64, ['batch', 'sequence'])],
+        [helper.make_tensor_value_info('last_hidden_state', TensorProto.FLOAT, ['batch', 'sequence', hidden])],
+        init,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=8)
+    float_path = os.path.join(out_dir, 'model.onnx')
+    onnx.save(model, float_path)
+    quantize_dynamic(float_path, os.path.join(out_dir, STANDIN_FILE), weight_type=QuantType.QUInt8)
+    os.unlink(float_path)
+    return out_dir
+
+
+def chunk_texts(count, seed=0):
+    """Chunk-sized texts (~1500 characters) like the ingestion splitter produces"""
+    rng = random.Random(seed)
+    return [page_text(rng, n, words=200)[:1500] for n in range(count)]
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def run_backend(backend, args, chunks):
+    queries = [QUESTIONS[i % len(QUESTIONS)] + f' ({i})' for i in range(args.queries)]
+    backend.embed(queries[:1])  # warm up (connection, session, worker thread)
+
+    single = [timed(backend.embed, [q]) for q in queries]
+
+    latencies = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(lambda q: timed(backend.embed, [q]), queries * args.concurrency))
+    concurrent_s = time.perf_counter() - started
+
+    calls = []
+    batcher = MicroBatcher(
+        lambda texts: calls.append(len(texts)) or backend.embed(texts), 'embed',
+        max_batch=args.max_batch, window_ms=args.window_ms, workers=args.batch_workers,
+    )
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        batched = list(pool.map(lambda q: timed(batcher.call, [q]), queries * args.concurrency))
+    batched_s = time.perf_counter() - started
+    batcher_stats = batcher.stats()
+
+    from services.ai_service import AIService
+    original, embeddings._backend = embeddings._backend, backend
+    try:
+        started = time.perf_counter()
+        vectors = AIService().generate_embeddings(chunks)
+        ingest_s = time.perf_counter() - started
+    finally:
+        embeddings._backend = original
+    return {
+        'query': {'texts_per_s': round(len(single) / (sum(single) / 1000), 1), 'latency_ms': summarize(single)},
+        'concurrent': {
+            'texts_per_s': round(len(latencies) / concurrent_s, 1),
+            'latency_ms': summarize(latencies),
+        },
+        'batched': {
+            'texts_per_s': round(len(batched) / batched_s, 1),
+            'latency_ms': summarize(batched),
+            'backend_calls': len(calls),
+            'batch_size': batcher_stats['batch_size'],
+            'mean_batch_size': batcher_stats['mean_batch_size'],
+            'queue_wait_ms': batcher_stats['queue_wait_ms'],
+        },
+        'ingest': {
+            'texts_per_s': round(len(chunks) / ingest_s, 1),
+            'seconds': round(ingest_s, 2),
+            'failed': sum(1 for v in vectors if v is None),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default=None, help='directory with a real ONNX export and tokenizer.json')
+    parser.add_argument('--onnx-file', default=None, help='model file inside --model-dir (default EMBEDDING_ONNX_FILE)')
+    parser.add_argument('--standin-layers', type=int, default=12)
+    parser.add_argument('--threads', type=int, default=0, help='EMBEDDING_THREADS for the ONNX session')
+    parser.add_argument('--hf-latency-ms', type=float, default=150.0)
+    parser.add_argument('--queries', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--window-ms', type=float, default=5.0, help='query batch window')
+    parser.add_argument('--max-batch', type=int, default=16, help='queries per batch')
+    parser.add_argument('--batch-workers', type=int, default=2, help='batches in flight')
+    parser.add_argument('--chunks', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32, help='EMBEDDING_BATCH_SIZE')
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    settings.EMBEDDING_THREADS = args.threads
+    settings.EMBEDDING_BATCH_SIZE = args.batch_size
+    chunks = chunk_texts(args.chunks)
+    results = {}
+
+    stub = HFInferenceStub(latency_ms=args.hf_latency_ms).start()
+    try:
+        settings.HF_EMBEDDING_URL = stub.url
+        settings.HF_TOKEN = 'stub'
+        results['hf'] = run_backend(embeddings.HFEmbeddingBackend(), args, chunks)
+    finally:
+        stub.stop()
+
+    with tempfile.TemporaryDirectory(prefix='embed-model-') as scratch:
+        if args.model_dir:
+            settings.EMBEDDING_ONNX_MODEL_DIR = args.model_dir
+            settings.EMBEDDING_ONNX_FILE = args.onnx_file or settings.EMBEDDING_ONNX_FILE
+            model = args.model_dir
+        else:
+            print(f"Building stand-in model ({args.standin_layers} layers)...", file=sys.stderr)
+            settings.EMBEDDING_ONNX_MODEL_DIR = make_standin_model(scratch, layers=args.standin_layers)
+            settings.EMBEDDING_ONNX_FILE = STANDIN_FILE
+            model = f'stand-in ({args.standin_layers}-layer feed-forward, int8)'
+        results['onnx'] = run_backend(embeddings.OnnxEmbeddingBackend(), args, chunks)
+
+    report = {
+        'benchmark': 'embeddings',
+        'onnx_model': model,
+        'cpu_count': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }
+    for name, result in results.items():
+        print(f"{name:5} query {result['query']['texts_per_s']:>7}/s  "
+              f"concurrent {result['concurrent']['texts_per_s']:>7}/s  "
+              f"batched {result['batched']['texts_per_s']:>7}/s  "
+              f"ingest {result['ingest']['texts_per_s']:>7}/s", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
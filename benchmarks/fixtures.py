@@ -0,0 +1,68 @@
+"""
+Fixture PDFs of varying size, generated on demand with PyMuPDF.
+
+    python -m benchmarks.fixtures [--out benchmarks/fixtures]
+"""
+import argparse
+import os
+import random
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# name -> page count
+SIZES = {
+    'small': 2,
+    'medium': 20,
+    'large': 100,
+}
+
+WORDS = (
+    "retrieval augmented generation embedding vector index document chunk "
+    "python django pinecone latency throughput cache query answer source page "
+    "model inference token prompt context summary conversation upload storage"
+).split()
+
+
+def page_text(rng, page, words=450):
+    lines = [f"Page {page + 1}"]
+    line = []
+    for _ in range(words):
+        line.append(rng.choice(WORDS))
+        if len(line) == 12:
+            lines.append(' '.join(line).capitalize() + '.')
+            line = []
+    return '\n'.join(lines)
+
+
+def make_pdf(path, pages, seed=0):
+    """Write a text PDF with the given number of pages"""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page in range(pages):
+        pdf_page = doc.new_page()
+        pdf_page.insert_textbox(fitz.Rect(50, 50, 545, 792), page_text(rng, page), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def ensure_fixtures(out_dir=FIXTURE_DIR):
+    """Create any missing fixture PDFs and return {name: path}"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, pages in SIZES.items():
+        path = os.path.join(out_dir, f'{name}.pdf')
+        if not os.path.exists(path):
+            make_pdf(path, pages, seed=pages)
+        paths[name] = path
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate benchmark fixture PDFs')
+    parser.add_argument('--out', default=FIXTURE_DIR)
+    args = parser.parse_args()
+    for name, path in ensure_fixtures(args.out).items():
+        print(f"{name}: {path} ({os.path.getsize(path)} bytes)")
@@ -0,0 +1,436 @@
+"""
+Offline load test for the chat and ingestion paths.
+
+    python -m benchmarks.loadtest --scenario send_message --requests 100 --concurrency 8 \\
+        --hf-latency-ms 400 --pinecone-latency-ms 40 --output benchmarks/results/send.json
+
+Starts stub Hugging Face and Pinecone servers, points the app at them, serves
+Django on a scratch SQLite database and drives it over HTTP. With --server wsgi
+(default) the app runs in a thread-pooled WSGI server (like gunicorn --threads N);
+with --server asgi it runs under uvicorn with the async chat views, like the
+Procfile's asgi process. Reports throughput, latency percentiles and the
+per-stage breakdown taken from the Server-Timing header.
+
+Scenarios: send_message, send_message_stream (ASGI views), get_messages, upload_document,
+upload_chunked (resumable upload API, --part-size-kb per part).
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import string
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+from benchmarks.fixtures import SIZES, ensure_fixtures
+from benchmarks.stubs import HFInferenceStub, PineconeStub
+
+SCENARIOS = ('send_message', 'send_message_stream', 'get_messages', 'upload_document', 'upload_chunked')
+
+QUESTIONS = [
+    "What does the document say about vector indexes?",
+    "Summarize the section on latency.",
+    "Which models are mentioned?",
+    "How is the cache used for queries?",
+    "List the main topics on page 2.",
+]
+# Mixed into the questions with --smalltalk-every
+SMALLTALK = ["hi", "Thanks!", "ok, got it", "thank you so much"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        'mean': round(statistics.mean(values), 2),
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(max(values), 2),
+    }
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in (header or '').split(','):
+        name, _, rest = part.strip().partition(';')
+        if name and rest.startswith('dur='):
+            stages[name] = float(rest[4:])
+    return stages
+
+
+def configure_environment(args, hf_stub, pinecone_stub, workdir):
+    """Point settings at the stubs and a scratch database before Django loads"""
+    os.environ.update({
+        'DJANGO_SETTINGS_MODULE': 'rag_chatbot.settings',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+        'HF_TOKEN': 'stub',
+        'HF_BASE_URL': hf_stub.url,
+        'HF_EMBEDDING_URL': hf_stub.url,
+        'PINECONE_API_KEY': 'stub',
+        'PINECONE_HOST': pinecone_stub.url,
+        'SERVER_TIMING_HEADER': 'true',
+        'UPLOAD_SESSION_DIR': os.path.join(workdir, 'uploads'),
+        'WARM_STATE_DIR': os.path.join(workdir, 'warm'),
+        'ASYNC_CHAT_VIEWS': 'true' if args.server == 'asgi' else 'false',
+        'RATE_LIMIT_ENABLED': 'true' if args.rate_limits else 'false',
+        # 0 = no admission limit, so raw throughput isn't capped by default
+        'LLM_MAX_CONCURRENCY': str(args.llm_max_concurrency or 100000),
+        'LLM_MAX_QUEUE': str(args.llm_max_queue),
+        'LLM_MAX_QUEUED_PER_CLIENT': str(args.llm_max_queued_per_client),
+        # The questions repeat, so with the cache on most turns skip retrieval
+        'RETRIEVAL_CACHE_SIZE': '0' if args.no_retrieval_cache else '1024',
+        'QUERY_ROUTING_ENABLED': 'false' if args.no_routing else 'true',
+    })
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 60
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def start_app_server(args):
+    """Start the app server; return (port, stop)"""
+    if args.server == 'asgi':
+        return start_asgi_server()
+    return start_wsgi_server(args.server_threads)
+
+
+def start_asgi_server():
+    """Serve the Django ASGI app with uvicorn on a single event loop"""
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    config = uvicorn.Config(get_asgi_application(), lifespan='off', log_level='warning', access_log=False)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+
+    return sock.getsockname()[1], stop
+
+
+def start_wsgi_server(server_threads):
+    """Serve the Django WSGI app with a fixed-size worker pool"""
+    from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class PooledWSGIServer(WSGIServer):
+        pool = ThreadPoolExecutor(max_workers=server_threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=True)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1], server.shutdown
+
+
+class Client:
+    """Minimal HTTP client holding a logged-in session and CSRF token"""
+
+    def __init__(self, port, session_key):
+        self.port = port
+        self.csrf = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
+        self.cookie = f'sessionid={session_key}; csrftoken={self.csrf}'
+
+    def request(self, method, path, body=None, content_type='application/json', extra_headers=None):
+        headers = {'Cookie': self.cookie, 'X-CSRFToken': self.csrf, **(extra_headers or {})}
+        if body is not None:
+            if content_type == 'application/json':
+                body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = content_type
+            headers['Content-Length'] = str(len(body))
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=600)
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            elapsed = (time.perf_counter() - started) * 1000
+            return response.status, payload, elapsed, response.getheader('Server-Timing')
+        finally:
+            conn.close()
+
+    def upload(self, path, chat_id, pdf_path, unique=False):
+        boundary = uuid.uuid4().hex
+        with open(pdf_path, 'rb') as f:
+            data = f.read()
+        if unique:
+            # A trailing PDF comment changes the hash without changing the text
+            data += b'\n%' + uuid.uuid4().hex.encode() + b'\n'
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="{os.path.basename(pdf_path)}"\r\nContent-Type: application/pdf\r\n\r\n'
+        ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+        return self.request('POST', path.format(chat_id=chat_id), body, f'multipart/form-data; boundary={boundary}')
+
+    def upload_chunked(self, chat_id, pdf_path, unique=False, part_size=None):
+        """Resumable upload: start, PUT each part, complete; timing covers the whole exchange"""
+        with open(pdf_path, 'rb') as f:
+            data = f.read()
+        if unique:
+            data += b'\n%' + uuid.uuid4().hex.encode() + b'\n'
+        started = time.perf_counter()
+        status, payload, _, timing = self.request('POST', f'/documents/api/uploads/{chat_id}/start/', {
+            'filename': os.path.basename(pdf_path), 'size': len(data),
+        })
+        if status != 201:
+            return status, payload, (time.perf_counter() - started) * 1000, timing
+        session = json.loads(payload)
+        part_size = part_size or session['part_size']
+        session_path = f"/documents/api/uploads/session/{session['upload_id']}/"
+        for offset in range(0, len(data), part_size):
+            part = data[offset:offset + part_size]
+            headers = {
+                'Content-Range': f'bytes {offset}-{offset + len(part) - 1}/{len(data)}',
+                'X-Part-SHA256': hashlib.sha256(part).hexdigest(),
+            }
+            status, payload, _, timing = self.request('PUT', session_path, part, 'application/octet-stream', headers)
+            if status != 200:
+                return status, payload, (time.perf_counter() - started) * 1000, timing
+        status, payload, _, timing = self.request('POST', session_path + 'complete/')
+        return status, payload, (time.perf_counter() - started) * 1000, timing
+
+
+def create_user_session():
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+
+    user = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}', password=uuid.uuid4().hex)
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return user, session.session_key
+
+
+def create_chats(user, count, seed_messages):
+    from chat.models import Chat, Message
+
+    chats = []
+    for i in range(count):
+        chat = Chat.objects.create(user=user, title=f'Bench chat {i}', supabase_id=str(uuid.uuid4()))
+        Message.objects.bulk_create([
+            Message(chat=chat, role='user' if n % 2 == 0 else 'assistant',
+                    content=f'Seed message {n} ' + 'lorem ipsum ' * 40)
+            for n in range(seed_messages)
+        ])
+        chats.append(chat.supabase_id)
+    return chats
+
+
+def run_scenario(args, users, fixtures):
+    """Drive the scenario; users is a list of (client, chat ids).
+
+    Workers are spread round-robin over users; --heavy-user-clients adds
+    workers that all act as user 0.
+    """
+    latencies, errors, stage_samples = [], 0, {}
+    statuses, per_user = {}, {}
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+    workers = args.concurrency + args.heavy_user_clients
+
+    def one(worker):
+        nonlocal errors
+        user = worker % len(users) if worker < args.concurrency else 0
+        client, chats = users[user]
+        chat_id = chats[worker % len(chats)]
+        for n in counter:
+            if args.scenario in ('send_message', 'send_message_stream'):
+                path = '/api/chat/send-message/stream/' if args.scenario == 'send_message_stream' else '/api/chat/send-message/'
+                message = QUESTIONS[n % len(QUESTIONS)]
+                if args.unique_questions:
+                    message = f'{message} ({n})'
+                if args.smalltalk_every and n % args.smalltalk_every == 0:
+                    message = SMALLTALK[n // args.smalltalk_every % len(SMALLTALK)]
+                if args.prefetch_ms:
+                    # The dashboard posts the draft once typing pauses; the
+                    # user presses Enter a moment later
+                    client.request('POST', '/api/chat/prefetch/', {'chat_id': chat_id, 'draft': message})
+                    time.sleep(args.prefetch_ms / 1000)
+                result = client.request('POST', path, {'chat_id': chat_id, 'message': message})
+            elif args.scenario == 'get_messages':
+                result = client.request('GET', f'/api/chat/{chat_id}/messages/')
+            elif args.scenario == 'upload_chunked':
+                result = client.upload_chunked(chat_id, fixtures[args.pdf], unique=args.unique_uploads,
+                                               part_size=args.part_size_kb * 1024 if args.part_size_kb else None)
+            else:
+                result = client.upload('/documents/upload/{chat_id}/', chat_id, fixtures[args.pdf],
+                                       unique=args.unique_uploads)
+            status, payload, elapsed, timing = result
+            failed = status >= 400 or (args.scenario.startswith('upload') and b'"success": false' in payload)
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if not failed:
+                    per_user.setdefault(user, []).append(elapsed)
+                if failed:
+                    errors += 1
+                for name, value in parse_server_timing(timing).items():
+                    stage_samples.setdefault(name, []).append(value)
+            if status == 429:
+                # Well-behaved clients back off instead of retrying straight away
+                time.sleep(args.backoff_ms / 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(one, w) for w in range(workers)]:
+            future.result()
+    duration = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'rps': round(len(latencies) / duration, 2) if duration else None,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'latency_ms': summarize(latencies),
+        # successful requests only
+        'per_user_latency_ms': {f'user{u}': summarize(v) for u, v in sorted(per_user.items())} if len(users) > 1 else {},
+        'stages_ms': {name: summarize(values) for name, values in sorted(stage_samples.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, default='send_message')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--server-threads', type=int, default=8, help='WSGI worker threads (Procfile: 8)')
+    parser.add_argument('--users', type=int, default=1, help='distinct logged-in users')
+    parser.add_argument('--heavy-user-clients', type=int, default=0,
+                        help='extra concurrent clients that all belong to user 0')
+    parser.add_argument('--chats', type=int, default=4, help='chats per user')
+    parser.add_argument('--seed-messages', type=int, default=20)
+    parser.add_argument('--pdf', choices=sorted(SIZES), default='small', help='fixture for uploads / chat docs')
+    parser.add_argument('--no-docs', action='store_true', help="don't upload a PDF to each chat first")
+    parser.add_argument('--unique-uploads', action='store_true',
+                        help='make every upload distinct so none are deduplicated')
+    parser.add_argument('--part-size-kb', type=int, default=0, help='upload_chunked part size (0 = server default)')
+    parser.add_argument('--hf-latency-ms', type=float, default=300.0)
+    parser.add_argument('--hf-embed-latency-ms', type=float, default=None, help='defaults to --hf-latency-ms')
+    parser.add_argument('--hf-token-interval-ms', type=float, default=0.0, help='delay between streamed tokens')
+    parser.add_argument('--hf-error-rate', type=float, default=0.0)
+    parser.add_argument('--pinecone-latency-ms', type=float, default=30.0)
+    parser.add_argument('--pinecone-error-rate', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limits', action='store_true', help='enable per-client token buckets')
+    parser.add_argument('--backoff-ms', type=float, default=1000.0, help='client pause after a 429')
+    parser.add_argument('--llm-max-concurrency', type=int, default=0, help='admission cap (0 = none)')
+    parser.add_argument('--llm-max-queue', type=int, default=8)
+    parser.add_argument('--llm-max-queued-per-client', type=int, default=2)
+    parser.add_argument('--unique-questions', action='store_true',
+                        help='make every question distinct, so only prefetching can warm the retrieval cache')
+    parser.add_argument('--prefetch-ms', type=float, default=0.0,
+                        help='post each question as a draft to the prefetch API this long before sending it')
+    parser.add_argument('--no-retrieval-cache', action='store_true',
+                        help='retrieve on every turn instead of reusing sources of repeated questions')
+    parser.add_argument('--smalltalk-every', type=int, default=0,
+                        help='make every Nth message a greeting or thanks instead of a question')
+    parser.add_argument('--no-routing', action='store_true',
+                        help='answer every message with retrieval and the full token budget')
+    parser.add_argument('--label', default='')
+    parser.add_argument('--verbose', action='store_true', help='show application log output')
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    hf_stub = HFInferenceStub(latency_ms=args.hf_latency_ms, embed_latency_ms=args.hf_embed_latency_ms,
+                              token_interval_ms=args.hf_token_interval_ms,
+                              jitter_ms=args.jitter_ms, error_rate=args.hf_error_rate).start()
+    pinecone_stub = PineconeStub(latency_ms=args.pinecone_latency_ms, jitter_ms=args.jitter_ms,
+                                 error_rate=args.pinecone_error_rate).start()
+    workdir = tempfile.mkdtemp(prefix='rag-bench-')
+    # The app logs with print(); keep it out of the report unless asked for
+    app_output = open(os.devnull, 'w') if not args.verbose else sys.stdout
+    try:
+        with contextlib.redirect_stdout(app_output):
+            configure_environment(args, hf_stub, pinecone_stub, workdir)
+            fixtures = ensure_fixtures()
+            port, stop_server = start_app_server(args)
+            users = []
+            for _ in range(args.users):
+                user, session_key = create_user_session()
+                client = Client(port, session_key)
+                chats = create_chats(user, args.chats, args.seed_messages)
+                if args.scenario.startswith('send_message') and not args.no_docs:
+                    for chat_id in chats:
+                        client.upload('/documents/upload/{chat_id}/', chat_id, fixtures[args.pdf])
+                users.append((client, chats))
+            upstream_before = {'hf': hf_stub.stats(), 'pinecone': pinecone_stub.stats()}
+            result = run_scenario(args, users, fixtures)
+            upstream_after = {'hf': hf_stub.stats(), 'pinecone': pinecone_stub.stats()}
+            stop_server()
+            # Write buffered interaction analytics while the database still exists
+            from services import analytics
+            analytics.get_recorder().flush()
+    finally:
+        hf_stub.stop()
+        pinecone_stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'loadtest',
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'label', 'verbose')},
+        'result': result,
+        'upstream_calls': {
+            name: {k: upstream_after[name][k] - upstream_before[name][k] for k in upstream_after[name]}
+            for name in upstream_after
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Compare the legacy flattened "Human:/Assistant:" prompt with the
+role-separated message list built by services.prompts.PromptBuilder.
+
+    python -m benchmarks.prompt_format [--turns 20] [--output path.json]
+
+Reports per-turn construction time, estimated prompt tokens and how much of
+each prompt is a byte-identical prefix of the previous turn's prompt (what
+provider-side prefix caching can reuse).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from services.prompts import PromptBuilder, estimate_tokens  # noqa: E402
+
+ANSWER = ("Based on the document, the candidate has experience with Python, Django and "
+          "machine learning pipelines, including retrieval-augmented generation. ") * 6
+SOURCE = ("Experience: Built document question-answering systems using vector search, "
+          "embeddings and large language models; deployed Django services. ") * 12
+
+
+def legacy_prompt(message, history, sources):
+    """Prompt construction as it was before role-separated messages"""
+    rag_context = ""
+    if sources:
+        rag_context = "\n\nRelevant information from uploaded documents:\n"
+        for i, source in enumerate(sources):
+            rag_context += f"[Source {i+1}]: {source['text']}\n"
+        message = f"{message}\n\n{rag_context}"
+    if history:
+        context = "You are a helpful AI assistant. Here's our conversation so far:\n\n"
+        for msg in history[-6:]:
+            role = "Human" if msg['role'] == 'user' else "Assistant"
+            context += f"{role}: {msg['content']}\n"
+        prompt = f"{context}\n\nHuman: {message}\n\nAssistant:"
+    else:
+        prompt = f"Human: {message}\n\nAssistant:"
+    return [{"role": "user", "content": prompt}]
+
+
+def common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def serialize(messages):
+    return json.dumps(messages)
+
+
+def memory_window(history, state):
+    """Mimic chat.memory: fold MEMORY_FOLD_STEP messages at a time into the summary"""
+    recent, step = settings.MEMORY_RECENT_MESSAGES, settings.MEMORY_FOLD_STEP
+    backlog = len(history) - state['watermark'] - recent
+    if backlog >= step:
+        state['watermark'] += backlog
+        state['summary'] = f"The user asked about projects 0-{state['watermark'] // 2}. " * 3
+    return state['summary'], history[state['watermark']:]
+
+
+def run(turns, repeat):
+    builder = PromptBuilder()
+    results = {}
+    for name in ('legacy', 'messages'):
+        history = []
+        state = {'watermark': 0, 'summary': ''}
+        build_us, tokens, reuse, reused_tokens = [], [], [], []
+        previous = ''
+        for turn in range(turns):
+            question = f"Question {turn}: what does the document say about project {turn}?"
+            sources = [{'text': SOURCE}] * 3
+            history.append({'role': 'user', 'content': question})
+            summary, window = memory_window(history, state)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                if name == 'legacy':
+                    messages = legacy_prompt(question, history, sources)
+                else:
+                    messages, _stats = builder.build(question, window, summary, sources)
+            build_us.append((time.perf_counter() - started) / repeat * 1e6)
+            payload = serialize(messages)
+            tokens.append(sum(estimate_tokens(m['content']) for m in messages))
+            shared = common_prefix(previous, payload)
+            reuse.append(shared / len(payload))
+            reused_tokens.append(shared // 4)
+            previous = payload
+            history.append({'role': 'assistant', 'content': ANSWER})
+        results[name] = {
+            'build_us_mean': round(statistics.mean(build_us), 2),
+            'prompt_tokens_mean': round(statistics.mean(tokens), 1),
+            'prompt_tokens_last': tokens[-1],
+            'prefix_reuse_mean': round(statistics.mean(reuse[1:]), 4) if turns > 1 else 0.0,
+            'prefix_reused_tokens_mean': round(statistics.mean(reused_tokens[1:]), 1) if turns > 1 else 0.0,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    results = {'benchmark': 'prompt_format', 'turns': args.turns, 'results': run(args.turns, args.repeat)}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
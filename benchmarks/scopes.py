@@ -0,0 +1,144 @@
+"""
+Local search latency of a retrieval scope as a user's library grows.
+
+    python -m benchmarks.scopes [--documents 10,100,500] [--chunks 200] [--dim 384]
+                                [--queries 50] [--output path.json]
+
+For each library size, synthetic per-document segments are written to a
+temporary services.segments.SegmentStore, and top-10 queries over the whole
+library (a user scope) are timed:
+
+    per_document   one matrix product per document segment, merged (no
+                   packed segment)
+    packed         the scope's packed segment alone
+    packed_delta   packed segment plus 5% of the documents added since it
+                   was packed, searched from their own segments
+    packed_dead    packed segment with 10% of its documents deleted (rows
+                   masked out)
+
+and results are checked against the per-document search. pack_ms is the
+time to (re)build the packed segment from the document segments.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
+
+import django
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.conf import settings  # noqa: E402
+from services.scopes import RetrievalScope  # noqa: E402
+from services.segments import SegmentStore  # noqa: E402
+from services import vectors  # noqa: E402
+
+
+def write_segments(store, documents, chunks, dim, seed):
+    rng = np.random.default_rng(seed)
+    os.makedirs(store.directory, exist_ok=True)
+    for content_id in range(1, documents + 1):
+        matrix = vectors.normalize(rng.standard_normal((chunks, dim)).astype(np.float32))
+        ids = np.arange(content_id * chunks, (content_id + 1) * chunks, dtype=np.int64)
+        ids_path, vectors_path = store._paths(content_id)
+        np.save(vectors_path, matrix)
+        np.save(ids_path, ids)
+
+
+def timed(fn, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(latencies)
+    return {
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        'qps': round(len(latencies) / (sum(latencies) / 1000), 1),
+    }, results
+
+
+def same(a, b):
+    return all([hit[0] for hit in x] == [hit[0] for hit in y] for x, y in zip(a, b))
+
+
+def run(documents, args):
+    scope = RetrievalScope.user(1)
+    with tempfile.TemporaryDirectory(prefix='scopes-') as directory:
+        store = SegmentStore(directory=directory, max_open=documents + 1)
+        write_segments(store, documents, args.chunks, args.dim, args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        queries = list(rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+        everything = list(range(1, documents + 1))
+        added = max(1, documents // 20)
+        deleted = set(range(1, max(1, documents // 10) + 1))
+
+        for content_id in everything:
+            store.get(content_id)  # map every segment, as a warm worker has
+        per_document, exact = timed(lambda q: store.search(q, everything, args.top_k), queries)
+
+        started = time.perf_counter()
+        store.pack(scope, everything)
+        pack_ms = (time.perf_counter() - started) * 1000
+        store.search_scope(queries[0], scope, everything, args.top_k)
+        packed, packed_results = timed(lambda q: store.search_scope(q, scope, everything, args.top_k), queries)
+
+        store.pack(scope, everything[:-added])
+        store.search_scope(queries[0], scope, everything, args.top_k)
+        packed_delta, delta_results = timed(lambda q: store.search_scope(q, scope, everything, args.top_k), queries)
+
+        store.pack(scope, everything)
+        live = [content_id for content_id in everything if content_id not in deleted]
+        _, exact_live = timed(lambda q: store.search(q, live, args.top_k), queries)
+        packed_dead, dead_results = timed(lambda q: store.search_scope(q, scope, live, args.top_k), queries)
+
+    return {
+        'documents': documents,
+        'chunks': documents * args.chunks,
+        'pack_ms': round(pack_ms, 1),
+        'per_document': per_document,
+        'packed': packed,
+        'packed_delta': dict(packed_delta, added_documents=added),
+        'packed_dead': dict(packed_dead, deleted_documents=len(deleted)),
+        'speedup_p50': round(per_document['p50_ms'] / packed['p50_ms'], 1),
+        'matches_per_document': same(exact, packed_results) and same(exact, delta_results)
+        and same(exact_live, dead_results),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', default='10,100,500', help='comma-separated library sizes')
+    parser.add_argument('--chunks', type=int, default=200, help='chunks per document')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    # Packing is driven by the benchmark, not scheduled by the searches
+    settings.SCOPE_SEGMENT_MAX_DELTA = 10 ** 9
+    settings.SCOPE_SEGMENT_MAX_DEAD = 1.0
+    report = {
+        'benchmark': 'scopes',
+        'python': sys.version.split()[0],
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': [run(int(n), args) for n in args.documents.split(',')],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
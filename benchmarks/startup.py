@@ -0,0 +1,213 @@
+"""
+Cold start: process spawn to first served request, and where import time goes.
+
+    python -m benchmarks.startup [--runs 5] [--top 20] [--output path.json]
+
+Each run starts a fresh interpreter. The interpreter loads
+rag_chatbot.wsgi.application, as gunicorn does after a worker recycle, and
+serves GET /healthz/ and GET / straight through the WSGI callable. Reported
+per run:
+
+    ready_ms          spawn until the application object exists
+    first_request_ms  spawn until the first response is complete
+    modules_loaded    modules in sys.modules after the two requests
+    deferred_ms       importing the heavy libraries that the upload,
+                      embedding and vector-store code paths load on first
+                      use (zero if startup already imported them)
+
+Worker recycles are measured too. A master loads the application with
+WARM_PRELOAD, as gunicorn.conf.py does with --preload, then forks --runs
+workers one after another. Each worker serves GET /healthz/ and exits.
+
+    recycle_ms        fork until the forked worker's first response
+    recycle_deferred  heavy libraries the forked worker still had to import
+
+A separate run with -X importtime, loading the application and its URLconf,
+is summarised by cumulative time per module and by self time per top-level
+package.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD = r'''
+import json, os, sys, time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from rag_chatbot.wsgi import application
+ready = time.time()
+
+def get(path):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'localhost',
+               'wsgi.input': BytesIO(b'')}
+    setup_testing_defaults(environ)
+    status = []
+    body = b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+    return status[0], len(body)
+
+first = get('/healthz/')
+first_done = time.time()
+landing = get('/')
+landing_done = time.time()
+loaded = len(sys.modules)
+
+deferred = [m for m in ('huggingface_hub', 'pinecone', 'langchain_community.document_loaders',
+                        'langchain_text_splitters') if m not in sys.modules]
+started = time.perf_counter()
+for module in deferred:
+    __import__(module)
+deferred_ms = (time.perf_counter() - started) * 1000
+
+print(json.dumps({'ready': ready, 'first_done': first_done, 'landing_done': landing_done,
+                  'statuses': [first[0], landing[0]], 'deferred': deferred,
+                  'deferred_ms': deferred_ms, 'modules': loaded}))
+'''
+
+RECYCLE = r'''
+import json, os, sys, time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+os.environ['WARM_PRELOAD'] = 'true'
+from rag_chatbot.wsgi import application
+from services.warm_state import post_fork
+
+def get(path):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'localhost',
+               'wsgi.input': BytesIO(b'')}
+    setup_testing_defaults(environ)
+    status = []
+    b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+    return status[0]
+
+for _ in range(int(sys.argv[1])):
+    read_end, write_end = os.pipe()
+    forked = time.time()
+    pid = os.fork()
+    if pid == 0:
+        post_fork()
+        status = get('/healthz/')
+        done = time.time()
+        deferred = [m for m in ('huggingface_hub', 'pinecone', 'langchain_community.document_loaders',
+                                'langchain_text_splitters') if m not in sys.modules]
+        os.write(write_end, json.dumps({'recycle_ms': (done - forked) * 1000, 'status': status,
+                                        'deferred': deferred}).encode())
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_end) as f:
+        print(f.read())
+'''
+
+
+def child_env(workdir):
+    env = dict(os.environ)
+    env.update({
+        'DJANGO_SETTINGS_MODULE': 'rag_chatbot.settings',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'startup.sqlite3'),
+        'PYTHONDONTWRITEBYTECODE': '',
+    })
+    return env
+
+
+def cold_start(env):
+    spawned = time.time()
+    result = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True)
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        'ready_ms': (child['ready'] - spawned) * 1000,
+        'first_request_ms': (child['first_done'] - spawned) * 1000,
+        'second_request_ms': (child['landing_done'] - child['first_done']) * 1000,
+        'deferred_ms': child['deferred_ms'],
+        'deferred': child['deferred'],
+        'statuses': child['statuses'],
+        'modules_loaded': child['modules'],
+    }
+
+
+def recycles(env, runs):
+    result = subprocess.run([sys.executable, '-c', RECYCLE, str(runs)], env=env,
+                            capture_output=True, text=True, check=True)
+    return [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+
+
+def import_profile(env, top):
+    """Parse -X importtime output: slowest modules (cumulative) and packages (self)"""
+    # The URLconf (and with it every view module) is loaded by the first request
+    code = 'from rag_chatbot.wsgi import application; import rag_chatbot.urls'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            env=env, capture_output=True, text=True, check=True)
+    modules, packages = [], {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        modules.append((name, int(cumulative_us)))
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    total_us = sum(packages.values())
+    return {
+        'total_ms': round(total_us / 1000, 1),
+        'modules_imported': len(modules),
+        'slowest_modules_ms': [
+            {'module': name, 'cumulative_ms': round(us / 1000, 1)}
+            for name, us in sorted(modules, key=lambda m: -m[1])[:top]
+        ],
+        'packages_self_ms': [
+            {'package': name, 'self_ms': round(us / 1000, 1)}
+            for name, us in sorted(packages.items(), key=lambda p: -p[1])[:top]
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='startup-') as workdir:
+        env = child_env(workdir)
+        cold_start(env)  # warm the OS page cache and .pyc files
+        runs = [cold_start(env) for _ in range(args.runs)]
+        forked = recycles(env, args.runs)
+        profile = import_profile(env, args.top)
+
+    def median(key):
+        return round(statistics.median(run[key] for run in runs), 1)
+
+    report = {
+        'benchmark': 'startup',
+        'python': sys.version.split()[0],
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'result': {
+            'ready_ms': median('ready_ms'),
+            'first_request_ms': median('first_request_ms'),
+            'second_request_ms': median('second_request_ms'),
+            'deferred_ms': median('deferred_ms'),
+            'deferred': runs[0]['deferred'],
+            'statuses': runs[0]['statuses'],
+            'modules_loaded': runs[0]['modules_loaded'],
+            'recycle_ms': round(statistics.median(run['recycle_ms'] for run in forked), 1),
+            'recycle_deferred': forked[0]['deferred'],
+        },
+        'runs': [{k: round(v, 1) if isinstance(v, float) else v for k, v in run.items()} for run in runs],
+        'import_profile': profile,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
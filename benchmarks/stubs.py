@@ -0,0 +1,239 @@
+"""
+Offline stand-ins for the Hugging Face inference API and a Pinecone index.
+
+Both servers run in background threads, answer with the same wire format as
+the real services, and can be given a per-request latency (with jitter) and
+an error rate so slow or flaky upstreams can be simulated.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic unit vector derived from the text (same text, same vector)"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubServer:
+    """Threaded HTTP server with configurable latency and error rate"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors}
+
+    def latency_for(self, path):
+        return self.latency_ms
+
+    def _admit(self, path):
+        """Sleep for the configured latency; return False to inject an error"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_for(path) + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay / 1000)
+        return not fail
+
+    def handle(self, path, payload):
+        raise NotImplementedError
+
+    def stream(self, path, payload):
+        raise NotImplementedError
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if not stub._admit(self.path):
+                    return self._send(503, {'error': 'injected failure'})
+                if payload.get('stream'):
+                    return self._stream(stub.stream(self.path, payload))
+                status, body = stub.handle(self.path, payload)
+                self._send(status, body)
+
+            def _stream(self, events):
+                """Server-sent events, one JSON object per event, then [DONE]"""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for event in events:
+                    self.wfile.write(b'data: ' + json.dumps(event).encode('utf-8') + b'\n\n')
+                    self.wfile.flush()
+                self.wfile.write(b'data: [DONE]\n\n')
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class HFInferenceStub(StubServer):
+    """Serves /v1/chat/completions and feature-extraction (POST /)"""
+
+    def __init__(self, reply_words=120, embed_latency_ms=None, token_interval_ms=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.reply_words = reply_words
+        self.embed_latency_ms = embed_latency_ms
+        # Delay between streamed tokens; the configured latency is time to first token
+        self.token_interval_ms = token_interval_ms
+
+    def latency_for(self, path):
+        if self.embed_latency_ms is not None and not path.rstrip('/').endswith('/chat/completions'):
+            return self.embed_latency_ms
+        return self.latency_ms
+
+    def words_for(self, payload):
+        """Reply length in words (one word per token), capped at max_tokens"""
+        return min(self.reply_words, payload.get('max_tokens') or self.reply_words)
+
+    def stream(self, path, payload):
+        """chat.completion.chunk events, one word per chunk"""
+        for i in range(self.words_for(payload)):
+            if i and self.token_interval_ms:
+                time.sleep(self.token_interval_ms / 1000)
+            yield {
+                'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': payload.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': None,
+                             'delta': {'role': 'assistant', 'content': ('lorem' if i == 0 else ' lorem')}}],
+            }
+
+    def handle(self, path, payload):
+        if path.rstrip('/').endswith('/chat/completions'):
+            prompt_chars = sum(len(m.get('content') or '') for m in payload.get('messages', []))
+            words = self.words_for(payload)
+            content = ' '.join(['lorem'] * words)
+            return 200, {
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': payload.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': words,
+                          'total_tokens': prompt_chars // 4 + words},
+            }
+        inputs = payload.get('inputs')
+        if isinstance(inputs, list):
+            return 200, [fake_embedding(text) for text in inputs]
+        if isinstance(inputs, str):
+            return 200, fake_embedding(inputs)
+        return 400, {'error': 'unsupported request'}
+
+
+class PineconeStub(StubServer):
+    """In-memory Pinecone data-plane: upsert, query (cosine, metadata filter), delete"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.vectors = {}
+        self._data_lock = threading.Lock()
+
+    def handle(self, path, payload):
+        if path.endswith('/vectors/upsert'):
+            with self._data_lock:
+                for vector in payload.get('vectors', []):
+                    self.vectors[vector['id']] = (
+                        np.asarray(vector['values'], dtype=np.float32), vector.get('metadata') or {}
+                    )
+            return 200, {'upsertedCount': len(payload.get('vectors', []))}
+        if path.endswith('/query'):
+            return 200, {'matches': self._query(payload), 'namespace': ''}
+        if path.endswith('/vectors/delete'):
+            with self._data_lock:
+                if payload.get('deleteAll'):
+                    self.vectors.clear()
+                for vector_id in payload.get('ids') or []:
+                    self.vectors.pop(vector_id, None)
+                if payload.get('filter'):
+                    for vector_id in [k for k, (_, meta) in self.vectors.items()
+                                      if matches_filter(meta, payload['filter'])]:
+                        del self.vectors[vector_id]
+            return 200, {}
+        return 404, {'error': 'unknown path %s' % path}
+
+    def _query(self, payload):
+        query = np.asarray(payload['vector'], dtype=np.float32)
+        flt = payload.get('filter')
+        with self._data_lock:
+            items = [(k, v, m) for k, (v, m) in self.vectors.items() if not flt or matches_filter(m, flt)]
+        if not items:
+            return []
+        matrix = np.stack([v for _, v, _ in items])
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        top = np.argsort(-scores)[:payload.get('topK', 10)]
+        return [{
+            'id': items[i][0],
+            'score': float(scores[i]),
+            'metadata': items[i][2] if payload.get('includeMetadata') else None,
+        } for i in top]
+
+
+def matches_filter(metadata, flt):
+    """Subset of Pinecone's filter language: equality, $eq, $in, $and, $or"""
+    for key, condition in flt.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if '$eq' in condition and value != condition['$eq']:
+                return False
+            if '$in' in condition and value not in condition['$in']:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
@@ -0,0 +1,133 @@
+"""
+Size and recall of the compact vector representations in services.vectors.
+
+    python -m benchmarks.vector_storage [--vectors 5000] [--queries 200] [--output path.json]
+
+Reports, per stored chunk vector, the bytes taken by the old JSON float list
+and by float32 / float16 / int8 codes; the JSON size of one Pinecone upsert
+entry before (float64 reprs + 1000 chars of metadata text) and after (float32
+precision values + ids only); and recall@k of quantized search against exact
+float32 search, with and without reranking the shortlist at full precision.
+
+Vectors are synthetic: unit vectors around random cluster centres, queries
+are perturbed copies of stored vectors, so near neighbours are close together
+as they are for real sentence embeddings.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
+
+import django
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from services import vectors  # noqa: E402
+
+TEXT = ("Experience: Built document question-answering systems using vector search, "
+        "embeddings and large language models; deployed Django services. ") * 12
+
+
+def make_vectors(count, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def storage_sizes(data):
+    sample = data[:200]
+    sizes = {'json': statistics.mean(len(json.dumps(v.tolist())) for v in sample)}
+    for dtype in vectors.DTYPES:
+        codes, _scale = vectors.encode(sample[0], dtype)
+        sizes[dtype] = len(codes) + (8 if dtype == 'int8' else 0)  # + scale column
+    sizes['int8+float32 rerank copy'] = sizes['int8'] + sizes['float32']
+    return {name: round(size, 1) for name, size in sizes.items()}
+
+
+def payload_sizes(data):
+    sample = data[:200]
+    legacy = statistics.mean(len(json.dumps({
+        'id': f'{i}_{i}', 'values': v.tolist(),
+        'metadata': {'chat_id': 'c8a1f9e2-4b7d-4c1e-9a55-2f3b7c6d8e90', 'pdf_id': i, 'chunk_id': i,
+                     'page': 3, 'text': TEXT[:1000]},
+    })) for i, v in enumerate(sample))
+    compact = statistics.mean(len(json.dumps({
+        'id': f'c{i}_{i}', 'values': vectors.payload_values(v),
+        'metadata': {'content_id': i, 'chunk_id': i, 'page': 3},
+    })) for i, v in enumerate(sample))
+    values_only = statistics.mean(len(json.dumps(vectors.payload_values(v))) for v in sample)
+    return {
+        'legacy_bytes': round(legacy),
+        'compact_bytes': round(compact),
+        'reduction': round(1 - compact / legacy, 3),
+        'values_json_float64_bytes': round(statistics.mean(len(json.dumps(v.tolist())) for v in sample)),
+        'values_json_float32_bytes': round(values_only),
+    }
+
+
+def recall(data, queries, top_k, oversamples):
+    exact = [set(np.argsort(-(data @ q))[:top_k]) for q in queries]
+    full = {i: vectors.encode(v, 'float32')[0] for i, v in enumerate(data)}
+    results = {}
+    for dtype in ('float16', 'int8'):
+        rows = []
+        for i, v in enumerate(data):
+            codes, scale = vectors.encode(v, dtype)
+            rows.append((i, codes, dtype, scale))
+        runs = [('no_rerank', 1, None)] + [(f'rerank_x{n}', n, lambda ids: {i: full[i] for i in ids}) for n in oversamples]
+        for name, oversample, load_full in runs:
+            hits, elapsed = [], []
+            for q, truth in zip(queries, exact):
+                started = time.perf_counter()
+                found = vectors.search(q, rows, top_k, load_full=load_full, oversample=oversample)
+                elapsed.append((time.perf_counter() - started) * 1000)
+                hits.append(len(truth & {key for key, _ in found}) / top_k)
+            results[f'{dtype}_{name}'] = {
+                f'recall@{top_k}': round(statistics.mean(hits), 4),
+                'search_ms_mean': round(statistics.mean(elapsed), 2),
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vectors', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=50)
+    parser.add_argument('--query-noise', type=float, default=1.0, help='distance of queries from stored vectors')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--oversample', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write results JSON to this path')
+    args = parser.parse_args(argv)
+
+    data = make_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = data[rng.integers(0, len(data), args.queries)]
+    # Noise of norm ~query_noise around a stored unit vector
+    queries = picks + args.query_noise * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(args.dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    report = {
+        'benchmark': 'vector_storage',
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'bytes_per_vector': storage_sizes(data),
+        'upsert_entry': payload_sizes(data),
+        'recall': recall(data, queries, args.top_k, args.oversample),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
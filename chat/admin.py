@@ -12,7 +12,7 @@ class ChatAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('chat', 'role', 'content_preview', 'created_at')
     list_filter = ('role', 'created_at', 'chat__user')
-    search_fields = ('content', 'chat__title')
+    search_fields = ('chat__title',)  # content is stored compressed
     readonly_fields = ('supabase_id', 'created_at')
     
     def content_preview(self, obj):
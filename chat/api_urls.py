@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the async views keep the event loop free while waiting on upstreams
+chat_views = async_views if settings.ASYNC_CHAT_VIEWS else views
 
 urlpatterns = [
     path('chat/', views.get_chats, name='get_chats'),
     path('chat/create/', views.create_chat, name='create_chat'),
-    path('chat/send-message/', views.send_message, name='send_message'),
-    path('chat/<str:chat_id>/messages/', views.get_messages, name='get_messages'),
+    path('chat/send-message/', chat_views.send_message, name='send_message'),
+    path('chat/send-message/stream/', async_views.send_message_stream, name='send_message_stream'),
+    path('chat/prefetch/', views.prefetch_retrieval, name='prefetch_retrieval'),
+    path('chat/<str:chat_id>/messages/', chat_views.get_messages, name='get_messages'),
+    path('chat/<str:chat_id>/messages/<int:message_id>/sources/', views.get_message_sources,
+         name='get_message_sources'),
     path('chat/<str:chat_id>/delete/', views.delete_chat, name='delete_chat'),
     path('chat/<str:chat_id>/rename/', views.rename_chat, name='rename_chat'),
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
+    path('embeddings/stats/', views.embedding_stats, name='embedding_stats'),
 ]
 
@@ -0,0 +1,258 @@
+"""
+Async versions of the chat endpoints, used when serving under ASGI.
+
+While a request waits on embeddings, Pinecone or the LLM the event loop keeps
+serving other requests, so one worker process holds many in-flight chats
+instead of one per thread. Enabled with ASYNC_CHAT_VIEWS (see chat/api_urls.py);
+the streaming endpoint is always available.
+"""
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from . import citations
+from .models import Chat, Message
+from .services import ConversationService
+from .views import resolve_guest_chat
+from services import analytics, metrics, prefetch
+from services.admission import Overloaded, admission
+from services.scopes import RetrievalScope, ScopeError
+from services.throttling import client_ident, throttle_wait, too_many_requests
+
+
+def parse_body(request):
+    """Return the JSON (or form) body as a dict"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def csrf_failure(request):
+    """Mirror DRF's SessionAuthentication: CSRF is only enforced for logged-in users"""
+    check = CsrfViewMiddleware(lambda req: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def resolve_chat(request, chat_id):
+    """Return (chat, error_response) for the requesting user or guest session"""
+    user = await request.auser()
+    if user.is_authenticated:
+        if request.method == 'POST' and csrf_failure(request):
+            return None, JsonResponse({'detail': 'CSRF Failed'}, status=403)
+        try:
+            return await Chat.objects.aget(supabase_id=chat_id, user=user), None
+        except Chat.DoesNotExist:
+            return None, JsonResponse({'detail': 'No Chat matches the given query.'}, status=404)
+    chat = await sync_to_async(resolve_guest_chat)(request, chat_id)
+    if chat is None:
+        return None, JsonResponse({'error': 'Invalid chat for guest'}, status=403)
+    return chat, None
+
+
+async def resolve_scope(request, data, chat):
+    """Return (RetrievalScope, error_response) for the request's retrieval scope"""
+    try:
+        scope = await sync_to_async(RetrievalScope.for_request)(data, await request.auser(), chat)
+    except ScopeError as e:
+        return None, JsonResponse({'error': str(e)}, status=e.status)
+    return scope, None
+
+
+async def throttled(request, scope):
+    """429 response if the request is over its rate limit, else None"""
+    wait = await sync_to_async(throttle_wait)(request, scope)
+    return too_many_requests(wait) if wait else None
+
+
+async def new_conversation_service():
+    # Client construction does blocking I/O (Pinecone index lookup); keep it off the loop
+    return await sync_to_async(ConversationService, thread_sensitive=False)()
+
+
+@csrf_exempt
+@require_POST
+async def send_message(request):
+    """Send message and get response"""
+    data = parse_body(request)
+    chat_id = data.get('chat_id')
+    message = data.get('message')
+    use_rag = data.get('use_rag', True)
+
+    if not chat_id or not message:
+        return JsonResponse({'error': 'chat_id and message are required'}, status=400)
+
+    started = time.perf_counter()
+    try:
+        with metrics.stage('chat_lookup'):
+            chat, error = await resolve_chat(request, chat_id)
+        if error:
+            return error
+        scope, error = await resolve_scope(request, data, chat)
+        if error:
+            return error
+        limited = await throttled(request, 'llm')
+        if limited:
+            return limited
+
+        ident = await sync_to_async(client_ident)(request)
+        prefetch.cancel(ident)
+        async with admission.aslot(ident):
+            with metrics.stage('db_write'):
+                question = await Message.objects.acreate(chat=chat, role='user', content=message, sources=[])
+
+            with metrics.stage('service_init'):
+                conversation_service = await new_conversation_service()
+            response, sources = await conversation_service.agenerate_response_with_context(
+                message, chat, use_rag, scope, message_id=question.pk
+            )
+
+        with metrics.stage('db_write'):
+            reply = await Message.objects.acreate(
+                chat=chat, role='assistant', content=response, sources=citations.references(sources)
+            )
+
+        conversation_service.memory.schedule_update(chat.pk)
+        analytics.record_interaction(
+            message, response, sources, time.perf_counter() - started, 'send_message',
+            chat_id=chat_id, use_rag=use_rag, stage_timings=metrics.current(), notes=metrics.notes(),
+        )
+
+        return JsonResponse({'response': response, 'message_id': reply.pk, 'sources': reply.sources})
+    except Overloaded as e:
+        return too_many_requests(e.retry_after, str(e))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def send_message_stream(request):
+    """Send message and stream the response as newline-delimited JSON events.
+
+    Events, one JSON object per line:
+        {"type": "sources", "sources": [...]}
+        {"type": "token", "content": "..."}     (repeated)
+        {"type": "done"}
+
+    If no LLM slot frees up in time the stream is a single
+    {"type": "error", "error": "...", "retry_after": seconds} event.
+    """
+    data = parse_body(request)
+    chat_id = data.get('chat_id')
+    message = data.get('message')
+    use_rag = data.get('use_rag', True)
+
+    if not chat_id or not message:
+        return JsonResponse({'error': 'chat_id and message are required'}, status=400)
+
+    chat, error = await resolve_chat(request, chat_id)
+    if error:
+        return error
+    scope, error = await resolve_scope(request, data, chat)
+    if error:
+        return error
+    limited = await throttled(request, 'llm')
+    if limited:
+        return limited
+    # request.user is a lazy DB lookup, so it's resolved in a thread
+    ident = await sync_to_async(client_ident)(request)
+    prefetch.cancel(ident)
+
+    async def events():
+        # The slot is held for the whole stream, so it's taken in here
+        try:
+            async with admission.aslot(ident):
+                async for event in generate():
+                    yield event
+        except Overloaded as e:
+            yield json.dumps({'type': 'error', 'error': str(e), 'retry_after': round(e.retry_after, 1)}) + '\n'
+
+    async def generate():
+        # The body is produced after the middleware has finished collecting
+        # metrics, so the stages for analytics are timed here
+        started = time.perf_counter()
+        timings, usage = {}, {}
+        question = await Message.objects.acreate(chat=chat, role='user', content=message, sources=[])
+        conversation_service = await new_conversation_service()
+        ai_service = conversation_service.ai_service
+        summary, history = await conversation_service.memory.aget_context(chat, question.pk)
+        route = conversation_service.route(message, use_rag)
+        usage['route'] = route.intent
+        sources = []
+        if route.use_rag:
+            retrieval_started = time.perf_counter()
+            sources = await ai_service.aretrieve_documents(
+                message, top_k=route.top_k, chat_id=chat.supabase_id, scope=scope
+            )
+            timings['retrieval'] = (time.perf_counter() - retrieval_started) * 1000
+        yield json.dumps({'type': 'sources', 'sources': citations.references(sources)}) + '\n'
+
+        parts = []
+        generation_started = time.perf_counter()
+        async for delta in ai_service.astream_response(message, history, summary, sources, usage=usage,
+                                                       max_tokens=route.max_tokens):
+            if not parts:
+                timings['first_token'] = (time.perf_counter() - generation_started) * 1000
+            parts.append(delta)
+            yield json.dumps({'type': 'token', 'content': delta}) + '\n'
+        timings['generation'] = (time.perf_counter() - generation_started) * 1000
+
+        response = ''.join(parts)
+        reply = await Message.objects.acreate(
+            chat=chat, role='assistant', content=response, sources=citations.references(sources)
+        )
+        conversation_service.memory.schedule_update(chat.pk)
+        analytics.record_interaction(
+            message, response, sources, time.perf_counter() - started, 'send_message_stream',
+            chat_id=chat_id, use_rag=use_rag, stage_timings=timings, notes=usage,
+        )
+        yield json.dumps({'type': 'done', 'message_id': reply.pk}) + '\n'
+
+    response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def amessages_etag(chat):
+    """Async views.messages_etag"""
+    stats = await Message.objects.filter(chat=chat).aaggregate(last=Max('id'), count=Count('id'))
+    return f'"m{chat.pk}-{stats["last"] or 0}-{stats["count"]}"'
+
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+async def get_messages(request, chat_id):
+    """Get messages for a chat"""
+    try:
+        with metrics.stage('chat_lookup'):
+            chat, error = await resolve_chat(request, chat_id)
+        if error:
+            return error
+        with metrics.stage('db_read'):
+            tag = await amessages_etag(chat)
+            not_modified = get_conditional_response(request, etag=tag)
+            if not_modified is not None:
+                return not_modified
+            payload = [{
+                'id': message.pk,
+                'role': message.role,
+                'content': message.content,
+                'sources': message.sources or [],
+                'created_at': message.created_at
+            } async for message in Message.objects.filter(chat=chat).order_by('created_at')]
+        response = JsonResponse(payload, safe=False)
+        response['ETag'] = tag
+        return response
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
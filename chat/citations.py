@@ -0,0 +1,52 @@
+from django.db.models import Q
+
+
+def references(sources):
+    """Stored (and API) form of a reply's sources: the chunk each came from,
+    its page and score. The text stays in the chunks table and is loaded by
+    resolve() when a citation is opened; only a source with no chunk to
+    point at (an older vector whose chunk is gone) keeps its text."""
+    stored = []
+    for source in sources or []:
+        if source.get('content_id') is None:
+            stored.append({'text': source.get('text', ''), 'page': source.get('page'), 'score': source.get('score')})
+            continue
+        score = source.get('score')
+        stored.append({
+            'content_id': source['content_id'],
+            'chunk_id': source['chunk_id'],
+            'page': source.get('page'),
+            'score': round(score, 4) if isinstance(score, float) else score,
+        })
+    return stored
+
+
+def resolve(sources):
+    """Copy of stored sources with their chunk texts filled in: from the chunk
+    cache, the rest in one query. A chunk deleted since resolves to ''."""
+    from documents.models import DocumentChunk
+    from services import retrieval_cache
+
+    resolved = [dict(source) for source in sources or []]
+    keys = {('content', s['content_id'], s['chunk_id']) for s in resolved if s.get('content_id') is not None}
+    cache = retrieval_cache.get_chunk_cache()
+    found = cache.get_many(keys) if cache is not None else {}
+    missing = keys - found.keys()
+    if missing:
+        query = Q()
+        for _, content_id, chunk_id in missing:
+            query |= Q(source_id=content_id, chunk_id=chunk_id)
+        loaded = {
+            ('content', source_id, chunk_id): (text, page, source_id)
+            for source_id, chunk_id, text, page in DocumentChunk.objects.filter(query).values_list(
+                'source_id', 'chunk_id', 'content', 'page_number'
+            )
+        }
+        if cache is not None:
+            cache.put_many(loaded)
+        found.update(loaded)
+    for source in resolved:
+        if source.get('content_id') is not None:
+            chunk = found.get(('content', source['content_id'], source['chunk_id']))
+            source['text'] = chunk[0] if chunk else ''
+    return resolved
@@ -0,0 +1,54 @@
+import zlib
+from django import forms
+from django.conf import settings
+from django.db import models
+
+PLAIN = b't'
+ZLIB = b'z'
+
+
+class CompressedTextField(models.BinaryField):
+    """Text stored as bytes: UTF-8 behind a one-byte tag, zlib-compressed
+    when it is at least MESSAGE_COMPRESS_MIN_BYTES long and compression
+    helps. Reads (attributes and values()) always give back a str, so the
+    column is opaque to the database: no LIKE / icontains lookups."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get('editable') is True:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def get_prep_value(self, value):
+        if not isinstance(value, str):
+            return super().get_prep_value(value)
+        data = value.encode('utf-8')
+        threshold = settings.MESSAGE_COMPRESS_MIN_BYTES
+        if threshold and len(data) >= threshold:
+            packed = zlib.compress(data, 6)
+            if len(packed) < len(data):
+                return ZLIB + packed
+        return PLAIN + data
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        data = bytes(value)
+        if data[:1] == ZLIB:
+            return zlib.decompress(data[1:]).decode('utf-8')
+        if data[:1] == PLAIN:
+            return data[1:].decode('utf-8')
+        return data.decode('utf-8')
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
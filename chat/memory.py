@@ -0,0 +1,124 @@
+import threading
+from django.conf import settings
+from services.background import BackgroundWorker
+from .models import Chat, Message
+
+_worker = BackgroundWorker('conversation-memory')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def truncate_turn(content, limit=None):
+    """Clip a single message so one huge answer can't blow up the prompt"""
+    limit = limit or settings.MEMORY_MAX_MESSAGE_CHARS
+    if len(content) <= limit:
+        return content
+    return content[:limit].rstrip() + ' [...]'
+
+
+class ConversationMemory:
+    """Rolling summary of older turns plus a bounded window of recent ones.
+
+    Messages are folded into the summary in steps of MEMORY_FOLD_STEP rather
+    than one turn at a time. Between folds the summary and the window start
+    stay fixed and the prompt only grows at the end, so provider-side prefix
+    caching keeps hitting.
+    """
+
+    # Upper bound on messages folded into the summary per update
+    SUMMARY_BATCH = 20
+
+    def __init__(self, ai_service=None):
+        self._ai_service = ai_service
+        self.recent_messages = settings.MEMORY_RECENT_MESSAGES
+        self.fold_step = settings.MEMORY_FOLD_STEP
+
+    @property
+    def ai_service(self):
+        if self._ai_service is None:
+            from services.ai_service import AIService
+            self._ai_service = AIService()
+        return self._ai_service
+
+    def _recent(self, chat, exclude_id=None):
+        """Newest messages after the watermark, newest first"""
+        messages = Message.objects.filter(chat=chat, id__gt=chat.memory_watermark)
+        if exclude_id is not None:
+            messages = messages.exclude(id=exclude_id)
+        return messages.order_by('-id').values('id', 'role', 'content', 'created_at')[
+            :self.recent_messages + self.fold_step
+        ]
+    
+    def get_context(self, chat, exclude_id=None):
+        """Return (summary, messages after the watermark) for building a prompt.
+
+        exclude_id is the just-saved message being answered, which the prompt
+        carries in full; its clipped copy in the history would no longer
+        match it, and it would be sent twice.
+        """
+        recent = list(self._recent(chat, exclude_id))
+        recent.reverse()
+        history = [{
+            'role': msg['role'],
+            'content': truncate_turn(msg['content']),
+            'created_at': msg['created_at'],
+        } for msg in recent]
+        return chat.memory_summary, history
+
+    async def aget_context(self, chat, exclude_id=None):
+        """Async ORM version of get_context"""
+        recent = [msg async for msg in self._recent(chat, exclude_id)]
+        recent.reverse()
+        history = [{
+            'role': msg['role'],
+            'content': truncate_turn(msg['content']),
+            'created_at': msg['created_at'],
+        } for msg in recent]
+        return chat.memory_summary, history
+
+    def schedule_update(self, chat_pk):
+        """Fold older turns into the summary in the background (deduplicated per chat)"""
+        with _pending_lock:
+            if chat_pk in _pending:
+                return
+            _pending.add(chat_pk)
+        _worker.submit(self._run_update, chat_pk)
+
+    def _run_update(self, chat_pk):
+        with _pending_lock:
+            _pending.discard(chat_pk)
+        self.update(chat_pk)
+
+    def update(self, chat_pk):
+        """Incrementally summarize messages between the watermark and the recent window"""
+        chat = Chat.objects.only('id', 'memory_summary', 'memory_watermark').get(pk=chat_pk)
+        window = list(
+            Message.objects.filter(chat_id=chat_pk).order_by('-id').values_list('id', flat=True)[:self.recent_messages]
+        )
+        if len(window) < self.recent_messages:
+            return False
+        boundary = window[-1]
+        older = list(
+            Message.objects.filter(chat_id=chat_pk, id__gt=chat.memory_watermark, id__lt=boundary)
+            .order_by('id')
+            .values('id', 'role', 'content')[:self.SUMMARY_BATCH]
+        )
+        if len(older) < min(self.fold_step, self.SUMMARY_BATCH):
+            return False
+
+        turns = [{'role': msg['role'], 'content': truncate_turn(msg['content'])} for msg in older]
+        summary = self.ai_service.summarize_conversation(chat.memory_summary, turns)
+        if not summary:
+            print(f"Memory: summarization failed for chat {chat_pk}, keeping watermark {chat.memory_watermark}")
+            return False
+
+        # Guard on the old watermark so a concurrent update can't be overwritten
+        updated = Chat.objects.filter(pk=chat_pk, memory_watermark=chat.memory_watermark).update(
+            memory_summary=summary,
+            memory_watermark=older[-1]['id'],
+        )
+        print(f"Memory: folded {len(older)} messages into summary for chat {chat_pk} ({len(summary)} chars)")
+        if updated and len(older) == self.SUMMARY_BATCH:
+            # More backlog than one batch (e.g. a chat older than this feature)
+            self.schedule_update(chat_pk)
+        return bool(updated)
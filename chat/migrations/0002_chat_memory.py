@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chat",
+            name="memory_summary",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="chat",
+            name="memory_watermark",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
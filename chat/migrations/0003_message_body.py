@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:56
+
+import chat.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_chat_memory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="body",
+            field=chat.fields.CompressedTextField(null=True),
+        ),
+    ]
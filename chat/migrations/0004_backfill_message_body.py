@@ -0,0 +1,141 @@
+import hashlib
+from django.db import migrations
+from django.db.models import Q
+
+BATCH = 500
+# Sources retrieved from Pinecone carry the chunk text as it was stored in
+# the vector metadata: cut to its first 1000 characters
+METADATA_TEXT_LIMIT = 1000
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def backfill_body(apps, schema_editor):
+    """Copy every message's content into the (compressed) body column, and
+    turn sources that carry chunk text into chunk references.
+
+    A stored source is matched to a chunk of its chat owner's documents by
+    page and text: the whole chunk, or (for the usual Pinecone copy, cut at
+    METADATA_TEXT_LIMIT characters) its first METADATA_TEXT_LIMIT
+    characters. Sources that match nothing (the chunk was deleted) keep
+    their text; both counts are printed.
+    """
+    Message = apps.get_model("chat", "Message")
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+
+    # owner id -> {(page, digest of the first METADATA_TEXT_LIMIT chars):
+    #              [(content id, chunk id, digest of the whole text)]}
+    chunk_index = {}
+    counts = {"converted": 0, "kept": 0}
+
+    def chunks_of(owner_id):
+        if owner_id not in chunk_index:
+            rows = DocumentChunk.objects.filter(source__owner_id=owner_id).values_list(
+                "source_id", "chunk_id", "page_number", "content"
+            )
+            index = {}
+            for source_id, chunk_id, page, text in rows.iterator():
+                key = (page, _digest(text[:METADATA_TEXT_LIMIT]))
+                index.setdefault(key, []).append((source_id, chunk_id, _digest(text)))
+            chunk_index[owner_id] = index
+        return chunk_index[owner_id]
+
+    def match(text, page, owner_id):
+        candidates = chunks_of(owner_id).get((page, _digest(text[:METADATA_TEXT_LIMIT])), [])
+        whole = _digest(text)
+        for source_id, chunk_id, digest in candidates:
+            if digest == whole:
+                return source_id, chunk_id
+        # A copy cut at the limit matches a longer chunk by its prefix
+        if len(text) == METADATA_TEXT_LIMIT and candidates:
+            return candidates[0][:2]
+        return None
+
+    def references(sources, owner_id):
+        converted = []
+        for source in sources:
+            text = source.get("text")
+            found = match(text, source.get("page"), owner_id) if text else None
+            if found is None:
+                counts["kept"] += 1
+                converted.append(source)
+                continue
+            counts["converted"] += 1
+            converted.append({
+                "content_id": found[0],
+                "chunk_id": found[1],
+                "page": source.get("page"),
+                "score": source.get("score"),
+            })
+        return converted
+
+    batch = []
+    messages = Message.objects.filter(body__isnull=True).select_related("chat").order_by("pk")
+    for message in messages.iterator(chunk_size=BATCH):
+        message.body = message.content
+        if message.sources:
+            message.sources = references(message.sources, message.chat.user_id)
+        batch.append(message)
+        if len(batch) >= BATCH:
+            Message.objects.bulk_update(batch, ["body", "sources"])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ["body", "sources"])
+    if counts["converted"] or counts["kept"]:
+        print(
+            f"\n  Message sources: {counts['converted']} converted to chunk references, "
+            f"{counts['kept']} kept their text (no matching chunk)"
+        )
+
+
+def restore_content(apps, schema_editor):
+    """Reverse of backfill_body: copy body back into content (decompressed)
+    and put the chunk text back into sources that reference a chunk."""
+    Message = apps.get_model("chat", "Message")
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+
+    def texts(sources):
+        query = Q()
+        for source in sources:
+            query |= Q(source_id=source["content_id"], chunk_id=source["chunk_id"])
+        return {
+            (source_id, chunk_id): text
+            for source_id, chunk_id, text in DocumentChunk.objects.filter(query).values_list(
+                "source_id", "chunk_id", "content"
+            )
+        }
+
+    batch = []
+    for message in Message.objects.order_by("pk").iterator(chunk_size=BATCH):
+        message.content = message.body or ""
+        referenced = [s for s in message.sources or [] if s.get("content_id") is not None]
+        if referenced:
+            found = texts(referenced)
+            message.sources = [
+                {
+                    "text": found.get((s["content_id"], s["chunk_id"]), ""),
+                    "page": s.get("page"),
+                    "score": s.get("score"),
+                } if s.get("content_id") is not None else s
+                for s in message.sources
+            ]
+        batch.append(message)
+        if len(batch) >= BATCH:
+            Message.objects.bulk_update(batch, ["content", "sources"])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ["content", "sources"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0003_message_body"),
+        ("documents", "0007_quantized_chunk_vectors"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_body, restore_content),
+    ]
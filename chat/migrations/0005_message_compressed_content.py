@@ -0,0 +1,33 @@
+import chat.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_backfill_message_body"),
+    ]
+
+    operations = [
+        # The default lets a reverse migration re-add the plain column to a
+        # table that has rows; 0004's reverse then fills it in from body
+        migrations.AlterField(
+            model_name="message",
+            name="content",
+            field=models.TextField(default=""),
+        ),
+        migrations.RemoveField(
+            model_name="message",
+            name="content",
+        ),
+        migrations.RenameField(
+            model_name="message",
+            old_name="body",
+            new_name="content",
+        ),
+        migrations.AlterField(
+            model_name="message",
+            name="content",
+            field=chat.fields.CompressedTextField(),
+        ),
+    ]
@@ -1,11 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
+from .fields import CompressedTextField
 
 class Chat(models.Model):
     """Chat model"""
     supabase_id = models.CharField(max_length=36, unique=True, null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
+    # Rolling summary of turns up to and including message id memory_watermark
+    memory_summary = models.TextField(blank=True, default='')
+    memory_watermark = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -25,7 +29,8 @@ class Message(models.Model):
     supabase_id = models.CharField(max_length=36, unique=True, null=True, blank=True)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
-    content = models.TextField()
+    content = CompressedTextField()  # zlib-compressed when long
+    # References to the chunks cited (chat.citations), not their text
     sources = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -0,0 +1,85 @@
+import re
+from django.conf import settings
+
+_WORDS = re.compile(r"[a-z']+")
+
+GREETING_WORDS = {'hi', 'hello', 'hey', 'hiya', 'yo', 'greetings', 'morning', 'afternoon', 'evening'}
+THANKS_WORDS = {'thanks', 'thank', 'thx', 'ty', 'cheers', 'appreciate', 'appreciated'}
+# Words that may accompany a greeting or thanks without making it a question
+SMALLTALK_WORDS = GREETING_WORDS | THANKS_WORDS | {
+    'good', 'there', 'you', 'so', 'much', 'a', 'lot', 'very', 'ok', 'okay', 'cool', 'great', 'nice',
+    'awesome', 'perfect', 'got', 'it', 'bye', 'goodbye', 'see', 'ya', 'all', 'again', 'that', 'helps',
+    'helped', 'sounds', 'fine', 'wonderful', 'the', 'help', 'for', 'i', 'lol',
+}
+ACK_WORDS = {'ok', 'okay', 'cool', 'great', 'nice', 'awesome', 'perfect', 'bye', 'goodbye', 'got'}
+SUMMARY_PATTERN = re.compile(
+    r'\b(summari[sz]e|summary|overview|outline|key (points|takeaways)|main (points|topics|ideas)'
+    r'|list (all|every)|compare|comparison|differences?|everything)\b'
+)
+LOOKUP_PATTERN = re.compile(
+    r"^(what|who|when|where|which|whose|how (many|much|long|old)|is|are|was|were|does|do|did|can|has|have)\b"
+)
+
+
+class Route:
+    """How to answer one message: retrieve or not, how many chunks, and the
+    generation budget"""
+
+    def __init__(self, intent, use_rag, top_k, max_tokens):
+        self.intent = intent
+        self.use_rag = use_rag
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+
+    def __repr__(self):
+        return f'Route({self.intent}, rag={self.use_rag}, top_k={self.top_k}, max_tokens={self.max_tokens})'
+
+
+class QueryRouter:
+    """Keyword classifier that sizes the work for a message.
+
+    Greetings, thanks and acknowledgements skip retrieval and get a short
+    budget; short factual questions get the usual top_k and a medium
+    budget; requests to summarise, list or compare get more chunks and a
+    long budget. Anything else keeps the defaults. Rules only, so routing
+    costs microseconds and never waits on the embedding service.
+    """
+
+    LOOKUP_MAX_WORDS = 14
+    SMALLTALK_MAX_WORDS = 8
+
+    def __init__(self):
+        self.enabled = settings.QUERY_ROUTING_ENABLED
+        self.max_tokens = settings.LLM_MAX_TOKENS
+        budgets = settings.QUERY_ROUTE_MAX_TOKENS
+        self.routes = {
+            'greeting': (False, 0, budgets['greeting']),
+            'thanks': (False, 0, budgets['thanks']),
+            'lookup': (True, 3, budgets['lookup']),
+            'summary': (True, 6, budgets['summary']),
+            'default': (True, 3, self.max_tokens),
+        }
+
+    def classify(self, message):
+        text = message.casefold().strip()
+        words = _WORDS.findall(text)
+        if not words:
+            return 'default'
+        if len(words) <= self.SMALLTALK_MAX_WORDS and all(word in SMALLTALK_WORDS for word in words):
+            if any(word in THANKS_WORDS for word in words):
+                return 'thanks'
+            if any(word in GREETING_WORDS or word in ACK_WORDS for word in words):
+                return 'greeting'
+        if SUMMARY_PATTERN.search(text):
+            return 'summary'
+        if len(words) <= self.LOOKUP_MAX_WORDS and LOOKUP_PATTERN.match(text):
+            return 'lookup'
+        return 'default'
+
+    def route(self, message, use_rag=True):
+        """Route for the message; use_rag=False (the user's choice) is always kept"""
+        if not self.enabled:
+            return Route('default', use_rag, 3, self.max_tokens)
+        intent = self.classify(message)
+        rag, top_k, max_tokens = self.routes[intent]
+        return Route(intent, rag and use_rag, top_k, max_tokens)
@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from . import citations
 from .models import Chat, Message
 from .services import ConversationService
+from .routing import QueryRouter
 from accounts.models import UserProfile
-from documents.models import Document, DocumentChunk
+from documents.services import DeletionService
+from services.cache_service import ResponseCache, user_scope
+from services.scopes import RetrievalScope, ScopeError
+from services import analytics, metrics, prefetch
+from services.admission import Overloaded, admission
+from services.throttling import ChatCreateThrottle, LLMThrottle, PrefetchThrottle, client_ident, too_many_requests
 import json
+import time
 from django.http import JsonResponse
 
 def ensure_user_profile(user):
@@ -27,26 +39,54 @@ def get_guest_user():
     guest, _ = User.objects.get_or_create(username='guest_user', defaults={'password': '!', 'email': 'guest@example.com'})
     return guest
 
+_guest_user_id = None
+
+def guest_user_id():
+    """Primary key of the shared guest account, looked up once per process"""
+    global _guest_user_id
+    if _guest_user_id is None:
+        _guest_user_id = get_guest_user().pk
+    return _guest_user_id
+
+def guest_chat(chat_id):
+    """The guest chat with this id, or None: one query on the unique chat id"""
+    return Chat.objects.filter(supabase_id=chat_id, user_id=guest_user_id()).first()
+
+def bind_guest_chat(request, chat_id):
+    """Make chat_id the session's guest chat; the session is only saved if this changes it"""
+    if request.session.get('guest_chat_id') != chat_id:
+        request.session['guest_chat_id'] = chat_id
+
 def get_or_create_guest_chat(request):
     """Create or fetch the session-bound guest chat."""
     chat_id = request.session.get('guest_chat_id')
-    if chat_id:
-        try:
-            return Chat.objects.get(supabase_id=chat_id)
-        except Chat.DoesNotExist:
-            pass
+    chat = guest_chat(chat_id) if chat_id else None
+    if chat is not None:
+        return chat
     # create new
     import uuid
     chat_id = str(uuid.uuid4())
-    chat = Chat.objects.create(supabase_id=chat_id, user=get_guest_user(), title='Guest Chat')
-    request.session['guest_chat_id'] = chat_id
+    chat = Chat.objects.create(supabase_id=chat_id, user_id=guest_user_id(), title='Guest Chat')
+    bind_guest_chat(request, chat_id)
+    return chat
+
+def resolve_guest_chat(request, chat_id):
+    """Return the guest chat for chat_id, rebinding the session to it; None if not a guest chat"""
+    # Any guest chat may be used (e.g. one created in another tab); the
+    # session follows the last one used
+    chat = guest_chat(chat_id)
+    if chat is not None:
+        bind_guest_chat(request, chat_id)
     return chat
 
 def dashboard_view(request):
     """Main chat dashboard"""
     if request.user.is_authenticated:
         ensure_user_profile(request.user)
-        chats = Chat.objects.filter(user=request.user)
+        chats = ResponseCache().get_or_build(
+            'dashboard_chats', [user_scope(request.user.id)],
+            lambda: list(Chat.objects.filter(user=request.user).values('supabase_id', 'title'))
+        )
     else:
         # guest view: expose single guest chat ID
         chat = get_or_create_guest_chat(request)
@@ -73,20 +113,29 @@ def chat_detail_view(request, chat_id):
         'messages': messages
     })
 
+def messages_etag(chat):
+    """ETag of a chat's message list, without loading it: messages are only
+    ever appended, or deleted all together"""
+    stats = Message.objects.filter(chat=chat).aggregate(last=Max('id'), count=Count('id'))
+    return f'"m{chat.pk}-{stats["last"] or 0}-{stats["count"]}"'
+
 # API Views
+@cache_control(private=True, no_cache=True)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chats(request):
     """Get user's chats"""
-    chats = Chat.objects.filter(user=request.user)
-    return Response([{
-        'id': chat.supabase_id,
-        'title': chat.title,
-        'created_at': chat.created_at
-    } for chat in chats])
+    def build():
+        return [{
+            'id': chat.supabase_id,
+            'title': chat.title,
+            'created_at': chat.created_at
+        } for chat in Chat.objects.filter(user=request.user)]
+    return Response(ResponseCache().get_or_build('get_chats', [user_scope(request.user.id)], build))
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([ChatCreateThrottle])
 def create_chat(request):
     """Create new chat"""
     print(f"Create chat request from user: {request.user}")
@@ -98,9 +147,9 @@ def create_chat(request):
             print("Ensuring user profile...")
             user_profile = ensure_user_profile(request.user)
             print(f"User profile: {user_profile}")
-            owner = request.user
+            owner_id = request.user.pk
         else:
-            owner = get_guest_user()
+            owner_id = guest_user_id()
         # Create a simple chat ID
         import uuid
         chat_id = str(uuid.uuid4())
@@ -110,10 +159,11 @@ def create_chat(request):
         print("Creating chat in database...")
         chat = Chat.objects.create(
             supabase_id=chat_id,
-            user=owner,
+            user_id=owner_id,
             title=title
         )
         print(f"Chat created successfully: {chat.id}")
+        ResponseCache().bump(user_scope(owner_id))
         
         return Response({
             'id': chat.supabase_id,
@@ -128,6 +178,7 @@ def create_chat(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LLMThrottle])
 def send_message(request):
     """Send message and get response"""
     chat_id = request.data.get('chat_id')
@@ -137,79 +188,157 @@ def send_message(request):
     if not chat_id or not message:
         return Response({'error': 'chat_id and message are required'}, status=400)
     
+    started = time.perf_counter()
     try:
-        if request.user.is_authenticated:
-            chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
-        else:
-            # Guest: prefer session-bound chat, but if a valid guest chat_id was
-            # created previously (e.g., in another tab) bind the session to it.
-            guest_chat = get_or_create_guest_chat(request)
-            if guest_chat.supabase_id != chat_id:
-                try:
-                    candidate = Chat.objects.get(supabase_id=chat_id, user=get_guest_user())
-                    # Rebind session to this guest chat
-                    request.session['guest_chat_id'] = candidate.supabase_id
-                    chat = candidate
-                except Chat.DoesNotExist:
-                    return Response({'error': 'Invalid chat for guest'}, status=403)
+        with metrics.stage('chat_lookup'):
+            if request.user.is_authenticated:
+                chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
             else:
-                chat = guest_chat
+                chat = resolve_guest_chat(request, chat_id)
+                if chat is None:
+                    return Response({'error': 'Invalid chat for guest'}, status=403)
+        try:
+            scope = RetrievalScope.for_request(request.data, request.user, chat)
+        except ScopeError as e:
+            return Response({'error': str(e)}, status=e.status)
+        # A draft of this message still waiting to be prefetched is moot now
+        prefetch.cancel(client_ident(request))
         
-        # Save user message to database
-        Message.objects.create(
-            chat=chat,
-            role='user',
-            content=message,
-            sources=[]
-        )
+        # Wait for an LLM slot before recording anything, so a rejected
+        # request leaves no unanswered message behind
+        with admission.slot(client_ident(request)):
+            # Save user message to database
+            with metrics.stage('db_write'):
+                question = Message.objects.create(
+                    chat=chat,
+                    role='user',
+                    content=message,
+                    sources=[]
+                )
+            
+            # Generate AI response with conversation context
+            with metrics.stage('service_init'):
+                conversation_service = ConversationService()
+            response, sources = conversation_service.generate_response_with_context(
+                message, chat, use_rag, scope, message_id=question.pk
+            )
         
-        # Generate AI response with conversation context
-        conversation_service = ConversationService()
-        response, sources = conversation_service.generate_response_with_context(
-            message, chat_id, use_rag
-        )
+        # Save assistant response to database, citing chunks rather than copying them
+        with metrics.stage('db_write'):
+            reply = Message.objects.create(
+                chat=chat,
+                role='assistant',
+                content=response,
+                sources=citations.references(sources)
+            )
         
-        # Save assistant response to database
-        Message.objects.create(
-            chat=chat,
-            role='assistant',
-            content=response,
-            sources=sources
+        # Fold turns that left the recent window into the chat summary
+        conversation_service.memory.schedule_update(chat.pk)
+        analytics.record_interaction(
+            message, response, sources, time.perf_counter() - started, 'send_message',
+            chat_id=chat_id, use_rag=use_rag, stage_timings=metrics.current(), notes=metrics.notes(),
         )
         
         return Response({
             'response': response,
-            'sources': sources
+            'message_id': reply.pk,
+            'sources': reply.sources
         })
+    except Overloaded as e:
+        return too_many_requests(e.retry_after, str(e))
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@throttle_classes([PrefetchThrottle])
+def prefetch_retrieval(request):
+    """Warm the retrieval caches with a (debounced) draft of the next message.
+
+    Takes the same chat_id / scope / document_id as send_message plus
+    'draft'; returns 202 at once with whether the draft was queued, replaced
+    the client's waiting one, or was dropped. A short or empty draft, or one
+    that would not be retrieved for (small talk), cancels the waiting one.
+    """
+    chat_id = request.data.get('chat_id')
+    draft = (request.data.get('draft') or '').strip()
+    if not chat_id:
+        return Response({'error': 'chat_id is required'}, status=400)
+    prefetcher = prefetch.get_prefetcher()
+    if prefetcher is None:
+        return Response({'status': 'disabled'}, status=202)
+    ident = client_ident(request)
+    if len(draft) < settings.PREFETCH_MIN_CHARS:
+        prefetcher.cancel(ident)
+        return Response({'status': 'cancelled'}, status=202)
+    
+    if request.user.is_authenticated:
+        chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
+    else:
+        chat = resolve_guest_chat(request, chat_id)
+        if chat is None:
+            return Response({'error': 'Invalid chat for guest'}, status=403)
+    try:
+        scope = RetrievalScope.for_request(request.data, request.user, chat)
+    except ScopeError as e:
+        return Response({'error': str(e)}, status=e.status)
+    # Retrieve what send_message will: nothing for small talk, else the routed top_k
+    route = QueryRouter().route(draft)
+    if not route.use_rag:
+        prefetcher.cancel(ident)
+        return Response({'status': 'skipped'}, status=202)
+    return Response({'status': prefetcher.submit(ident, scope, draft, route.top_k)}, status=202)
+
+@cache_control(private=True, no_cache=True)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_messages(request, chat_id):
     """Get messages for a chat"""
     try:
-        if request.user.is_authenticated:
-            chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
-        else:
-            chat = get_or_create_guest_chat(request)
-            if chat.supabase_id != chat_id:
-                try:
-                    candidate = Chat.objects.get(supabase_id=chat_id, user=get_guest_user())
-                    request.session['guest_chat_id'] = candidate.supabase_id
-                    chat = candidate
-                except Chat.DoesNotExist:
+        with metrics.stage('chat_lookup'):
+            if request.user.is_authenticated:
+                chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
+            else:
+                chat = resolve_guest_chat(request, chat_id)
+                if chat is None:
                     return Response({'error': 'Invalid chat for guest'}, status=403)
-        messages = Message.objects.filter(chat=chat).order_by('created_at')
-        return Response([{
-            'role': message.role,
-            'content': message.content,
-            'sources': message.sources or [],
-            'created_at': message.created_at
-        } for message in messages])
+        with metrics.stage('db_read'):
+            # A client holding the current list gets a 304 before it is loaded
+            tag = messages_etag(chat)
+            not_modified = get_conditional_response(request, etag=tag)
+            if not_modified is not None:
+                return not_modified
+            messages = Message.objects.filter(chat=chat).order_by('created_at')
+            payload = [{
+                'id': message.pk,
+                'role': message.role,
+                'content': message.content,
+                'sources': message.sources or [],
+                'created_at': message.created_at
+            } for message in messages]
+        response = Response(payload)
+        response['ETag'] = tag
+        return response
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_message_sources(request, chat_id, message_id):
+    """Sources of one message with their chunk texts, for expanding citations
+    (messages store and return only chunk references)"""
+    if request.user.is_authenticated:
+        chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
+    else:
+        chat = resolve_guest_chat(request, chat_id)
+        if chat is None:
+            return Response({'error': 'Invalid chat for guest'}, status=403)
+    sources = get_object_or_404(
+        Message.objects.values_list('sources', flat=True), pk=message_id, chat=chat
+    )
+    with metrics.stage('hydrate'):
+        return Response(citations.resolve(sources))
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_chat(request, chat_id):
@@ -219,37 +348,8 @@ def delete_chat(request, chat_id):
         chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
         print(f"Found chat: {chat.title}")
         
-        # Delete associated documents and chunks
-        documents = Document.objects.filter(chat=chat)
-        print(f"Found {documents.count()} documents to delete")
-        
-        for document in documents:
-            # Delete document chunks
-            chunks = DocumentChunk.objects.filter(document=document)
-            print(f"Deleting {chunks.count()} chunks for document {document.id}")
-            chunks.delete()
-            
-            # Delete document file if it exists
-            if document.file_path and document.file_path.name:
-                try:
-                    document.file_path.delete(save=False)
-                    print(f"Deleted file: {document.file_path.name}")
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-        
-        # Delete documents
-        documents.delete()
-        print("Deleted all documents")
-        
-        # Delete messages
-        messages = Message.objects.filter(chat=chat)
-        print(f"Deleting {messages.count()} messages")
-        messages.delete()
-        
-        # Delete chat
-        chat_title = chat.title
-        chat.delete()
-        print(f"Deleted chat: {chat_title}")
+        # Single transaction; files and vectors are swept in the background
+        DeletionService().delete_chat(chat)
         
         return Response({'success': True, 'message': 'Chat deleted successfully'})
         
@@ -272,6 +372,7 @@ def rename_chat(request, chat_id):
         
         chat.title = new_title
         chat.save()
+        ResponseCache().bump(user_scope(request.user.id))
         
         return Response({
             'success': True, 
@@ -283,3 +384,29 @@ def rename_chat(request, chat_id):
         print(f"Error renaming chat: {e}")
         return Response({'error': str(e)}, status=500)
 
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Hit rates of the cached read endpoints"""
+    return Response(ResponseCache().stats(['get_chats', 'dashboard_chats', 'get_chat_documents']))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def embedding_stats(request):
+    """Query embedding batching, query-embedding / retrieval / chunk cache hit rates and
+    prefetch counters, for this worker process"""
+    from services.embeddings import get_query_batcher, get_query_cache
+    from services.retrieval_cache import get_cache, get_chunk_cache
+    prefetcher = prefetch.get_prefetcher()
+    batcher = get_query_batcher()
+    cache = get_query_cache()
+    retrieval_cache = get_cache()
+    chunk_cache = get_chunk_cache()
+    return Response({
+        'query_batching': batcher.stats() if batcher else None,
+        'query_cache': cache.stats() if cache else None,
+        'retrieval_cache': retrieval_cache.stats() if retrieval_cache else None,
+        'chunk_cache': chunk_cache.stats() if chunk_cache else None,
+        'prefetch': prefetcher.stats() if prefetcher else None,
+    })
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0002_document_pages"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentContent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(blank=True, max_length=64, null=True)),
+                ("file", models.FileField(blank=True, upload_to="documents/")),
+                ("size", models.BigIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Processing"),
+                            ("ready", "Ready"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("chunk_count", models.IntegerField(default=0)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("vector_prefix", models.CharField(blank=True, max_length=40)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="document_contents",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("sha256__isnull", False)),
+                        fields=("owner", "sha256"),
+                        name="unique_content_per_owner",
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="documents",
+                to="documents.documentcontent",
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="source",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chunks",
+                to="documents.documentcontent",
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentpage",
+            name="source",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pages",
+                to="documents.documentcontent",
+            ),
+        ),
+    ]
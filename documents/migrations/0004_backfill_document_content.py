@@ -0,0 +1,101 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_content(apps, schema_editor):
+    """Give every existing document its own (unhashed) content row.
+
+    Files aren't re-read here, so older uploads are never deduplicated; their
+    vectors keep the "<document_id>_<chunk_id>" ids they were stored under.
+    """
+    Document = apps.get_model("documents", "Document")
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    DocumentPage = apps.get_model("documents", "DocumentPage")
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+
+    chunk_counts = dict(
+        DocumentChunk.objects.values("document_id")
+        .annotate(last=Max("chunk_id"))
+        .values_list("document_id", "last")
+    )
+    for document in Document.objects.filter(content__isnull=True).select_related("chat"):
+        last = chunk_counts.get(document.id)
+        content = DocumentContent.objects.create(
+            owner_id=document.chat.user_id,
+            sha256=None,
+            file=document.file_path.name,
+            status="ready",
+            chunk_count=last + 1 if last is not None else 0,
+            ref_count=1,
+            vector_prefix=str(document.id),
+        )
+        Document.objects.filter(pk=document.pk).update(content=content)
+        DocumentChunk.objects.filter(document_id=document.id).update(source=content)
+        DocumentPage.objects.filter(document_id=document.id).update(source=content)
+
+
+def restore_documents(apps, schema_editor):
+    """Reverse of backfill_content: hand chunks and pages back to their
+    document and drop the content rows.
+
+    A content shared by several documents (a deduplicated upload) has its
+    chunks and pages copied to each of the others; an unreferenced one is
+    dropped with its chunks and pages.
+    """
+    Document = apps.get_model("documents", "Document")
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    DocumentPage = apps.get_model("documents", "DocumentPage")
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+
+    for content_id in DocumentContent.objects.values_list("id", flat=True).iterator():
+        document_ids = list(
+            Document.objects.filter(content_id=content_id).order_by("pk").values_list("pk", flat=True)
+        )
+        if not document_ids:
+            continue
+        for model in (DocumentChunk, DocumentPage):
+            rows = list(model.objects.filter(source_id=content_id))
+            for document_id in document_ids[1:]:
+                for row in rows:
+                    row.pk = None
+                    row.document_id = document_id
+                    row.source_id = None
+                model.objects.bulk_create(rows, batch_size=500)
+            model.objects.filter(source_id=content_id).update(document_id=document_ids[0], source=None)
+    Document.objects.update(content=None)
+    DocumentContent.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0003_document_content"),
+    ]
+
+    operations = [
+        # Nullable while chunks and pages move between their document and
+        # content FKs, so 0005 can be reversed on a table with rows (0005
+        # then drops the column)
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="document",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chunks",
+                to="documents.document",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentpage",
+            name="document",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pages",
+                to="documents.document",
+            ),
+        ),
+        migrations.RunPython(backfill_content, restore_documents),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0004_backfill_document_content"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="documentchunk",
+            unique_together={("source", "chunk_id")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="documentpage",
+            unique_together={("source", "page_number")},
+        ),
+        migrations.RemoveField(
+            model_name="documentchunk",
+            name="document",
+        ),
+        migrations.RemoveField(
+            model_name="documentpage",
+            name="document",
+        ),
+        migrations.AlterField(
+            model_name="document",
+            name="content",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="documents",
+                to="documents.documentcontent",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="source",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chunks",
+                to="documents.documentcontent",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentpage",
+            name="source",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pages",
+                to="documents.documentcontent",
+            ),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def chunk_fields(vector):
+    """Frozen copy of services.vectors.chunk_fields as of this migration:
+    int8 codes with a per-vector scale (max |x| maps to 127), or float16 /
+    float32 values with scale 1, plus a float32 copy for reranking"""
+    import numpy as np
+
+    dtype = getattr(settings, "EMBEDDING_STORAGE_DTYPE", "int8")
+    keep_full = getattr(settings, "EMBEDDING_KEEP_FULL_PRECISION", True) and dtype != "float32"
+    values = np.asarray(vector, dtype=np.float32)
+    scale = 1.0
+    if dtype == "int8":
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        codes = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+    else:
+        codes = values.astype({"float16": np.float16, "float32": np.float32}[dtype])
+    return {
+        "vector": codes.tobytes(),
+        "vector_dtype": dtype,
+        "vector_scale": scale,
+        "vector_full": values.tobytes() if keep_full else b"",
+    }
+
+
+def encode_embeddings(apps, schema_editor):
+    """Re-encode the JSON float lists as compact codes plus a float32 copy"""
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    fields = ["vector", "vector_dtype", "vector_scale", "vector_full"]
+    ids = list(DocumentChunk.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), 500):
+        batch = list(
+            DocumentChunk.objects.filter(id__in=ids[start : start + 500]).only(
+                "id", "embedding"
+            )
+        )
+        for chunk in batch:
+            for name, value in chunk_fields(chunk.embedding or []).items():
+                setattr(chunk, name, value)
+        DocumentChunk.objects.bulk_update(batch, fields)
+
+
+def decode_embeddings(apps, schema_editor):
+    """Reverse of encode_embeddings: the float32 copy, else the decoded codes,
+    back into the JSON list"""
+    import numpy as np
+
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    dtypes = {"int8": np.int8, "float16": np.float16, "float32": np.float32}
+    ids = list(DocumentChunk.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), 500):
+        batch = list(
+            DocumentChunk.objects.filter(id__in=ids[start : start + 500]).only(
+                "id", "vector", "vector_dtype", "vector_scale", "vector_full"
+            )
+        )
+        for chunk in batch:
+            if chunk.vector_full:
+                values = np.frombuffer(bytes(chunk.vector_full), dtype=np.float32)
+            elif chunk.vector:
+                values = np.frombuffer(bytes(chunk.vector), dtype=dtypes[chunk.vector_dtype]).astype(np.float32)
+                if chunk.vector_dtype == "int8":
+                    values = values * np.float32(chunk.vector_scale)
+            else:
+                values = np.zeros(0, dtype=np.float32)
+            chunk.embedding = [float(value) for value in values]
+        DocumentChunk.objects.bulk_update(batch, ["embedding"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0006_upload_session"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="vector",
+            field=models.BinaryField(blank=True, default=b""),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="vector_dtype",
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="vector_full",
+            field=models.BinaryField(blank=True, default=b""),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="vector_scale",
+            field=models.FloatField(default=1.0),
+        ),
+        # The default lets a reverse migration re-add the column to a table
+        # with rows; decode_embeddings then fills it in
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="embedding",
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(encode_embeddings, decode_embeddings),
+        migrations.RemoveField(
+            model_name="documentchunk",
+            name="embedding",
+        ),
+    ]
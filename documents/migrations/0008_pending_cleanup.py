@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0007_quantized_chunk_vectors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingCleanup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_id", models.BigIntegerField()),
+                ("file", models.CharField(blank=True, max_length=255)),
+                ("vector_prefix", models.CharField(max_length=40)),
+                ("chunk_count", models.IntegerField(default=0)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,12 +1,57 @@
+import os
+import uuid
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from chat.models import Chat
 
+class DocumentContent(models.Model):
+    """A stored PDF and its derived data (pages, chunks, vectors), shared by
+    every Document of the same owner with identical bytes"""
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Processing'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='document_contents')
+    sha256 = models.CharField(max_length=64, null=True, blank=True)  # null for documents indexed before hashing
+    file = models.FileField(upload_to='documents/', blank=True)
+    size = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    chunk_count = models.IntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Vector ids are "<prefix>_<chunk_id>"; blank means "c<pk>". Older
+    # documents keep their original "<document_id>" prefix.
+    vector_prefix = models.CharField(max_length=40, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'sha256'],
+                condition=models.Q(sha256__isnull=False),
+                name='unique_content_per_owner',
+            ),
+        ]
+    
+    def vector_id(self, chunk_id):
+        return f"{self.vector_prefix or 'c%d' % self.pk}_{chunk_id}"
+    
+    def __str__(self):
+        return f"{self.file.name or self.pk} ({self.ref_count} refs)"
+
 class Document(models.Model):
     """Document model for PDF files"""
     supabase_id = models.CharField(max_length=36, unique=True, null=True, blank=True)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='documents')
+    content = models.ForeignKey(DocumentContent, on_delete=models.PROTECT, related_name='documents')
     filename = models.CharField(max_length=255)
-    file_path = models.FileField(upload_to='documents/')
+    file_path = models.FileField(upload_to='documents/')  # same blob as content.file
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -14,16 +59,83 @@ class Document(models.Model):
 
 class DocumentChunk(models.Model):
     """Document chunk model for vector storage"""
-    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    source = models.ForeignKey(DocumentContent, on_delete=models.CASCADE, related_name='chunks')
     chunk_id = models.IntegerField()
     page_number = models.IntegerField()
     content = models.TextField()
-    embedding = models.JSONField()  # Store vector embeddings
+    # Embedding as compact codes (see services.vectors), plus a float32 copy
+    # for reranking unless the codes already are float32
+    vector = models.BinaryField(blank=True, default=b'')
+    vector_dtype = models.CharField(max_length=8, blank=True)
+    vector_scale = models.FloatField(default=1.0)
+    vector_full = models.BinaryField(blank=True, default=b'')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ['document', 'chunk_id']
+        unique_together = ['source', 'chunk_id']
+    
+    def __str__(self):
+        return f"{self.source} - Chunk {self.chunk_id}"
+
+class DocumentPage(models.Model):
+    """Extracted text of one PDF page, stored once (no chunk overlap) for the viewer"""
+    source = models.ForeignKey(DocumentContent, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.IntegerField()  # 0-based, as in chunk and source metadata
+    content = models.TextField()
+    
+    class Meta:
+        unique_together = ['source', 'page_number']
+        ordering = ['page_number']
     
     def __str__(self):
-        return f"{self.document.filename} - Chunk {self.chunk_id}"
+        return f"{self.source} - Page {self.page_number}"
+
+class UploadSession(models.Model):
+    """A resumable upload: parts arrive as byte ranges and are kept on disk
+    until the client completes the upload"""
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def part_dir(self):
+        return os.path.join(settings.UPLOAD_SESSION_DIR, str(self.id))
+    
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
+class PendingCleanup(models.Model):
+    """The stored file, Pinecone vectors and local segment of a deleted
+    content, recorded in the transaction that deletes it and removed once
+    the sweeper has deleted them"""
+    content_id = models.BigIntegerField()  # the deleted DocumentContent
+    file = models.CharField(max_length=255, blank=True)
+    # Vector ids are "<vector_prefix>_<chunk_id>" for chunk_id 0..chunk_count-1
+    vector_prefix = models.CharField(max_length=40)
+    chunk_count = models.IntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.file or self.vector_prefix} ({self.attempts} attempts)"
+
 
+@receiver(post_delete, sender=Document)
+def release_document_content(sender, instance, **kwargs):
+    """Drop the deleted document's content reference, whether it went through
+    DeletionService or by cascade from its chat or user"""
+    from .services import DeletionService
+    DeletionService().release_content(instance.content_id)
@@ -0,0 +1,470 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from chat.models import Chat, Message
+from services.background import BackgroundWorker
+from services.cache_service import ResponseCache, chat_scope, user_scope
+from services.scopes import RetrievalScope, scopes_changed
+from .models import Document, DocumentChunk, DocumentContent, DocumentPage, PendingCleanup, UploadSession
+
+
+class CleanupSweeper:
+    """Removes stored files, Pinecone vectors and segments of deleted contents
+    in batches, off the request path.
+
+    The work is kept as PendingCleanup rows, written in the deleting
+    transaction; a row goes only once everything it lists is deleted, so a
+    worker recycled or crashing mid-sweep, or a failed Pinecone call, leaves
+    it for the next sweep (the next delete, or the next worker to start).
+    """
+
+    VECTOR_BATCH_SIZE = 1000  # Pinecone delete-by-id limit per call
+    SWEEP_BATCH_SIZE = 100  # PendingCleanup rows per sweep
+
+    def __init__(self):
+        self.worker = BackgroundWorker('cleanup-sweeper')
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def schedule(self):
+        """Sweep the pending cleanups soon; also run when a worker starts, for
+        those left behind by another process"""
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.worker.submit(self.sweep)
+
+    def sweep(self):
+        """Delete what the oldest pending cleanups list; drop the rows that succeeded"""
+        with self._lock:
+            self._scheduled = False
+        pending = list(PendingCleanup.objects.order_by('pk')[:self.SWEEP_BATCH_SIZE])
+        if not pending:
+            return
+        failed = set()
+
+        for task in pending:
+            if not task.file:
+                continue
+            try:
+                default_storage.delete(task.file)
+            except Exception as e:
+                print(f"Sweeper: error deleting file {task.file}: {e}")
+                failed.add(task.pk)
+
+        try:
+            from services.segments import get_store
+            get_store().discard([task.content_id for task in pending])
+        except Exception as e:
+            print(f"Sweeper: error discarding segments: {e}")
+            failed.update(task.pk for task in pending)
+
+        failed |= self._delete_vectors([task for task in pending if task.chunk_count])
+
+        done = [task.pk for task in pending if task.pk not in failed]
+        PendingCleanup.objects.filter(pk__in=done).delete()
+        if failed:
+            PendingCleanup.objects.filter(pk__in=failed).update(attempts=F('attempts') + 1)
+        print(f"Sweeper: cleaned up {len(done)} deleted contents, {len(failed)} left for a retry")
+        if done and len(pending) == self.SWEEP_BATCH_SIZE:
+            self.schedule()
+
+    def _delete_vectors(self, tasks):
+        """Delete the tasks' vectors, several contents per call; return the
+        ids of the tasks some of whose vectors may remain"""
+        from services.pinecone_service import PineconeService
+        pinecone_service = PineconeService()
+        if not pinecone_service.index:
+            return set()
+        failed = set()
+        batch, owners = [], set()
+        deleted = 0
+
+        def flush():
+            nonlocal deleted
+            if pinecone_service.delete_vectors(batch):
+                deleted += len(batch)
+            else:
+                failed.update(owners)
+
+        for task in tasks:
+            for i in range(task.chunk_count):
+                batch.append(f"{task.vector_prefix}_{i}")
+                owners.add(task.pk)
+                if len(batch) >= self.VECTOR_BATCH_SIZE:
+                    flush()
+                    batch, owners = [], set()
+        if batch:
+            flush()
+        print(f"Sweeper: deleted {deleted} vectors of {len(tasks)} contents")
+        return failed
+
+
+sweeper = CleanupSweeper()
+
+
+def spool_chunks(chunks):
+    """Copy byte chunks to a temp file, hashing them on the way; return (sha256, path, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+        try:
+            for chunk in chunks:
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except Exception:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return digest.hexdigest(), tmp.name, size
+
+
+def spool_upload(uploaded_file):
+    """Spool a multipart upload; see spool_chunks()"""
+    return spool_chunks(uploaded_file.chunks())
+
+
+class UploadRejected(Exception):
+    """A part or completion the upload session can't accept; carries the HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSessionService:
+    """Resumable uploads: byte-range parts go straight to disk, one file per
+    part, and are assembled when the client completes the upload.
+
+    A part is written under a temporary name while it is checksummed and only
+    renamed into place once it verifies, so a dropped connection never leaves
+    a partial part behind. A client resumes by asking which bytes arrived and
+    sending the rest; re-sent or overlapping ranges are harmless.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+    SWEEP_INTERVAL = 600
+    _last_sweep = 0.0
+
+    def start(self, user, chat, filename, size):
+        self.sweep_expired()
+        session = UploadSession.objects.create(user=user, chat=chat, filename=filename, size=size)
+        os.makedirs(session.part_dir, exist_ok=True)
+        return session
+
+    def parts(self, session):
+        """(offset, length) of the verified parts on disk, in offset order"""
+        try:
+            names = os.listdir(session.part_dir)
+        except FileNotFoundError:
+            return []
+        parts = []
+        for name in names:
+            if name.endswith('.part'):
+                offset, length = name[:-len('.part')].split('-')
+                parts.append((int(offset), int(length)))
+        return sorted(parts)
+
+    def received(self, session, parts=None):
+        """Bytes received contiguously from the start of the file"""
+        cursor = 0
+        for offset, length in parts if parts is not None else self.parts(session):
+            if offset > cursor:
+                break
+            cursor = max(cursor, offset + length)
+        return cursor
+
+    def status(self, session):
+        parts = self.parts(session)
+        return {
+            'upload_id': str(session.id),
+            'filename': session.filename,
+            'size': session.size,
+            'status': session.status,
+            'received': self.received(session, parts),
+            'parts': [[offset, length] for offset, length in parts],
+            'part_size': settings.UPLOAD_PART_SIZE,
+        }
+
+    def write_part(self, session, offset, length, stream, checksum):
+        """Stream `length` bytes at `offset` from `stream` to disk and verify their SHA-256"""
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadRejected('Upload is already complete', 409)
+        if offset < 0 or length <= 0 or offset + length > session.size:
+            raise UploadRejected(f'Range {offset}+{length} is outside the {session.size}-byte upload', 416)
+        if length > settings.UPLOAD_MAX_PART_SIZE:
+            raise UploadRejected(f'Parts are limited to {settings.UPLOAD_MAX_PART_SIZE} bytes', 413)
+        if not checksum or len(checksum) != 64:
+            raise UploadRejected('X-Part-SHA256 header with the hex SHA-256 of the part is required')
+        
+        os.makedirs(session.part_dir, exist_ok=True)
+        name = os.path.join(session.part_dir, f'{offset}-{length}')
+        temp_name = f'{name}.{uuid.uuid4().hex}.tmp'
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with open(temp_name, 'wb') as f:
+                while written < length:
+                    block = stream.read(min(self.BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    digest.update(block)
+                    f.write(block)
+                    written += len(block)
+            if written != length:
+                raise UploadRejected(f'Part ended after {written} of {length} bytes')
+            if digest.hexdigest() != checksum.lower():
+                raise UploadRejected('Part checksum mismatch', 422)
+            os.replace(temp_name, name + '.part')
+        finally:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+    def _read_parts(self, session, parts):
+        """Yield the file's bytes in order, skipping any overlap between parts"""
+        cursor = 0
+        for offset, length in parts:
+            if offset + length <= cursor:
+                continue
+            with open(os.path.join(session.part_dir, f'{offset}-{length}.part'), 'rb') as f:
+                f.seek(cursor - offset)
+                while True:
+                    block = f.read(self.BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+            cursor = offset + length
+
+    def complete(self, session):
+        """Assemble the parts into a temp file; return (sha256, path, size) for ingestion.
+
+        The session is claimed first so a concurrent completion gets a 409,
+        and reopened (parts kept) if assembling fails so the client can retry.
+        """
+        parts = self.parts(session)
+        received = self.received(session, parts)
+        if received < session.size:
+            raise UploadRejected(f'Upload is missing bytes from offset {received}', 409)
+        if not UploadSession.objects.filter(pk=session.pk, status=UploadSession.STATUS_OPEN).update(
+            status=UploadSession.STATUS_COMPLETE
+        ):
+            raise UploadRejected('Upload is already complete', 409)
+        try:
+            spooled = spool_chunks(self._read_parts(session, parts))
+        except Exception:
+            UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_OPEN)
+            raise
+        session.status = UploadSession.STATUS_COMPLETE
+        shutil.rmtree(session.part_dir, ignore_errors=True)
+        return spooled
+
+    def abort(self, session):
+        shutil.rmtree(session.part_dir, ignore_errors=True)
+        session.delete()
+
+    def sweep_expired(self):
+        """Drop sessions (and stray part directories) idle for longer than UPLOAD_SESSION_TTL"""
+        now = time.time()
+        if now - UploadSessionService._last_sweep < self.SWEEP_INTERVAL:
+            return
+        UploadSessionService._last_sweep = now
+        cutoff = now - settings.UPLOAD_SESSION_TTL
+        expired = UploadSession.objects.filter(
+            updated_at__lt=timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+        )
+        count = expired.delete()[0]
+        # Part directories outlive rows deleted with their chat, so go by mtime
+        removed = 0
+        if os.path.isdir(settings.UPLOAD_SESSION_DIR):
+            for entry in os.scandir(settings.UPLOAD_SESSION_DIR):
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+        if count or removed:
+            print(f"Upload sweep: {count} expired sessions, {removed} part directories removed")
+
+
+class ContentStore:
+    """PDFs stored once per owner and content hash, shared by reference count"""
+
+    def acquire(self, owner, sha256, size):
+        """Return (content, created) for these bytes, taking one reference"""
+        # Write first (bump, else insert) so concurrent uploads of the same
+        # bytes serialise on the row lock or the unique constraint
+        lookup = DocumentContent.objects.filter(owner=owner, sha256=sha256)
+        if not lookup.update(ref_count=F('ref_count') + 1):
+            try:
+                with transaction.atomic():
+                    return DocumentContent.objects.create(
+                        owner=owner, sha256=sha256, size=size, ref_count=1
+                    ), True
+            except IntegrityError:
+                lookup.update(ref_count=F('ref_count') + 1)
+        return lookup.get(), False
+
+    def claim(self, content, created):
+        """Whether this upload should run the pipeline: new content, or a retry after failure"""
+        if created:
+            return True
+        return bool(
+            DocumentContent.objects.filter(pk=content.pk, status=DocumentContent.STATUS_FAILED)
+            .update(status=DocumentContent.STATUS_PENDING)
+        )
+
+    def save_file(self, content, filename, temp_path):
+        if content.file:
+            return  # kept from an earlier, failed attempt
+        with open(temp_path, 'rb') as f:
+            content.file.save(filename, File(f), save=False)
+        DocumentContent.objects.filter(pk=content.pk).update(file=content.file.name)
+
+    def scopes(self, content):
+        """Every retrieval scope the content is searched in: its owner's, and
+        the chats and documents referencing it"""
+        references = Document.objects.filter(content=content).values_list('pk', 'chat__supabase_id')
+        scopes = {RetrievalScope.user(content.owner_id)}
+        for document_id, chat_id in references:
+            scopes.update((RetrievalScope.document(document_id), RetrievalScope.chat(chat_id)))
+        return list(scopes)
+
+    def mark(self, content, status, chunk_count=None):
+        fields = {'status': status}
+        if chunk_count is not None:
+            fields['chunk_count'] = chunk_count
+        DocumentContent.objects.filter(pk=content.pk).update(**fields)
+
+
+class DeletionService:
+    """Set-based cascade deletes for chats and documents.
+
+    Documents only drop their reference to the shared content; the stored
+    file, pages, chunks and vectors go when the last reference does. The
+    reference is dropped by the Document post_delete receiver, so a document
+    deleted by cascade (its chat or user deleted elsewhere) releases it too.
+    """
+
+    def __init__(self, sweeper=sweeper):
+        self.sweeper = sweeper
+
+    def delete_chat(self, chat):
+        """Delete a chat with its documents, chunks and messages in one transaction"""
+        documents = Document.objects.filter(chat=chat)
+        with transaction.atomic():
+            deleted = documents.delete()[1].get(Document._meta.label, 0)
+            Message.objects.filter(chat=chat).delete()
+            Chat.objects.filter(pk=chat.pk).delete()
+            transaction.on_commit(lambda: ResponseCache().bump(user_scope(chat.user_id), chat_scope(chat.supabase_id)))
+            transaction.on_commit(lambda: self._scopes_changed(RetrievalScope.chat(chat.supabase_id)))
+        print(f"Deleted chat {chat.supabase_id} with {deleted} documents")
+
+    def delete_document(self, document):
+        """Delete a single document (and its content if unshared) in one transaction"""
+        with transaction.atomic():
+            Document.objects.filter(pk=document.pk).delete()
+            transaction.on_commit(lambda: ResponseCache().bump(chat_scope(document.chat.supabase_id)))
+            transaction.on_commit(lambda: self._scopes_changed(
+                RetrievalScope.chat(document.chat.supabase_id), RetrievalScope.document(document.pk)
+            ))
+
+    @staticmethod
+    def _scopes_changed(*scopes):
+        """Drop the deleted documents from the scopes' cached retrievals and packed segments"""
+        scopes_changed(scopes)
+
+    def release_content(self, content_id):
+        """Drop one reference to a content (its document was deleted). When it
+        was the last, delete the content's rows and record its file, vectors
+        and segment for the sweeper in the same transaction."""
+        DocumentContent.objects.filter(pk=content_id).update(ref_count=Greatest(F('ref_count') - 1, 0))
+        orphan = (
+            DocumentContent.objects.filter(pk=content_id, ref_count=0)
+            .values('owner_id', 'file', 'vector_prefix', 'chunk_count').first()
+        )
+        if orphan is None:
+            return
+        DocumentChunk.objects.filter(source_id=content_id).delete()
+        DocumentPage.objects.filter(source_id=content_id).delete()
+        DocumentContent.objects.filter(pk=content_id).delete()
+        PendingCleanup.objects.create(
+            content_id=content_id,
+            file=orphan['file'] or '',
+            vector_prefix=orphan['vector_prefix'] or 'c%d' % content_id,
+            chunk_count=orphan['chunk_count'],
+        )
+        transaction.on_commit(self.sweeper.schedule)
+        # Only an unreferenced content leaves its owner's scope
+        transaction.on_commit(lambda: self._scopes_changed(RetrievalScope.user(orphan['owner_id'])))
+
+
+def merge_overlapping(parts, max_overlap=400):
+    """Join consecutive chunks of one page, dropping the text they share"""
+    text = ''
+    for part in parts:
+        if not text:
+            text = part
+            continue
+        overlap = 0
+        for size in range(min(len(text), len(part), max_overlap), 0, -1):
+            if text.endswith(part[:size]):
+                overlap = size
+                break
+        text += part[overlap:] if overlap else '\n' + part
+    return text
+
+
+class PageService:
+    """Per-page document text for the viewer, served a window at a time"""
+
+    DEFAULT_PAGE_COUNT = 5
+    MAX_PAGE_COUNT = 50
+
+    def store_pages(self, content, pages):
+        """Save the text of each extracted page (loader Documents with a 'page' in metadata)"""
+        DocumentPage.objects.bulk_create([
+            DocumentPage(source=content, page_number=page.metadata.get('page', i), content=page.page_content)
+            for i, page in enumerate(pages)
+        ], batch_size=500, ignore_conflicts=True)
+
+    def ensure_pages(self, content):
+        """Rebuild pages from chunks for documents ingested before pages were stored"""
+        if DocumentPage.objects.filter(source=content).exists():
+            return
+        by_page = {}
+        for page_number, text in (
+            DocumentChunk.objects.filter(source=content)
+            .order_by('chunk_id')
+            .values_list('page_number', 'content')
+        ):
+            by_page.setdefault(page_number, []).append(text)
+        DocumentPage.objects.bulk_create([
+            DocumentPage(source=content, page_number=page_number, content=merge_overlapping(parts))
+            for page_number, parts in sorted(by_page.items())
+        ], batch_size=500, ignore_conflicts=True)
+        print(f"Pages: rebuilt {len(by_page)} pages from chunks for content {content.pk}")
+
+    def page_window(self, content, start=0, count=DEFAULT_PAGE_COUNT):
+        """Return (page_count, pages from `start`, next start or None)"""
+        self.ensure_pages(content)
+        pages = DocumentPage.objects.filter(source=content)
+        window = list(
+            pages.filter(page_number__gte=start)
+            .order_by('page_number')
+            .values('page_number', 'content')[:count + 1]
+        )
+        next_page = window.pop()['page_number'] if len(window) > count else None
+        return pages.count(), window, next_page
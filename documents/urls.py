@@ -4,6 +4,10 @@ from . import views
 app_name = 'documents'
 urlpatterns = [
     path('upload/<str:chat_id>/', views.upload_document, name='upload'),
+    # Resumable uploads: start, then PUT parts / GET progress, then complete
+    path('api/uploads/<str:chat_id>/start/', views.start_upload, name='start_upload'),
+    path('api/uploads/session/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+    path('api/uploads/session/<uuid:upload_id>/complete/', views.complete_upload, name='complete_upload'),
     path('api/chat/<str:chat_id>/documents/', views.get_chat_documents, name='get_documents'),
     path('api/view/<str:document_id>/', views.view_document, name='view_document'),
     path('api/delete/<str:document_id>/', views.delete_document, name='delete_document'),
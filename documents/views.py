@@ -1,21 +1,32 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_http_methods, require_POST
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import Document, DocumentChunk
+from .models import Document, DocumentChunk, DocumentContent, UploadSession
+from .services import (
+    ContentStore, DeletionService, PageService, UploadRejected, UploadSessionService, spool_upload
+)
+from services.cache_service import ResponseCache, chat_scope
+from services.scopes import scopes_changed
+from services import metrics
+from services.throttling import throttle_wait, too_many_requests
 from chat.models import Chat
 from services.pinecone_service import PineconeService
 from services.ai_service import AIService
-from langchain_community.document_loaders import PyMuPDFLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
 import os
+import re
 import tempfile
 import uuid
 
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
 @login_required
 def upload_document(request, chat_id):
     """Upload and process PDF document"""
@@ -24,6 +35,9 @@ def upload_document(request, chat_id):
         print(f"Upload request for chat: {chat_id}, user: {request.user}")
         
         if request.method == 'POST':
+            wait = throttle_wait(request, 'upload')
+            if wait:
+                return too_many_requests(wait, 'Upload limit reached, please try again later')
             uploaded_file = request.FILES.get('file')
             print(f"Uploaded file: {uploaded_file}")
             
@@ -33,37 +47,20 @@ def upload_document(request, chat_id):
             if not uploaded_file.name.lower().endswith('.pdf'):
                 return JsonResponse({'success': False, 'error': 'Please upload a PDF file'})
             
+            temp_path = None
             try:
-                print(f"Creating document record for: {uploaded_file.name}")
-                # Create document record
-                document = Document.objects.create(
-                    chat=chat,
-                    filename=uploaded_file.name,
-                    file_path=uploaded_file
-                )
-                print(f"Created document: {document.id} for chat: {chat_id}")
-                
-                # Process PDF
-                print("Starting PDF processing...")
-                success = process_pdf_document(document, uploaded_file, chat_id)
-                print(f"PDF processing result: {success}")
-                
-                if success:
-                    return JsonResponse({
-                        'success': True, 
-                        'message': f'PDF "{uploaded_file.name}" uploaded and processed successfully!'
-                    })
-                else:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': 'PDF uploaded but processing failed. Check server logs for details.'
-                    })
-                    
+                # Hash while spooling to disk; identical bytes this user already
+                # uploaded (in any chat) are reused instead of re-indexed
+                with metrics.stage('hash'):
+                    sha256, temp_path, size = spool_upload(uploaded_file)
+                return ingest_upload(request.user, chat, uploaded_file.name, sha256, temp_path, size)
             except Exception as e:
                 print(f"Upload error: {e}")
                 import traceback
                 traceback.print_exc()
                 return JsonResponse({'success': False, 'error': f'Upload failed: {str(e)}'})
+            finally:
+                remove_temp_file(temp_path)
         
         return render(request, 'documents/upload.html', {'chat': chat})
         
@@ -73,96 +70,228 @@ def upload_document(request, chat_id):
         traceback.print_exc()
         return JsonResponse({'success': False, 'error': f'Server error: {str(e)}'})
 
-def process_pdf_document(document, uploaded_file, chat_id):
-    """Process PDF: extract text, chunk, embed, and store in Pinecone"""
+def remove_temp_file(temp_path):
+    if temp_path and os.path.exists(temp_path):
+        try:
+            os.unlink(temp_path)
+            print(f"Cleaned up temp file: {temp_path}")
+        except Exception as e:
+            print(f"Failed to clean up temp file: {e}")
+
+def ingest_upload(user, chat, filename, sha256, temp_path, size):
+    """Attach a spooled upload to the chat, processing it unless its bytes are already known"""
+    store = ContentStore()
+    content, created = store.acquire(user, sha256, size)
+    process = store.claim(content, created)
+    print(f"Content {content.id} for {filename}: sha256={sha256[:12]}, "
+          f"{'new' if created else 'known'}, status={content.status}")
+    
+    with metrics.stage('save_file'):
+        if process:
+            store.save_file(content, filename, temp_path)
+        print(f"Creating document record for: {filename}")
+        document = Document.objects.create(
+            chat=chat,
+            content=content,
+            filename=filename,
+            file_path=content.file.name
+        )
+    print(f"Created document: {document.id} for chat: {chat.supabase_id}")
+    ResponseCache().bump(chat_scope(chat.supabase_id))
+    
+    if not process:
+        # The chat now searches this content, ready or not
+        scopes_changed(store.scopes(content))
+        if content.status == DocumentContent.STATUS_READY:
+            message = f'PDF "{filename}" was already indexed, reused it.'
+        else:
+            message = f'PDF "{filename}" is already being processed.'
+        return JsonResponse({'success': True, 'message': message, 'reused': True})
+    
+    # Process PDF
+    print("Starting PDF processing...")
+    success = process_pdf_document(content, temp_path)
+    print(f"PDF processing result: {success}")
+    
+    if success:
+        # Including chats that attached the same bytes while they were processed
+        scopes_changed(store.scopes(content))
+        return JsonResponse({
+            'success': True, 
+            'message': f'PDF "{filename}" uploaded and processed successfully!'
+        })
+    else:
+        return JsonResponse({
+            'success': False, 
+            'error': 'PDF uploaded but processing failed. Check server logs for details.'
+        })
+
+@login_required
+@require_POST
+def start_upload(request, chat_id):
+    """Open a resumable upload: {"filename": ..., "size": <bytes>}"""
+    chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
+    wait = throttle_wait(request, 'upload')
+    if wait:
+        return too_many_requests(wait, 'Upload limit reached, please try again later')
+    try:
+        data = json.loads(request.body)
+        filename = os.path.basename(str(data.get('filename', '')))
+        size = int(data.get('size', 0))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Expected JSON with filename and size'}, status=400)
+    
+    if not filename.lower().endswith('.pdf'):
+        return JsonResponse({'success': False, 'error': 'Please upload a PDF file'}, status=400)
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        return JsonResponse({
+            'success': False,
+            'error': f'File size must be between 1 byte and {settings.UPLOAD_MAX_SIZE} bytes'
+        }, status=413 if size > 0 else 400)
+    
+    service = UploadSessionService()
+    session = service.start(request.user, chat, filename, size)
+    print(f"Started upload {session.id} for {filename} ({size} bytes), chat: {chat_id}")
+    return JsonResponse({'success': True, **service.status(session)}, status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_session(request, upload_id):
+    """GET: progress for resuming; PUT: one part (Content-Range + X-Part-SHA256); DELETE: abort"""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    service = UploadSessionService()
+    
+    if request.method == 'DELETE':
+        service.abort(session)
+        return JsonResponse({'success': True})
+    
+    if request.method == 'PUT':
+        match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return JsonResponse({'success': False, 'error': 'Content-Range: bytes <first>-<last>/<size> is required'}, status=400)
+        first, last, total = match.groups()
+        if total != '*' and int(total) != session.size:
+            return JsonResponse({'success': False, 'error': f'Upload size is {session.size} bytes'}, status=416)
+        try:
+            with metrics.stage('write_part'):
+                service.write_part(session, int(first), int(last) - int(first) + 1,
+                                   request, request.headers.get('X-Part-SHA256'))
+        except UploadRejected as e:
+            return JsonResponse({'success': False, 'error': str(e), **service.status(session)}, status=e.status)
+    
+    return JsonResponse({'success': True, **service.status(session)})
+
+@login_required
+@require_POST
+def complete_upload(request, upload_id):
+    """Assemble a resumable upload and ingest it like a single-request upload"""
+    session = get_object_or_404(UploadSession.objects.select_related('chat'), id=upload_id, user=request.user)
     temp_path = None
     try:
-        print(f"Starting PDF processing for document: {document.id}")
-        
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            for chunk in uploaded_file.chunks():
-                tmp.write(chunk)
-            temp_path = tmp.name
-        
-        print(f"Saved PDF to temp file: {temp_path}")
+        with metrics.stage('assemble'):
+            sha256, temp_path, size = UploadSessionService().complete(session)
+        print(f"Assembled upload {session.id}: {size} bytes")
+        return ingest_upload(request.user, session.chat, session.filename, sha256, temp_path, size)
+    except UploadRejected as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    except Exception as e:
+        print(f"Upload completion error: {e}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'success': False, 'error': f'Upload failed: {str(e)}'})
+    finally:
+        remove_temp_file(temp_path)
+
+def process_pdf_document(content, temp_path):
+    """Process PDF: extract text, chunk, embed, and store in Pinecone"""
+    # The loaders and splitter pull in most of langchain, so they're loaded
+    # by the first ingestion rather than by every worker at startup
+    from langchain_community.document_loaders import PyMuPDFLoader, PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from services import segments, vectors
+    try:
+        print(f"Starting PDF processing for content: {content.id} ({temp_path})")
         
         # Load PDF with better error handling
         pages = []
-        try:
-            print("Trying PyMuPDFLoader...")
-            loader = PyMuPDFLoader(temp_path)
-            pages = loader.load()
-            print(f"PyMuPDFLoader loaded {len(pages)} pages")
-        except Exception as e:
-            print(f"PyMuPDFLoader failed: {e}")
+        with metrics.stage('extract'):
             try:
-                print("Trying PyPDFLoader...")
-                loader = PyPDFLoader(temp_path)
+                print("Trying PyMuPDFLoader...")
+                loader = PyMuPDFLoader(temp_path)
                 pages = loader.load()
-                print(f"PyPDFLoader loaded {len(pages)} pages")
-            except Exception as e2:
-                print(f"PyPDFLoader also failed: {e2}")
-                raise Exception(f"Both PDF loaders failed: {e}, {e2}")
+                print(f"PyMuPDFLoader loaded {len(pages)} pages")
+            except Exception as e:
+                print(f"PyMuPDFLoader failed: {e}")
+                try:
+                    print("Trying PyPDFLoader...")
+                    loader = PyPDFLoader(temp_path)
+                    pages = loader.load()
+                    print(f"PyPDFLoader loaded {len(pages)} pages")
+                except Exception as e2:
+                    print(f"PyPDFLoader also failed: {e2}")
+                    raise Exception(f"Both PDF loaders failed: {e}, {e2}")
         
         if not pages:
             print("No pages loaded from PDF")
+            ContentStore().mark(content, DocumentContent.STATUS_FAILED)
             return False
         
         print(f"Processing {len(pages)} pages")
         
+        # Keep the page text (without chunk overlap) for the document viewer
+        with metrics.stage('store_pages'):
+            PageService().store_pages(content, pages)
+        
         # Split into chunks
         try:
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1500, 
-                chunk_overlap=400
-            )
-            chunks = splitter.split_documents(pages)
+            with metrics.stage('split'):
+                splitter = RecursiveCharacterTextSplitter(
+                    chunk_size=1500, 
+                    chunk_overlap=400
+                )
+                chunks = splitter.split_documents(pages)
             print(f"Split into {len(chunks)} chunks")
         except Exception as e:
             print(f"Text splitting failed: {e}")
+            ContentStore().mark(content, DocumentContent.STATUS_FAILED)
             return False
         
-        # Generate embeddings with fallback
+        # Generate embeddings in batches. A chunk that can't be embedded gets
+        # no vector (it is still found by keyword search) rather than a
+        # zero-vector stand-in that would match arbitrary queries.
         ai_service = AIService()
         texts = [chunk.page_content for chunk in chunks]
-        embeddings = []
-        
         print("Generating embeddings...")
-        for i, text in enumerate(texts):
-            try:
-                embedding = ai_service.generate_embedding(text)
-                embeddings.append(embedding)
-                if i % 5 == 0:  # Progress indicator
-                    print(f"Generated {i+1}/{len(texts)} embeddings")
-            except Exception as e:
-                print(f"Embedding generation failed for chunk {i}: {e}")
-                # Use zero vector as fallback
-                embeddings.append([0.0] * 768)
-        
-        print(f"Generated {len(embeddings)} embeddings")
+        embeddings = ai_service.generate_embeddings(texts)
+        missing = sum(1 for embedding in embeddings if embedding is None)
+        if texts and missing == len(texts):
+            print("Embedding failed for every chunk; leaving the content for a retry")
+            ContentStore().mark(content, DocumentContent.STATUS_FAILED)
+            return False
+        print(f"Generated {len(embeddings) - missing} embeddings, {missing} failed")
         
         # Store in Pinecone (optional)
         try:
             pinecone_service = PineconeService()
             if pinecone_service.index:
-                print("Clearing old vectors for this chat...")
-                pinecone_service.clear_old_vectors(chat_id)
-                
+                # Vectors belong to the content, not a chat: every document
+                # sharing it finds them through a content_id filter. Metadata
+                # holds ids only; retrieval reads the chunk text from the database.
                 print("Storing vectors in Pinecone...")
                 vectors_to_upsert = []
-                for i, (embedding, text, chunk) in enumerate(zip(embeddings, texts, chunks)):
-                    vector_id = f"{document.id}_{i}"
+                for i, (embedding, chunk) in enumerate(zip(embeddings, chunks)):
+                    if embedding is None:
+                        continue
+                    vector_id = content.vector_id(i)
                     metadata = {
-                        'pdf_id': str(document.id),
+                        'content_id': content.id,
                         'chunk_id': i,
-                        'page': chunk.metadata.get('page', 0),
-                        'text': text[:1000],  # Limit metadata size
-                        'chat_id': chat_id
+                        'page': chunk.metadata.get('page', 0)
                     }
                     vectors_to_upsert.append((vector_id, embedding, metadata))
                 
-                pinecone_service.upsert_vectors(vectors_to_upsert)
+                with metrics.stage('upsert'):
+                    pinecone_service.upsert_vectors(vectors_to_upsert)
                 print(f"Stored {len(vectors_to_upsert)} vectors in Pinecone")
             else:
                 print("Pinecone not available, skipping vector storage")
@@ -172,78 +301,110 @@ def process_pdf_document(document, uploaded_file, chat_id):
         
         # Store chunks in database
         print("Storing chunks in database...")
-        for i, (text, chunk) in enumerate(zip(texts, chunks)):
-            try:
-                DocumentChunk.objects.create(
-                    document=document,
-                    chunk_id=i,
-                    page_number=chunk.metadata.get('page', 0),
-                    content=text,
-                    embedding=embeddings[i] if i < len(embeddings) else []
-                )
-            except Exception as e:
-                print(f"Failed to store chunk {i}: {e}")
-                # Continue with other chunks
+        with metrics.stage('store_chunks'):
+            for i, (text, chunk) in enumerate(zip(texts, chunks)):
+                try:
+                    DocumentChunk.objects.create(
+                        source=content,
+                        chunk_id=i,
+                        page_number=chunk.metadata.get('page', 0),
+                        content=text,
+                        **vectors.chunk_fields(embeddings[i] or [])
+                    )
+                except Exception as e:
+                    print(f"Failed to store chunk {i}: {e}")
+                    # Continue with other chunks
         
+        ContentStore().mark(content, DocumentContent.STATUS_READY, chunk_count=len(chunks))
         print(f"Successfully processed PDF with {len(chunks)} chunks")
+        
+        # Local search segment, shared by all workers from here on
+        try:
+            with metrics.stage('build_segment'):
+                segments.get_store().build(content.id)
+        except Exception as e:
+            print(f"Segment build failed (built on first search instead): {e}")
         return True
         
     except Exception as e:
         print(f"PDF processing error: {e}")
         import traceback
         traceback.print_exc()
+        ContentStore().mark(content, DocumentContent.STATUS_FAILED)
         return False
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                print(f"Cleaned up temp file: {temp_path}")
-            except Exception as e:
-                print(f"Failed to clean up temp file: {e}")
 
+@cache_control(private=True, no_cache=True)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chat_documents(request, chat_id):
     """Get documents for a chat"""
     try:
         print(f"Getting documents for chat: {chat_id}, user: {request.user}")
-        chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
-        documents = Document.objects.filter(chat=chat)
-        print(f"Found {documents.count()} documents")
         
-        result = [{
-            'id': str(doc.id),
-            'filename': doc.filename,
-            'created_at': doc.uploaded_at
-        } for doc in documents]
+        def build():
+            chat = get_object_or_404(Chat, supabase_id=chat_id, user=request.user)
+            return [{
+                'id': str(doc.id),
+                'filename': doc.filename,
+                'created_at': doc.uploaded_at
+            } for doc in Document.objects.filter(chat=chat)]
         
-        print(f"Returning documents: {result}")
+        # Keyed per user and chat, so a hit also implies ownership was checked
+        result = ResponseCache().get_or_build(
+            'get_chat_documents', [chat_scope(chat_id)], build, key=request.user.id
+        )
+        print(f"Returning {len(result)} documents")
         return Response(result)
     except Exception as e:
         print(f"Error getting documents: {e}")
         return Response({'error': str(e)}, status=500)
 
+def document_page_etag(request, document_id):
+    """ETag for a page window; pages never change once a document is ingested,
+    so there is none while it is still being ingested (or has failed)"""
+    if not request.user.is_authenticated:
+        return None
+    try:
+        row = Document.objects.filter(
+            id=document_id, chat__user=request.user
+        ).values_list('uploaded_at', 'content__status', 'content__chunk_count').first()
+    except ValueError:
+        return None
+    if row is None:
+        return None
+    uploaded_at, status, chunk_count = row
+    if status != DocumentContent.STATUS_READY:
+        return None
+    return (f"doc{document_id}-{uploaded_at.timestamp()}-c{chunk_count}"
+            f"-p{request.GET.get('page', '')}-n{request.GET.get('count', '')}")
+
+@etag(document_page_etag)
+@cache_control(private=True, no_cache=True)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def view_document(request, document_id):
-    """Get document chunks for viewing"""
+    """Get a window of document pages for viewing: ?page=<first page>&count=<pages>"""
     try:
-        document = get_object_or_404(Document, id=document_id, chat__user=request.user)
-        chunks = DocumentChunk.objects.filter(document=document).order_by('page_number', 'chunk_id')
+        start = max(0, int(request.GET.get('page', 0)))
+        count = int(request.GET.get('count', PageService.DEFAULT_PAGE_COUNT))
+    except ValueError:
+        return Response({'success': False, 'error': 'page and count must be integers'}, status=400)
+    count = min(max(1, count), PageService.MAX_PAGE_COUNT)
+    document = get_object_or_404(Document, id=document_id, chat__user=request.user)
+    
+    try:
+        page_count, pages, next_page = PageService().page_window(document.content, start, count)
         
         return Response({
             'success': True,
             'document': {
                 'id': str(document.id),
                 'filename': document.filename,
-                'created_at': document.created_at
+                'created_at': document.uploaded_at,
+                'page_count': page_count
             },
-            'chunks': [{
-                'chunk_id': chunk.chunk_id,
-                'page_number': chunk.page_number,
-                'content': chunk.content
-            } for chunk in chunks]
+            'pages': pages,
+            'next_page': next_page
         })
     except Exception as e:
         return Response({'success': False, 'error': str(e)}, status=500)
@@ -257,33 +418,9 @@ def delete_document(request, document_id):
         document = get_object_or_404(Document, id=document_id, chat__user=request.user)
         print(f"Found document: {document.filename}")
         
-        # Delete document chunks
-        chunks = DocumentChunk.objects.filter(document=document)
-        print(f"Deleting {chunks.count()} chunks for document {document.id}")
-        chunks.delete()
-        
-        # Delete from Pinecone if available
-        try:
-            from services.pinecone_service import PineconeService
-            pinecone_service = PineconeService()
-            if pinecone_service.index:
-                # Delete vectors with document ID
-                pinecone_service.delete_vectors([f"{document.id}_{i}" for i in range(100)])  # Delete up to 100 chunks
-                print(f"Deleted vectors from Pinecone for document {document.id}")
-        except Exception as e:
-            print(f"Error deleting from Pinecone: {e}")
-        
-        # Delete document file if it exists
-        if document.file_path and document.file_path.name:
-            try:
-                document.file_path.delete(save=False)
-                print(f"Deleted file: {document.file_path.name}")
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-        
-        # Delete document record
+        # Single transaction; file and vectors are swept in the background
         document_filename = document.filename
-        document.delete()
+        DeletionService().delete_document(document)
         print(f"Deleted document: {document_filename}")
         
         return Response({
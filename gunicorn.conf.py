@@ -0,0 +1,26 @@
+"""
+Gunicorn settings and hooks (read automatically from the working directory).
+
+With preload_app the master imports the application, and with WARM_PRELOAD
+the heavy libraries it uses, before forking. Workers replaced after
+--max-requests are forked from that master, so a recycle costs a fork
+instead of a fresh import of everything. Worker-local state that can't
+cross a fork is reset in post_fork.
+"""
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+if preload_app:
+    os.environ.setdefault('WARM_PRELOAD', 'true')
+
+# Each queued LLM request holds a worker thread, so keep the admission
+# queue short enough (LLM_MAX_CONCURRENCY + 2 of the 8 threads) that cheap
+# endpoints always find a free one. Under uvicorn waiting costs no thread
+# and the settings default applies.
+os.environ.setdefault('LLM_MAX_QUEUE', '2')
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from services.warm_state import post_fork as reset_worker_state
+        reset_worker_state()
@@ -2,9 +2,14 @@
 ASGI config for rag_chatbot project.
 """
 import os
-from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
 
+from django.core.asgi import get_asgi_application
+
 application = get_asgi_application()
 
+# Deletions left unfinished by a recycled or crashed worker
+from documents.services import sweeper  # noqa: E402
+sweeper.schedule()
+
@@ -0,0 +1,94 @@
+import re
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from services import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+ACCEPTS_BR = re.compile(r'\bbr\b')
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class ServerTimingMiddleware:
+    """Collect per-stage timings and optionally expose them as a Server-Timing header"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = metrics.end(token)
+        return self.add_header(response, timings)
+
+    async def __acall__(self, request):
+        token = metrics.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = metrics.end(token)
+        return self.add_header(response, timings)
+
+    def add_header(self, response, timings):
+        if settings.SERVER_TIMING_HEADER and timings:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={elapsed:.2f}' for name, elapsed in timings.items()
+            )
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress JSON and HTML responses of at least COMPRESS_MIN_BYTES.
+
+    JSON goes out as brotli when the client accepts it and the brotli
+    package is installed, else gzip. HTML pages carry CSRF tokens, so they
+    only get gzip with random header padding, as Django's GZipMiddleware
+    does against BREACH-style attacks. Streaming responses (the NDJSON chat
+    stream, static files, which WhiteNoise serves pre-compressed) and
+    responses a view already encoded are left alone.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in ('application/json', 'text/html') or len(response.content) < settings.COMPRESS_MIN_BYTES:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if content_type == 'application/json' and brotli is not None and ACCEPTS_BR.search(accepted):
+            encoding = 'br'
+        elif ACCEPTS_GZIP.search(accepted):
+            encoding = 'gzip'
+        else:
+            return response
+        with metrics.stage('compress'):
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=settings.COMPRESS_BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=100)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        # The body is no longer byte-for-byte what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -3,6 +3,7 @@ Django settings for rag_chatbot project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -47,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rag_chatbot.middleware.ServerTimingMiddleware',
+    'rag_chatbot.middleware.CompressionMiddleware',
+    # ETag from the body for GET responses without one, and 304 replies
+    'django.middleware.http.ConditionalGetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -79,23 +84,19 @@ TEMPLATES = [
 WSGI_APPLICATION = 'rag_chatbot.wsgi.application'
 
 # Database
-import dj_database_url
-
-# Print debug info
-print(f"DEBUG: DATABASE_URL exists: {bool(os.getenv('DATABASE_URL'))}")
-print(f"DEBUG: RAILWAY_ENVIRONMENT: {os.getenv('RAILWAY_ENVIRONMENT')}")
-print(f"DEBUG: VERCEL: {os.getenv('VERCEL')}")
+# Settings are imported by every worker at startup (and again on each
+# --max-requests recycle), so they only read the environment: no printing
+# or probing here.
 
 # Check for Railway DATABASE_URL first (Railway auto-provides this)
 if os.getenv('DATABASE_URL'):
     # Railway PostgreSQL (preferred)
-    print("DEBUG: Using DATABASE_URL from Railway")
+    import dj_database_url
     DATABASES = {
         'default': dj_database_url.config(default=os.getenv('DATABASE_URL'), conn_max_age=600)
     }
 elif os.getenv('RAILWAY_ENVIRONMENT') or os.getenv('RAILWAY'):
     # Railway environment but no DATABASE_URL - use SQLite as fallback
-    print("DEBUG: Railway environment detected but no DATABASE_URL, using SQLite")
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -168,6 +169,14 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resumable uploads: parts are written under UPLOAD_SESSION_DIR until the
+# upload is completed; sessions idle longer than UPLOAD_SESSION_TTL are swept
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'rag-uploads'))
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_MAX_PART_SIZE = int(os.getenv('UPLOAD_MAX_PART_SIZE', str(16 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(200 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -179,8 +188,149 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 # External Services Configuration
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 PINECONE_INDEX_NAME = os.getenv('PINECONE_INDEX_NAME', 'rag-chat-index')
+PINECONE_HOST = os.getenv('PINECONE_HOST')  # Direct index host (e.g. a local stub)
 HF_TOKEN = os.getenv('HF_TOKEN')
 MODEL = os.getenv('MODEL', 'openai/gpt-oss-20b')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-mpnet-base-v2')
+# Endpoint overrides for self-hosted / stubbed inference servers
+HF_BASE_URL = os.getenv('HF_BASE_URL')
+HF_EMBEDDING_URL = os.getenv('HF_EMBEDDING_URL')
+
+# Embedding backend: 'hf' (hosted feature-extraction over HTTP) or 'onnx'
+# (EMBEDDING_MODEL run in-process by ONNX Runtime; needs onnxruntime and
+# tokenizers). The ONNX model and tokenizer.json come from
+# EMBEDDING_ONNX_MODEL_DIR if set, else from the EMBEDDING_MODEL hub repo.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'hf')
+EMBEDDING_ONNX_MODEL_DIR = os.getenv('EMBEDDING_ONNX_MODEL_DIR', '')
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model_quint8_avx2.onnx')
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))  # 0 = ONNX Runtime default
+EMBEDDING_MAX_LENGTH = int(os.getenv('EMBEDDING_MAX_LENGTH', '384'))
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+
+# Query embeddings from concurrent requests are sent to the backend together:
+# a batch collects for up to EMBEDDING_QUERY_BATCH_WINDOW_MS or until
+# EMBEDDING_QUERY_BATCH_MAX queries, with up to EMBEDDING_QUERY_BATCH_WORKERS
+# batches in flight. EMBEDDING_QUERY_BATCH_MAX=0 embeds each query on its own.
+EMBEDDING_QUERY_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_QUERY_BATCH_WINDOW_MS', '5'))
+EMBEDDING_QUERY_BATCH_MAX = int(os.getenv('EMBEDDING_QUERY_BATCH_MAX', '16'))
+EMBEDDING_QUERY_BATCH_WORKERS = int(os.getenv('EMBEDDING_QUERY_BATCH_WORKERS', '2'))
+
+# Chunk vectors kept in the database: codes in EMBEDDING_STORAGE_DTYPE
+# (float32 | float16 | int8) plus a float32 copy, used to rerank the best
+# VECTOR_RERANK_OVERSAMPLE x top_k candidates of a quantized search
+EMBEDDING_STORAGE_DTYPE = os.getenv('EMBEDDING_STORAGE_DTYPE', 'int8')
+EMBEDDING_KEEP_FULL_PRECISION = os.getenv('EMBEDDING_KEEP_FULL_PRECISION', 'True').lower() == 'true'
+VECTOR_RERANK_OVERSAMPLE = int(os.getenv('VECTOR_RERANK_OVERSAMPLE', '4'))
+
+# Warm state kept in files under WARM_STATE_DIR, so recycled and sibling
+# workers attach to it instead of rebuilding it: a memory-mapped table of
+# EMBEDDING_CACHE_SLOTS query embeddings (0 disables it) and one vector
+# segment per document for local search, memory-mapped on open (at most
+# LOCAL_INDEX_OPEN_SEGMENTS kept open per process).
+WARM_STATE_DIR = os.getenv('WARM_STATE_DIR', os.path.join(tempfile.gettempdir(), 'rag-warm-state'))
+EMBEDDING_CACHE_SLOTS = int(os.getenv('EMBEDDING_CACHE_SLOTS', '8192'))
+LOCAL_INDEX_OPEN_SEGMENTS = int(os.getenv('LOCAL_INDEX_OPEN_SEGMENTS', '256'))
+# Chat and user retrieval scopes get a packed segment of their documents'
+# vectors. Documents added since it was packed are searched from their own
+# segments and deleted ones are masked out; it is repacked in the background
+# once more than SCOPE_SEGMENT_MAX_DELTA documents were added or more than
+# SCOPE_SEGMENT_MAX_DEAD of its rows belong to deleted ones.
+SCOPE_SEGMENT_MAX_DELTA = int(os.getenv('SCOPE_SEGMENT_MAX_DELTA', '4'))
+SCOPE_SEGMENT_MAX_DEAD = float(os.getenv('SCOPE_SEGMENT_MAX_DEAD', '0.25'))
+# Packed segments of LOCAL_ANN_MIN_ROWS chunks or more (0 = never) become an
+# approximate (IVF) index of LOCAL_ANN_LISTS k-means lists (0 = ~4 x sqrt of
+# the rows); a search scans the LOCAL_ANN_NPROBE nearest lists, so raising it
+# trades speed for recall. Centroids are retrained once the segment grows
+# past LOCAL_ANN_RETRAIN_GROWTH x the rows they were trained on.
+LOCAL_ANN_MIN_ROWS = int(os.getenv('LOCAL_ANN_MIN_ROWS', '50000'))
+LOCAL_ANN_LISTS = int(os.getenv('LOCAL_ANN_LISTS', '0'))
+LOCAL_ANN_NPROBE = int(os.getenv('LOCAL_ANN_NPROBE', '16'))
+LOCAL_ANN_RETRAIN_GROWTH = float(os.getenv('LOCAL_ANN_RETRAIN_GROWTH', '2'))
+# With gunicorn --preload, wsgi.py imports these once in the master so
+# forked workers share them copy-on-write (see gunicorn.conf.py)
+WARM_PRELOAD = os.getenv('WARM_PRELOAD', 'False').lower() == 'true'
+WARM_PRELOAD_MODULES = [
+    'numpy',
+    'huggingface_hub',
+    'pinecone',
+    'langchain_community.document_loaders',
+    'langchain.text_splitter',
+    'services.ai_service',
+    'services.embeddings',
+    'services.segments',
+]
+
+# Serve the chat endpoints with the async views (set when running under ASGI/uvicorn)
+ASYNC_CHAT_VIEWS = os.getenv('ASYNC_CHAT_VIEWS', 'False').lower() == 'true'
+
+# Rate limiting: token buckets per user / guest session / IP, kept in this cache.
+# Rates are "<requests>/<s|min|hour|day>"; a full bucket allows that many at once.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+THROTTLE_CACHE_ALIAS = 'default'
+# Reverse proxies in front of the app that append to X-Forwarded-For (the
+# platform's router); the client address is that many entries from the
+# right. 0 ignores the header and uses the connection's address.
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+THROTTLE_RATES = {
+    'llm': {
+        'user': os.getenv('RATE_LIMIT_LLM_USER', '20/min'),
+        'session': os.getenv('RATE_LIMIT_LLM_SESSION', '6/min'),
+        'ip': os.getenv('RATE_LIMIT_LLM_IP', '30/min'),
+    },
+    'chat_create': {
+        'user': os.getenv('RATE_LIMIT_CHAT_CREATE_USER', '30/min'),
+        'session': os.getenv('RATE_LIMIT_CHAT_CREATE_SESSION', '10/min'),
+        'ip': os.getenv('RATE_LIMIT_CHAT_CREATE_IP', '30/min'),
+    },
+    'upload': {
+        'user': os.getenv('RATE_LIMIT_UPLOAD_USER', '20/hour'),
+    },
+    'prefetch': {
+        'user': os.getenv('RATE_LIMIT_PREFETCH_USER', '60/min'),
+        'session': os.getenv('RATE_LIMIT_PREFETCH_SESSION', '30/min'),
+        'ip': os.getenv('RATE_LIMIT_PREFETCH_IP', '120/min'),
+    },
+}
+
+# Admission control: in-flight LLM requests per process; the rest queue
+# (round-robin across clients) up to LLM_MAX_QUEUE, then get a fast 429
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '8'))
+LLM_MAX_QUEUED_PER_CLIENT = int(os.getenv('LLM_MAX_QUEUED_PER_CLIENT', '2'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '15'))
+
+# Expose per-stage request timings as a Server-Timing response header
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', str(DEBUG)).lower() == 'true'
+
+# Interaction analytics (ai.AIInteraction): each worker buffers records in
+# memory and writes them with one bulk INSERT every ANALYTICS_FLUSH_SIZE
+# records or ANALYTICS_FLUSH_INTERVAL seconds; beyond ANALYTICS_MAX_BUFFERED
+# unwritten records (database down) new ones are dropped
+ANALYTICS_ENABLED = os.getenv('ANALYTICS_ENABLED', 'true').lower() == 'true'
+ANALYTICS_FLUSH_SIZE = int(os.getenv('ANALYTICS_FLUSH_SIZE', '50'))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '5'))
+ANALYTICS_MAX_BUFFERED = int(os.getenv('ANALYTICS_MAX_BUFFERED', '5000'))
+
+# Conversation memory: recent turns sent verbatim, older ones summarized
+MEMORY_RECENT_MESSAGES = int(os.getenv('MEMORY_RECENT_MESSAGES', '6'))
+MEMORY_FOLD_STEP = int(os.getenv('MEMORY_FOLD_STEP', '4'))
+MEMORY_MAX_MESSAGE_CHARS = int(os.getenv('MEMORY_MAX_MESSAGE_CHARS', '1200'))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv('MEMORY_SUMMARY_MAX_TOKENS', '300'))
+# Message texts of at least MESSAGE_COMPRESS_MIN_BYTES (UTF-8) are stored
+# zlib-compressed (0 stores every message as plain text)
+MESSAGE_COMPRESS_MIN_BYTES = int(os.getenv('MESSAGE_COMPRESS_MIN_BYTES', '512'))
+
+# Query routing (chat.routing.QueryRouter): greetings and thanks skip
+# retrieval, and each kind of message gets its own top_k and generation
+# budget (max tokens); LLM_MAX_TOKENS is the budget of everything else
+LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '2000'))
+QUERY_ROUTING_ENABLED = os.getenv('QUERY_ROUTING_ENABLED', 'True').lower() == 'true'
+QUERY_ROUTE_MAX_TOKENS = {
+    'greeting': int(os.getenv('QUERY_ROUTE_GREETING_MAX_TOKENS', '150')),
+    'thanks': int(os.getenv('QUERY_ROUTE_THANKS_MAX_TOKENS', '100')),
+    'lookup': int(os.getenv('QUERY_ROUTE_LOOKUP_MAX_TOKENS', '600')),
+    'summary': int(os.getenv('QUERY_ROUTE_SUMMARY_MAX_TOKENS', '1500')),
+}
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
@@ -217,14 +367,79 @@ if not DEBUG:
     SESSION_COOKIE_SECURE = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
-# Caching (use in-memory cache for serverless)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Caching
+# CACHE_BACKEND=locmem (single process, default), file or db (shared by all
+# workers on the host / database; run `createcachetable` for db).
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').lower()
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', 'django_cache'),
+        }
     }
+else:
+    # In-memory cache for serverless / single-process deployments
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+
+# Versioned caching of chat list / document list responses
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
+# Retrieved sources are kept per process for the RETRIEVAL_CACHE_SIZE most
+# recent (scope, query) pairs (0 disables it), under a per-scope index
+# version bumped whenever documents are added to or removed from the scope.
+# A query whose embedding has at least RETRIEVAL_CACHE_SIMILARITY cosine
+# similarity to a cached one in the same scope reuses its sources (above 1
+# only identical normalised text matches).
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '1024'))
+RETRIEVAL_CACHE_SIMILARITY = float(os.getenv('RETRIEVAL_CACHE_SIMILARITY', '0.97'))
+# The version bump reaches other workers only through a shared CACHE_BACKEND;
+# with locmem, entries expire after RETRIEVAL_CACHE_TTL seconds instead so
+# another worker's upload or delete shows up within that time (0: never)
+RETRIEVAL_CACHE_TTL = int(os.getenv('RETRIEVAL_CACHE_TTL', '0' if CACHE_BACKEND in ('file', 'db') else '60'))
+# Full chunk texts for hydrating vector matches, the CHUNK_CACHE_SIZE most
+# recently used per process (0 disables it)
+CHUNK_CACHE_SIZE = int(os.getenv('CHUNK_CACHE_SIZE', '4096'))
+# Speculative retrieval of the message being typed (POST /api/chat/prefetch/):
+# drafts of at least PREFETCH_MIN_CHARS are retrieved one at a time per
+# process, at most PREFETCH_MAX_QUEUED waiting (one per client), to warm the
+# caches above for the message that follows
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'True').lower() == 'true'
+PREFETCH_MIN_CHARS = int(os.getenv('PREFETCH_MIN_CHARS', '12'))
+PREFETCH_MAX_QUEUED = int(os.getenv('PREFETCH_MAX_QUEUED', '32'))
+
+# Static files: with STATIC_MANIFEST=true, collectstatic writes
+# content-hashed names plus gzip (and, with the brotli package, brotli)
+# copies, which WhiteNoise serves with far-future, immutable caching. Every
+# {% static %} then needs a manifest entry, so it must be set for
+# collectstatic and the server alike (the Procfile and Dockerfile do);
+# off by default, serving the plain files.
+STATIC_MANIFEST = os.getenv('STATIC_MANIFEST', 'False').lower() == 'true'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
 }
 
-# Static files storage
-STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+# JSON and HTML responses of at least COMPRESS_MIN_BYTES are sent
+# compressed (rag_chatbot.middleware.CompressionMiddleware): JSON as brotli
+# at COMPRESS_BROTLI_QUALITY when the client and the brotli package allow
+# it, everything else as gzip
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
 
@@ -7,8 +7,17 @@ import sys
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rag_chatbot.settings')
 
 try:
+    from django.conf import settings
     from django.core.wsgi import get_wsgi_application
     application = get_wsgi_application()
+    if settings.WARM_PRELOAD:
+        # Under gunicorn --preload this runs once, in the master (see gunicorn.conf.py)
+        from services.warm_state import preload
+        preload()
+    else:
+        # Deletions left unfinished by a recycled or crashed worker
+        from documents.services import sweeper
+        sweeper.schedule()
 except Exception as e:
     # Log the error so we can see it in Railway logs
     print(f"Error loading WSGI application: {e}", file=sys.stderr)
@@ -18,4 +27,3 @@ except Exception as e:
 
 # Vercel requires this
 app = application
-
@@ -1,7 +1,16 @@
 # Services package initialization
 # Note: Services are instantiated directly where needed, not at module level
-# to avoid startup errors if credentials are not configured
-from .pinecone_service import PineconeService
-from .ai_service import AIService
-
+# to avoid startup errors if credentials are not configured.
+# The service classes are resolved on first access, so importing a light
+# module like services.metrics doesn't load the AI and vector-store clients.
 __all__ = ['PineconeService', 'AIService']
+
+
+def __getattr__(name):
+    if name == 'PineconeService':
+        from .pinecone_service import PineconeService
+        return PineconeService
+    if name == 'AIService':
+        from .ai_service import AIService
+        return AIService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
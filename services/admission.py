@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
+from . import metrics
+
+
+class Overloaded(Exception):
+    """Raised when a request can't get an LLM slot; maps to HTTP 429"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A queued request, woken from whichever thread releases a slot"""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+    """Caps in-flight LLM requests per process and queues the rest fairly.
+
+    Waiting requests are queued per client and served round-robin, so one
+    client with many requests in flight can't starve the others. When the
+    queue is full, or a client already has its share queued, the request is
+    rejected immediately instead of tying up a worker.
+    """
+
+    def __init__(self, max_concurrency=None, max_queue=None, max_queued_per_client=None, queue_timeout=None):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.max_queue = max_queue if max_queue is not None else settings.LLM_MAX_QUEUE
+        self.max_queued_per_client = max_queued_per_client or settings.LLM_MAX_QUEUED_PER_CLIENT
+        self.queue_timeout = queue_timeout or settings.LLM_QUEUE_TIMEOUT
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # client -> deque of waiters
+        # Moving average of how long a slot is held, for Retry-After hints
+        self._avg_hold = 5.0
+
+    def _retry_after(self):
+        return self._avg_hold * (self._queued + 1) / self.max_concurrency
+
+    def _enter(self, ident, waiter):
+        """Take a slot now (True) or queue the waiter (False); raises Overloaded. Call under lock."""
+        if self._active < self.max_concurrency and not self._queued:
+            self._active += 1
+            return True
+        queue = self._queues.get(ident)
+        if self._queued >= self.max_queue:
+            raise Overloaded('Server is busy, please retry shortly', self._retry_after())
+        if queue is not None and len(queue) >= self.max_queued_per_client:
+            raise Overloaded('Too many requests in progress for this client', self._retry_after())
+        self._queues.setdefault(ident, deque()).append(waiter)
+        self._queued += 1
+        return False
+
+    def _abandon(self, ident, waiter):
+        """Drop a waiter that gave up; False if it was granted a slot meanwhile. Call under lock."""
+        if waiter.granted:
+            return False
+        queue = self._queues[ident]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[ident]
+        self._queued -= 1
+        return True
+
+    def _release(self, held=None):
+        with self._lock:
+            if held is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            if not self._queues:
+                self._active -= 1
+                return
+            # Round-robin: oldest waiter of the first client, who then goes to the back
+            ident, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(ident)
+            else:
+                del self._queues[ident]
+            self._queued -= 1
+            waiter.grant()  # the slot passes straight to the waiter
+
+    def _timed_out(self, ident):
+        print(f"Admission: {ident} waited {self.queue_timeout}s without a slot")
+        return Overloaded('Server is busy, please retry shortly', self._retry_after())
+
+    @contextmanager
+    def slot(self, ident):
+        """Hold one LLM slot for the duration of the block"""
+        started = time.perf_counter()
+        waiter = _Waiter()
+        with self._lock:
+            entered = self._enter(ident, waiter)
+        if not entered and not waiter.event.wait(self.queue_timeout):
+            with self._lock:
+                if self._abandon(ident, waiter):
+                    raise self._timed_out(ident)
+        metrics.record('queue', (time.perf_counter() - started) * 1000)
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired)
+
+    @asynccontextmanager
+    async def aslot(self, ident):
+        """Async version of slot(); waiting doesn't block the event loop"""
+        started = time.perf_counter()
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            entered = self._enter(ident, waiter)
+        if not entered:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if self._abandon(ident, waiter):
+                        raise self._timed_out(ident)
+            except asyncio.CancelledError:
+                # Client went away; if a slot was granted meanwhile, hand it on
+                with self._lock:
+                    abandoned = self._abandon(ident, waiter)
+                if not abandoned:
+                    self._release()
+                raise
+        metrics.record('queue', (time.perf_counter() - started) * 1000)
+        acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired)
+
+
+admission = AdmissionController()
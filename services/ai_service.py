@@ -1,5 +1,7 @@
 from django.conf import settings
-from huggingface_hub import InferenceClient
+from asgiref.sync import sync_to_async
+from .prompts import PromptBuilder, estimate_tokens
+from . import metrics
 import json
 
 class AIService:
@@ -8,41 +10,51 @@ class AIService:
     def __init__(self):
         self.hf_token = settings.HF_TOKEN
         self.model = settings.MODEL
+        self.prompt_builder = PromptBuilder()
+        self._async_llm_client = None
         try:
-            self.llm_client = InferenceClient(model=self.model, token=self.hf_token)
+            from huggingface_hub import InferenceClient
+            if settings.HF_BASE_URL:
+                self.llm_client = InferenceClient(base_url=settings.HF_BASE_URL, token=self.hf_token)
+            else:
+                self.llm_client = InferenceClient(model=self.model, token=self.hf_token)
         except Exception as e:
             print(f"Failed to initialize LLM client: {e}")
             self.llm_client = None
     
-    def generate_response(self, message, conversation_history=None):
-        """Generate AI response using Hugging Face InferenceClient"""
+    def generate_response(self, message, conversation_history=None, summary=None, sources=None, max_tokens=None):
+        """Generate AI response using Hugging Face InferenceClient, in at most
+        max_tokens (default LLM_MAX_TOKENS)"""
+        max_tokens = max_tokens or settings.LLM_MAX_TOKENS
         try:
             if not self.llm_client:
                 print("LLM client not available, using fallback")
                 return self._generate_fallback_response(message, conversation_history)
             
-            # Build conversation context
-            if conversation_history:
-                context = self._build_context(conversation_history)
-                prompt = f"{context}\n\nHuman: {message}\n\nAssistant:"
-            else:
-                prompt = f"Human: {message}\n\nAssistant:"
-            
+            # Role-separated messages: stable system prefix, history, then this turn
+            messages, stats = self.prompt_builder.build(message, conversation_history, summary, sources)
             print(f"AI: Generating response for: {message[:100]}...")
+            print(f"AI: Prompt built in {stats['build_ms']:.2f} ms: "
+                  f"{stats['messages']} messages, ~{stats['prompt_tokens']} tokens")
             
             # Try chat_completion first
             try:
-                resp = self.llm_client.chat_completion(
-                    model=self.model, 
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=2000, 
-                    temperature=0.4, 
-                    stream=False
-                )
+                with metrics.stage('llm'):
+                    resp = self.llm_client.chat_completion(
+                        model=self.model, 
+                        messages=messages,
+                        max_tokens=max_tokens, 
+                        temperature=0.4, 
+                        stream=False
+                    )
+                usage = getattr(resp, 'usage', None)
+                if usage is not None and getattr(usage, 'prompt_tokens', None):
+                    print(f"AI: Prompt tokens (provider): {usage.prompt_tokens}")
                 # Extract response from chat completion
                 if hasattr(resp, 'choices') and len(resp.choices) > 0:
                     response = resp.choices[0].message.content
                     print(f"AI: Generated response: {response[:100]}...")
+                    self._note_usage(stats, response, usage)
                     return response
                 else:
                     print(f"AI: Unexpected response format: {resp}")
@@ -52,8 +64,8 @@ class AIService:
                 try:
                     # Fallback to text_generation
                     gen = self.llm_client.text_generation(
-                        prompt, 
-                        max_new_tokens=2000, 
+                        PromptBuilder.flatten(messages), 
+                        max_new_tokens=max_tokens, 
                         temperature=0.4
                     )
                     response = gen if isinstance(gen, str) else str(gen)
@@ -68,13 +80,43 @@ class AIService:
             print(f"Error generating AI response: {e}")
             return f"Sorry, I encountered an error: {str(e)}"
     
-    def _build_context(self, conversation_history):
-        """Build conversation context from history"""
-        context = "You are a helpful AI assistant. Here's our conversation so far:\n\n"
-        for msg in conversation_history[-6:]:  # Last 6 messages for context
-            role = "Human" if msg['role'] == 'user' else "Assistant"
-            context += f"{role}: {msg['content']}\n"
-        return context
+    @staticmethod
+    def _note_usage(stats, response, usage=None):
+        """Record the turn's token counts for analytics: the provider's if reported, else estimates"""
+        metrics.note('prompt_tokens', getattr(usage, 'prompt_tokens', None) or stats['prompt_tokens'])
+        metrics.note('completion_tokens', getattr(usage, 'completion_tokens', None) or estimate_tokens(response or ''))
+    
+    def summarize_conversation(self, previous_summary, turns):
+        """Fold new turns into a running conversation summary; None on failure"""
+        if not self.llm_client:
+            return None
+        transcript = "\n".join(
+            f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['content']}" for turn in turns
+        )
+        instructions = (
+            "Update the running summary of a conversation between a user and an AI assistant. "
+            "Keep names, facts, decisions and open questions; drop pleasantries. "
+            "Reply with the updated summary only, in at most 200 words."
+        )
+        prompt = f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        try:
+            resp = self.llm_client.chat_completion(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=settings.MEMORY_SUMMARY_MAX_TOKENS,
+                temperature=0.2,
+                stream=False
+            )
+            if hasattr(resp, 'choices') and len(resp.choices) > 0:
+                summary = (resp.choices[0].message.content or '').strip()
+                return summary or None
+            return None
+        except Exception as e:
+            print(f"Conversation summarization failed: {e}")
+            return None
     
     def _generate_fallback_response(self, message, conversation_history):
         """Generate a simple fallback response when AI service is down"""
@@ -100,140 +142,445 @@ class AIService:
         else:
             return f"I understand you're asking about: '{message}'. I can see you have uploaded a PDF document, and I'm currently experiencing some technical difficulties with my main AI service. Once restored, I'll be able to analyze your document and provide detailed answers!"
     
-    def generate_embedding(self, text):
-        """Generate embedding for text using Hugging Face"""
+    def generate_embedding(self, text, batched=True):
+        """Embed one text with the configured backend; None if that fails.
+
+        Batched calls share a backend request with concurrent queries.
+        """
+        from services import embeddings
         try:
-            # Use the embedding client
-            from huggingface_hub import InferenceClient
-            emb_client = InferenceClient(
-                model="sentence-transformers/all-mpnet-base-v2", 
-                token=self.hf_token
-            )
-            embedding = emb_client.feature_extraction(text)
-            return embedding.tolist()
+            with metrics.stage('embed'):
+                if batched:
+                    return embeddings.embed_query(text).tolist()
+                return embeddings.get_backend().embed([text])[0].tolist()
         except Exception as e:
+            # No zero-vector stand-in: it would match arbitrary chunks
             print(f"Embedding generation failed: {e}")
-            # Return zero vector as fallback
-            return [0.0] * 768
+            return None
+    
+    def generate_embeddings(self, texts):
+        """Embed many texts in backend-sized batches; None for any text that can't be embedded"""
+        from services import embeddings
+        results = []
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            try:
+                with metrics.stage('embed'):
+                    results.extend(row.tolist() for row in embeddings.get_backend().embed(batch))
+            except Exception as e:
+                # Retry one at a time so a single bad input doesn't sink the batch
+                print(f"Batch embedding failed ({e}); retrying {len(batch)} texts individually")
+                results.extend(self.generate_embedding(text, batched=False) for text in batch)
+            print(f"Generated {len(results)}/{len(texts)} embeddings")
+        return results
     
-    def retrieve_documents(self, query, top_k=3, chat_id=None):
-        """Retrieve relevant documents using Pinecone for RAG"""
+    def retrieve_documents(self, query, top_k=3, chat_id=None, scope=None):
+        """Retrieve relevant documents using Pinecone for RAG, within a
+        services.scopes.RetrievalScope (by default the chat's documents)"""
+        from services import retrieval_cache
+        from services.scopes import RetrievalScope
         try:
+            print(f"RAG: Querying for: {query}")
+            scope = scope or (RetrievalScope.chat(chat_id) if chat_id else None)
+            cache = retrieval_cache.get_cache() if scope else None
+            version = None
+            if cache is not None:
+                with metrics.stage('retrieval_cache'):
+                    version = cache.version(scope)
+                    cached = self._cached_sources(cache, scope, version, query, top_k)
+                if cached is not None:
+                    return cached
+            
             from services.pinecone_service import PineconeService
-            pinecone_service = PineconeService()
+            with metrics.stage('pinecone_init'):
+                pinecone_service = PineconeService()
             
-            print(f"RAG: Querying for: {query}")
-            if chat_id:
-                print(f"RAG: Filtering for chat: {chat_id}")
+            content_ids, legacy_prefixes = [], []
+            if scope:
+                print(f"RAG: Filtering for {scope.label}")
+                with metrics.stage('scope'):
+                    content_ids, legacy_prefixes = scope.contents()
+                if not content_ids:
+                    print(f"RAG: No documents in {scope.label}")
+                    return []
             
             # First try Pinecone
             sources = []
+            query_embedding = None
             if pinecone_service.index:
+                # Generate query embedding
+                query_embedding = self.generate_embedding(query)
+                if cache is not None and query_embedding is not None:
+                    cached = self._cached_sources(cache, scope, version, query, top_k, query_embedding)
+                    if cached is not None:
+                        return cached
+            if query_embedding is not None:
                 try:
-                    # Generate query embedding
-                    query_embedding = self.generate_embedding(query)
                     print(f"RAG: Generated embedding of length: {len(query_embedding)}")
                     
                     # Search in Pinecone
-                    results = pinecone_service.query_vectors(query_embedding, top_k)
+                    with metrics.stage('vector_query'):
+                        results = pinecone_service.query_vectors(
+                            query_embedding, top_k,
+                            filter=scope.vector_filter(content_ids, legacy_prefixes) if scope else None
+                        )
                     print(f"RAG: Pinecone returned {len(results)} results")
                     
-                    # Format results
-                    for i, match in enumerate(results):
-                        print(f"RAG: Processing match {i+1}, score: {match.score}")
-                        print(f"RAG: Metadata keys: {list(match.metadata.keys())}")
-                        
-                        # Filter by chat_id if provided
-                        if chat_id and match.metadata.get('chat_id') != chat_id:
-                            print(f"RAG: Skipping match {i+1} - wrong chat_id: {match.metadata.get('chat_id')}")
-                            continue
-                        
-                        # Get the full text from metadata or from database
-                        text_content = match.metadata.get('text', '')
-                        if not text_content:
-                            # Try to get from database if not in metadata
-                            try:
-                                from documents.models import DocumentChunk
-                                chunk_id = match.metadata.get('chunk_id', 0)
-                                pdf_id = match.metadata.get('pdf_id')
-                                print(f"RAG: Looking for chunk {chunk_id} in document {pdf_id}")
-                                if pdf_id:
-                                    chunk = DocumentChunk.objects.filter(
-                                        document_id=pdf_id,
-                                        chunk_id=chunk_id
-                                    ).first()
-                                    if chunk:
-                                        text_content = chunk.content
-                                        print(f"RAG: Found chunk content: {len(text_content)} chars")
-                                    else:
-                                        print(f"RAG: Chunk not found in database")
-                            except Exception as e:
-                                print(f"Error retrieving chunk content: {e}")
-                        
-                        # Only add if we have actual content
-                        if text_content and len(text_content.strip()) > 0:
-                            sources.append({
-                                'text': text_content,
-                                'page': match.metadata.get('page', 0),
-                                'score': match.score
-                            })
-                            print(f"RAG: Added source {len(sources)} with {len(text_content)} chars")
-                        else:
-                            print(f"RAG: Skipping empty source {i+1}")
+                    sources = self._sources_from_matches(results, scope, content_ids, legacy_prefixes)
                 except Exception as e:
                     print(f"Pinecone query failed: {e}")
-            else:
+            elif not pinecone_service.index:
                 print("RAG: Pinecone index not available")
             
             # If no sources from Pinecone, try database fallback
-            if not sources and chat_id:
-                print("RAG: No sources from Pinecone, trying database fallback...")
-                try:
-                    from documents.models import Document, DocumentChunk
-                    from chat.models import Chat
-                    
-                    # Get chat and its documents
-                    chat = Chat.objects.get(supabase_id=chat_id)
-                    documents = Document.objects.filter(chat=chat)
-                    print(f"RAG: Found {documents.count()} documents in database for chat")
-                    
-                    # Get all chunks from these documents
-                    chunks = DocumentChunk.objects.filter(document__in=documents)
-                    print(f"RAG: Found {chunks.count()} chunks in database")
-                    
-                    # Simple text matching fallback
-                    query_words = query.lower().split()
-                    for chunk in chunks[:top_k]:  # Limit to top_k chunks
-                        content_lower = chunk.content.lower()
-                        # Check if any query words are in the content
-                        if any(word in content_lower for word in query_words):
-                            sources.append({
-                                'text': chunk.content,
-                                'page': chunk.page_number,
-                                'score': 0.8  # Default score for database fallback
-                            })
-                            print(f"RAG: Added database source with {len(chunk.content)} chars")
-                    
-                    # If still no sources, just take the first few chunks
-                    if not sources:
-                        print("RAG: No matching chunks found, using first available chunks")
-                        for chunk in chunks[:top_k]:
-                            sources.append({
-                                'text': chunk.content,
-                                'page': chunk.page_number,
-                                'score': 0.5  # Lower score for non-matching chunks
-                            })
-                            print(f"RAG: Added fallback source with {len(chunk.content)} chars")
-                            
-                except Exception as e:
-                    print(f"Database fallback failed: {e}")
-                    import traceback
-                    traceback.print_exc()
+            if not sources and scope:
+                if not pinecone_service.index:
+                    query_embedding = self.generate_embedding(query)
+                sources = self._database_fallback(query, top_k, content_ids, query_embedding, scope)
             
+            self._cache_sources(cache, scope, version, query, top_k, sources, query_embedding)
             print(f"RAG: Returning {len(sources)} valid sources")
             return sources
         except Exception as e:
             print(f"Document retrieval failed: {e}")
             import traceback
             traceback.print_exc()
-            return []
\ No newline at end of file
+            return []
+    
+    @staticmethod
+    def _cached_sources(cache, scope, version, query, top_k, query_embedding=None):
+        """Sources retrieved earlier for this (or, by embedding, a near-identical) query, or None"""
+        sources = cache.get(scope, version, query, top_k, query_embedding)
+        if sources is not None:
+            metrics.note('retrieval_cache', True)
+            print(f"RAG: {len(sources)} sources from the retrieval cache for {scope.label}")
+        return sources
+    
+    @staticmethod
+    def _cache_sources(cache, scope, version, query, top_k, sources, query_embedding=None):
+        if cache is None:
+            return
+        metrics.note('retrieval_cache', False)
+        # Nothing found may be a transient failure; don't pin it
+        if sources:
+            cache.put(scope, version, query, top_k, sources, query_embedding)
+    
+    def _sources_from_matches(self, results, scope=None, content_ids=None, legacy_prefixes=()):
+        """Turn Pinecone matches into sources, with chunk text loaded from the database in one query"""
+        allowed = set(content_ids or [])
+        prefixes = set(legacy_prefixes)
+        matches = []
+        for i, match in enumerate(results):
+            print(f"RAG: Processing match {i+1}, score: {match.score}")
+            # Filter by scope if provided
+            if scope and not scope.allows(match.metadata, allowed, prefixes):
+                print(f"RAG: Skipping match {i+1} - not in {scope.label}")
+                continue
+            matches.append(match)
+        
+        with metrics.stage('hydrate'):
+            chunks = self._hydrate_chunks(matches)
+        sources = []
+        for match in matches:
+            # The stored chunk is the full text; older vectors also carry a
+            # truncated copy in their metadata, used only if the chunk is gone
+            key = self._chunk_key(match.metadata)
+            text_content, page, content_id = chunks.get(key) or (match.metadata.get('text', ''), 0, None)
+            
+            # Only add if we have actual content
+            if text_content and len(text_content.strip()) > 0:
+                source = {
+                    'text': text_content,
+                    'page': match.metadata.get('page', page),
+                    'score': match.score
+                }
+                if content_id is not None:
+                    # The chunk it came from, for the stored citation (chat.citations)
+                    source.update(content_id=content_id, chunk_id=key[2])
+                sources.append(source)
+                print(f"RAG: Added source {len(sources)} with {len(text_content)} chars")
+            else:
+                print(f"RAG: Skipping empty source for {match.id}")
+        return sources
+    
+    @staticmethod
+    def _chunk_key(metadata):
+        """('content', id, chunk) for current vectors, ('prefix', pdf_id, chunk) for older ones"""
+        chunk_id = int(metadata.get('chunk_id', 0))
+        if metadata.get('content_id') is not None:
+            return ('content', int(metadata['content_id']), chunk_id)
+        if metadata.get('pdf_id'):
+            # Older vectors are keyed by the document they were uploaded with
+            return ('prefix', str(metadata['pdf_id']), chunk_id)
+        return None
+    
+    def _hydrate_chunks(self, matches):
+        """(text, page, content id) of the matches' chunks, keyed by
+        _chunk_key(): from the chunk cache, the rest in a single query with
+        one clause per content"""
+        from collections import defaultdict
+        from django.db.models import Q
+        from documents.models import DocumentChunk
+        from services import retrieval_cache
+        
+        keys = {key for key in (self._chunk_key(match.metadata) for match in matches) if key}
+        cache = retrieval_cache.get_chunk_cache()
+        found = cache.get_many(keys) if cache is not None else {}
+        wanted = defaultdict(list)
+        for kind, owner, chunk_id in keys - found.keys():
+            wanted[(kind, owner)].append(chunk_id)
+        if not wanted:
+            return found
+        query = Q()
+        for (kind, owner), chunk_ids in wanted.items():
+            if kind == 'content':
+                query |= Q(source_id=owner, chunk_id__in=chunk_ids)
+            else:
+                query |= Q(source__vector_prefix=owner, chunk_id__in=chunk_ids)
+        loaded = {}
+        try:
+            rows = DocumentChunk.objects.filter(query).values_list(
+                'source_id', 'source__vector_prefix', 'chunk_id', 'content', 'page_number'
+            )
+            for source_id, prefix, chunk_id, content, page in rows:
+                loaded[('content', source_id, chunk_id)] = (content, page, source_id)
+                if prefix:
+                    loaded[('prefix', prefix, chunk_id)] = (content, page, source_id)
+        except Exception as e:
+            print(f"Error retrieving chunk content: {e}")
+        if cache is not None:
+            cache.put_many(loaded)
+        print(f"RAG: Loaded {len(loaded)} chunk texts ({len(found)} cached) for {len(matches)} matches")
+        found.update(loaded)
+        return found
+    
+    def _database_fallback(self, query, top_k, content_ids, query_embedding=None, scope=None):
+        """Search the scope's stored chunks when Pinecone finds nothing: by
+        vector over the local segments and quantized codes, else by keyword"""
+        print("RAG: No sources from Pinecone, trying database fallback...")
+        sources = []
+        try:
+            from documents.models import DocumentChunk
+            
+            # Get all chunks of the chat's documents, without their vectors
+            chunks = DocumentChunk.objects.filter(source_id__in=content_ids).only(
+                'source_id', 'chunk_id', 'content', 'page_number'
+            )
+            
+            if query_embedding is not None and any(query_embedding):
+                with metrics.stage('local_vector_search'):
+                    hits = self._local_vector_search(query_embedding, content_ids, top_k, scope)
+                with metrics.stage('hydrate'):
+                    found = chunks.in_bulk([chunk_id for chunk_id, _ in hits])
+                for chunk_id, score in hits:
+                    # A segment can still list a chunk deleted since it was written
+                    chunk = found.get(chunk_id)
+                    if chunk is None:
+                        continue
+                    sources.append(self._chunk_source(chunk, score))
+                if sources:
+                    print(f"RAG: Local vector search returned {len(sources)} sources")
+                    return sources
+            
+            print(f"RAG: Found {chunks.count()} chunks in database")
+            
+            # Simple text matching fallback
+            query_words = query.lower().split()
+            for chunk in chunks[:top_k]:  # Limit to top_k chunks
+                content_lower = chunk.content.lower()
+                # Check if any query words are in the content
+                if any(word in content_lower for word in query_words):
+                    # Default score for database fallback
+                    sources.append(self._chunk_source(chunk, 0.8))
+                    print(f"RAG: Added database source with {len(chunk.content)} chars")
+            
+            # If still no sources, just take the first few chunks
+            if not sources:
+                print("RAG: No matching chunks found, using first available chunks")
+                for chunk in chunks[:top_k]:
+                    # Lower score for non-matching chunks
+                    sources.append(self._chunk_source(chunk, 0.5))
+                    print(f"RAG: Added fallback source with {len(chunk.content)} chars")
+                    
+        except Exception as e:
+            print(f"Database fallback failed: {e}")
+            import traceback
+            traceback.print_exc()
+        return sources
+    
+    @staticmethod
+    def _chunk_source(chunk, score):
+        return {
+            'text': chunk.content, 'page': chunk.page_number, 'score': score,
+            'content_id': chunk.source_id, 'chunk_id': chunk.chunk_id,
+        }
+    
+    def _local_vector_search(self, query_embedding, content_ids, top_k, scope=None):
+        """[(chunk id, score)]: memory-mapped segments for ready contents (the
+        scope's packed segment plus newer ones), stored codes (with
+        full-precision rerank) for any still being processed"""
+        from documents.models import DocumentChunk, DocumentContent
+        from services import segments, vectors
+        ready = set(
+            DocumentContent.objects.filter(pk__in=content_ids, status=DocumentContent.STATUS_READY)
+            .values_list('id', flat=True)
+        )
+        store = segments.get_store()
+        if not ready:
+            hits = []
+        elif scope and scope.kind != scope.DOCUMENT:
+            hits = store.search_scope(query_embedding, scope, sorted(ready), top_k)
+        else:
+            hits = store.search(query_embedding, sorted(ready), top_k)
+        pending = [content_id for content_id in content_ids if content_id not in ready]
+        if pending:
+            hits += vectors.search(
+                query_embedding,
+                DocumentChunk.objects.filter(source_id__in=pending)
+                .values_list('id', 'vector', 'vector_dtype', 'vector_scale'),
+                top_k,
+                load_full=lambda ids: dict(
+                    DocumentChunk.objects.filter(id__in=ids).values_list('id', 'vector_full')
+                ),
+            )
+            hits = sorted(hits, key=lambda hit: -hit[1])[:top_k]
+        return hits
+    
+    # Async variants, used by the ASGI views (chat.async_views)
+    
+    @property
+    def async_llm_client(self):
+        if self._async_llm_client is None:
+            from huggingface_hub import AsyncInferenceClient
+            if settings.HF_BASE_URL:
+                self._async_llm_client = AsyncInferenceClient(base_url=settings.HF_BASE_URL, token=self.hf_token)
+            else:
+                self._async_llm_client = AsyncInferenceClient(model=self.model, token=self.hf_token)
+        return self._async_llm_client
+    
+    async def agenerate_embedding(self, text):
+        """Async version of generate_embedding"""
+        from services import embeddings
+        try:
+            with metrics.stage('embed'):
+                return (await embeddings.aembed_query(text)).tolist()
+        except Exception as e:
+            print(f"Embedding generation failed: {e}")
+            return None
+    
+    async def aretrieve_documents(self, query, top_k=3, chat_id=None, scope=None):
+        """Async version of retrieve_documents: network calls awaited, DB work in a thread"""
+        from services import retrieval_cache
+        from services.scopes import RetrievalScope
+        try:
+            scope = scope or (RetrievalScope.chat(chat_id) if chat_id else None)
+            cache = retrieval_cache.get_cache() if scope else None
+            version = None
+            if cache is not None:
+                with metrics.stage('retrieval_cache'):
+                    version = await sync_to_async(cache.version)(scope)
+                    cached = self._cached_sources(cache, scope, version, query, top_k)
+                if cached is not None:
+                    return cached
+            
+            from services.pinecone_service import PineconeService
+            with metrics.stage('pinecone_init'):
+                pinecone_service = await sync_to_async(PineconeService, thread_sensitive=False)()
+            
+            content_ids, legacy_prefixes = [], []
+            if scope:
+                with metrics.stage('scope'):
+                    content_ids, legacy_prefixes = await sync_to_async(scope.contents)()
+                if not content_ids:
+                    print(f"RAG: No documents in {scope.label}")
+                    return []
+            
+            sources = []
+            query_embedding = None
+            if pinecone_service.index:
+                query_embedding = await self.agenerate_embedding(query)
+                if cache is not None and query_embedding is not None:
+                    cached = self._cached_sources(cache, scope, version, query, top_k, query_embedding)
+                    if cached is not None:
+                        return cached
+            if query_embedding is not None:
+                with metrics.stage('vector_query'):
+                    results = await pinecone_service.aquery_vectors(
+                        query_embedding, top_k,
+                        filter=scope.vector_filter(content_ids, legacy_prefixes) if scope else None
+                    )
+                print(f"RAG: Pinecone returned {len(results)} results")
+                sources = await sync_to_async(self._sources_from_matches)(results, scope, content_ids, legacy_prefixes)
+            
+            if not sources and scope:
+                if not pinecone_service.index:
+                    query_embedding = await self.agenerate_embedding(query)
+                sources = await sync_to_async(self._database_fallback)(
+                    query, top_k, content_ids, query_embedding, scope
+                )
+            
+            self._cache_sources(cache, scope, version, query, top_k, sources, query_embedding)
+            print(f"RAG: Returning {len(sources)} valid sources")
+            return sources
+        except Exception as e:
+            print(f"Document retrieval failed: {e}")
+            return []
+    
+    async def astream_response(self, message, conversation_history=None, summary=None, sources=None, usage=None,
+                               max_tokens=None):
+        """Yield response text deltas as they are generated.
+
+        If a dict is passed as usage, the (estimated) prompt_tokens and
+        completion_tokens are set in it once the stream ends.
+        """
+        messages, stats = self.prompt_builder.build(message, conversation_history, summary, sources)
+        print(f"AI: Prompt built in {stats['build_ms']:.2f} ms: "
+              f"{stats['messages']} messages, ~{stats['prompt_tokens']} tokens")
+        generated = []
+        try:
+            stream = await self.async_llm_client.chat_completion(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens or settings.LLM_MAX_TOKENS,
+                temperature=0.4,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    generated.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"Streaming chat completion failed: {e}")
+            fallback = self._generate_fallback_response(message, conversation_history)
+            generated.append(fallback)
+            yield fallback
+        if usage is not None:
+            usage['prompt_tokens'] = stats['prompt_tokens']
+            usage['completion_tokens'] = estimate_tokens(''.join(generated))
+    
+    async def agenerate_response(self, message, conversation_history=None, summary=None, sources=None,
+                                 max_tokens=None):
+        """Async version of generate_response"""
+        messages, stats = self.prompt_builder.build(message, conversation_history, summary, sources)
+        print(f"AI: Prompt built in {stats['build_ms']:.2f} ms: "
+              f"{stats['messages']} messages, ~{stats['prompt_tokens']} tokens")
+        try:
+            with metrics.stage('llm'):
+                resp = await self.async_llm_client.chat_completion(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens or settings.LLM_MAX_TOKENS,
+                    temperature=0.4,
+                    stream=False
+                )
+            if hasattr(resp, 'choices') and len(resp.choices) > 0:
+                response = resp.choices[0].message.content
+                print(f"AI: Generated response: {response[:100]}...")
+                self._note_usage(stats, response, getattr(resp, 'usage', None))
+                return response
+            print(f"AI: Unexpected response format: {resp}")
+            return str(resp)
+        except Exception as e:
+            print(f"Async chat completion failed: {e}")
+            return self._generate_fallback_response(message, conversation_history)
@@ -0,0 +1,233 @@
+import atexit
+import os
+import threading
+from django.conf import settings
+from django.utils import timezone
+
+# Cache-hit flags that summarize() reports a hit rate for
+CACHE_FLAGS = ('query_embedding', 'retrieval')
+
+
+class InteractionRecorder:
+    """Buffers AIInteraction records per worker process and writes them in bulk.
+
+    record() only appends to a list, so the request path never waits on an
+    INSERT. A daemon thread writes the buffer with one bulk_create when it
+    reaches flush_size records or every `interval` seconds, and whatever is
+    left is written at interpreter exit. A failed write keeps the records
+    for the next attempt, up to max_buffered; past that, new records are
+    dropped and counted.
+    """
+
+    def __init__(self, flush_size=None, interval=None, max_buffered=None):
+        self.flush_size = flush_size or settings.ANALYTICS_FLUSH_SIZE
+        self.interval = interval or settings.ANALYTICS_FLUSH_INTERVAL
+        self.max_buffered = max_buffered or settings.ANALYTICS_MAX_BUFFERED
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        """Start the flush thread lazily (and again after a fork)"""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Records buffered before a fork are the parent's to write
+                self._buffer = []
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+            self._thread.start()
+
+    def record(self, **fields):
+        """Buffer one interaction (AIInteraction field values); never blocks on the database"""
+        self._ensure_started()
+        fields.setdefault('created_at', timezone.now())
+        with self._lock:
+            if len(self._buffer) >= self.max_buffered:
+                self.dropped += 1
+                return False
+            self._buffer.append(fields)
+            full = len(self._buffer) >= self.flush_size
+        if full:
+            self._wake.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records now; returns how many were written"""
+        from ai.models import AIInteraction
+        from django.db import connection
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            try:
+                AIInteraction.objects.bulk_create(
+                    [AIInteraction(**fields) for fields in rows], batch_size=500
+                )
+            except Exception as e:
+                print(f"Analytics: writing {len(rows)} interactions failed: {e}")
+                # This thread's connection may be broken; reconnect next time
+                connection.close()
+                with self._lock:
+                    self.failures += 1
+                    keep = max(0, self.max_buffered - len(self._buffer))
+                    self.dropped += max(0, len(rows) - keep)
+                    self._buffer[:0] = rows[:keep]
+                return 0
+            with self._lock:
+                self.written += len(rows)
+                self.flushes += 1
+            return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': len(self._buffer),
+                'written': self.written,
+                'flushes': self.flushes,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                'flush_size': self.flush_size,
+                'interval_s': self.interval,
+            }
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """The process-wide InteractionRecorder"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = InteractionRecorder()
+    return _recorder
+
+
+def record_interaction(query, response, sources, processing_time, endpoint, chat_id='', use_rag=True,
+                       stage_timings=None, notes=None):
+    """Buffer an AIInteraction for a chat turn.
+
+    stage_timings and notes are the request's metrics.current() and
+    metrics.notes(): the route, token counts and '<name>_cache' hit flags
+    come from the notes. Sources are stored as page and score only; their text is already
+    in the chunks table.
+    """
+    if not settings.ANALYTICS_ENABLED:
+        return False
+    notes = notes or {}
+    return get_recorder().record(
+        user_query=query,
+        ai_response=response,
+        sources_used=[{'page': s.get('page'), 'score': s.get('score')} for s in sources or []],
+        processing_time=processing_time,
+        endpoint=endpoint,
+        chat_id=chat_id or '',
+        use_rag=bool(use_rag),
+        route=notes.get('route') or '',
+        prompt_tokens=notes.get('prompt_tokens'),
+        completion_tokens=notes.get('completion_tokens'),
+        stage_timings={name: round(ms, 2) for name, ms in (stage_timings or {}).items()},
+        cache_hits={name[:-len('_cache')]: hit for name, hit in notes.items() if name.endswith('_cache')},
+    )
+
+
+def _percentiles(queryset, count, pcts=(50, 95, 99)):
+    """processing_time percentiles in ms; one indexed ORDER BY ... OFFSET 1 query each"""
+    values = queryset.order_by('processing_time').values_list('processing_time', flat=True)
+    return {
+        f'p{pct}': round(values[min(count - 1, count * pct // 100)] * 1000, 1)
+        for pct in pcts
+    }
+
+
+def summarize(since, until=None, bucket='hour', endpoint=None):
+    """Latency percentiles, throughput and token / cache figures for [since, until).
+
+    Everything is computed in the database over the (created_at,
+    processing_time) index: aggregates for the window and per endpoint, one
+    offset query per percentile, and counts per `bucket` ('minute', 'hour'
+    or 'day') for throughput over time.
+    """
+    from django.db.models import Avg, Count, Max, Sum
+    from django.db.models.functions import Trunc
+    from ai.models import AIInteraction
+
+    until = until or timezone.now()
+    window = AIInteraction.objects.filter(created_at__gte=since, created_at__lt=until)
+    if endpoint:
+        window = window.filter(endpoint=endpoint)
+    totals = window.aggregate(
+        count=Count('id'), mean=Avg('processing_time'), max=Max('processing_time'),
+        prompt_tokens=Sum('prompt_tokens'), completion_tokens=Sum('completion_tokens'),
+    )
+    count = totals['count']
+    seconds = max((until - since).total_seconds(), 1e-9)
+    summary = {
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'interactions': count,
+        'per_minute': round(count * 60 / seconds, 3),
+        'latency_ms': {},
+        'tokens': {'prompt': totals['prompt_tokens'] or 0, 'completion': totals['completion_tokens'] or 0},
+        'cache_hit_rate': {},
+        'endpoints': {},
+        'routes': {},
+        'buckets': [],
+    }
+    if not count:
+        return summary
+    summary['latency_ms'] = {
+        'mean': round(totals['mean'] * 1000, 1),
+        **_percentiles(window, count),
+        'max': round(totals['max'] * 1000, 1),
+    }
+    for flag in CACHE_FLAGS:
+        seen = window.filter(cache_hits__has_key=flag).count()
+        if seen:
+            hits = window.filter(**{f'cache_hits__{flag}': True}).count()
+            summary['cache_hit_rate'][flag] = round(hits / seen, 4)
+    for row in window.values('endpoint').annotate(count=Count('id'), mean=Avg('processing_time')).order_by('endpoint'):
+        summary['endpoints'][row['endpoint'] or '-'] = {
+            'interactions': row['count'], 'mean_ms': round(row['mean'] * 1000, 1),
+        }
+    for row in window.values('route').annotate(
+        count=Count('id'), mean=Avg('processing_time'), completion=Avg('completion_tokens'),
+    ).order_by('route'):
+        summary['routes'][row['route'] or '-'] = {
+            'interactions': row['count'], 'mean_ms': round(row['mean'] * 1000, 1),
+            'mean_completion_tokens': round(row['completion'], 1) if row['completion'] is not None else None,
+        }
+    per_bucket = (
+        window.annotate(bucket=Trunc('created_at', bucket))
+        .values('bucket')
+        .annotate(count=Count('id'), mean=Avg('processing_time'), max=Max('processing_time'))
+        .order_by('bucket')
+    )
+    summary['buckets'] = [{
+        'start': row['bucket'].isoformat(),
+        'interactions': row['count'],
+        'mean_ms': round(row['mean'] * 1000, 1),
+        'max_ms': round(row['max'] * 1000, 1),
+    } for row in per_bucket]
+    return summary
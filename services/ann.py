@@ -0,0 +1,63 @@
+import math
+import numpy as np
+
+ASSIGN_BLOCK = 16384  # rows scored against the centroids at a time
+
+
+def default_lists(rows):
+    """Inverted lists for an index of `rows` vectors: ~4 * sqrt(rows)"""
+    return max(1, int(4 * math.sqrt(rows)))
+
+
+def assign(matrix, centroids):
+    """Nearest centroid (by inner product) of every row"""
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BLOCK):
+        block = np.asarray(matrix[start:start + ASSIGN_BLOCK], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train(matrix, lists, iterations=10, sample_per_list=64, seed=0):
+    """Centroids for an inverted-file index: spherical k-means over a sample
+    of the (normalised) rows"""
+    rng = np.random.default_rng(seed)
+    rows = len(matrix)
+    lists = min(lists, rows)
+    sample_size = min(rows, lists * sample_per_list)
+    picked = np.sort(rng.choice(rows, sample_size, replace=False))
+    sample = np.asarray(matrix[picked], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        order, offsets = layout(labels, lists)
+        counts = np.diff(offsets)
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        # Per-list sums of the rows, grouped by list
+        sums[~empty] = np.add.reduceat(sample[order], offsets[:-1][~empty], axis=0)
+        # Re-seed empty lists with random sample rows
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+    return centroids
+
+
+def layout(labels, lists):
+    """(row order grouping rows by list, offsets): list l holds rows
+    order[offsets[l]:offsets[l + 1]]"""
+    order = np.argsort(labels, kind='stable')
+    offsets = np.zeros(lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=lists), out=offsets[1:])
+    return order, offsets
+
+
+def probe(query, centroids, offsets, nprobe):
+    """[(start, stop)] row ranges of the nprobe lists nearest the query"""
+    nprobe = min(nprobe, len(centroids))
+    scores = centroids @ query
+    if nprobe < len(centroids):
+        nearest = np.argpartition(-scores, nprobe - 1)[:nprobe]
+    else:
+        nearest = np.arange(len(centroids))
+    return [(int(offsets[l]), int(offsets[l + 1])) for l in nearest if offsets[l + 1] > offsets[l]]
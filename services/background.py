@@ -0,0 +1,47 @@
+import os
+import queue
+import threading
+
+
+class BackgroundWorker:
+    """Daemon thread that runs queued jobs off the request path"""
+
+    def __init__(self, name, maxsize=0):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the worker thread lazily (and again after a fork)"""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a job; returns False if the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+            return True
+        except queue.Full:
+            print(f"{self.name}: queue full, dropping job {getattr(fn, '__name__', fn)}")
+            return False
+
+    def _run(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"{self.name}: job {getattr(fn, '__name__', fn)} failed: {e}")
+                import traceback
+                traceback.print_exc()
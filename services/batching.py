@@ -0,0 +1,156 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from . import metrics
+
+
+class _Request:
+    def __init__(self, items):
+        self.items = items
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.wait_ms = 0.0
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+
+
+class MicroBatcher:
+    """Runs concurrent calls of run(items) -> results as shared batched calls.
+
+    Callers on any thread (call) or event loop (acall) queue their items; a
+    worker takes the first queued request, keeps collecting for up to
+    window_ms or until max_batch items, then makes one run() call over all
+    of them and hands each caller its slice of the results. With window_ms=0
+    only what is already queued joins the batch. Up to `workers` batches are
+    in flight at once.
+    """
+
+    def __init__(self, run, name, max_batch=None, window_ms=0.0, workers=1, history=1000):
+        self.run = run
+        self.name = name
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._collect_lock = threading.Lock()
+        self._carry = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        # Recent batch sizes and queue waits, for stats()
+        self._sizes = deque(maxlen=history)
+        self._waits = deque(maxlen=history)
+        self._batches = 0
+        self._items = 0
+
+    def _ensure_workers(self):
+        """Start the worker threads lazily (and again after a fork)"""
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            if self._pid != os.getpid():
+                # Requests queued in the parent belong to threads that don't exist here
+                self._queue = queue.Queue()
+                self._carry = None
+                self._threads = []
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._serve, name=f'{self.name}-batcher-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        """The next batch of requests; one worker collects at a time"""
+        with self._collect_lock:
+            first, self._carry = self._carry or self._queue.get(), None
+            batch, size = [first], len(first.items)
+            deadline = time.perf_counter() + self.window
+            while self.max_batch is None or size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if self.max_batch is not None and size + len(request.items) > self.max_batch:
+                    self._carry = request  # starts the next batch
+                    break
+                batch.append(request)
+                size += len(request.items)
+            return batch, size
+
+    def _serve(self):
+        while True:
+            batch, size = self._collect()
+            dispatched = time.perf_counter()
+            items = []
+            for request in batch:
+                request.wait_ms = (dispatched - request.submitted) * 1000
+                items.extend(request.items)
+            with self._lock:
+                self._batches += 1
+                self._items += size
+                self._sizes.append(size)
+                self._waits.extend(request.wait_ms for request in batch)
+            try:
+                results = self.run(items)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            start = 0
+            for request in batch:
+                request.future.set_result(results[start:start + len(request.items)])
+                start += len(request.items)
+
+    def submit(self, items):
+        """Queue items; the returned Future resolves to their results"""
+        self._ensure_workers()
+        request = _Request(list(items))
+        self._queue.put(request)
+        return request
+
+    def call(self, items):
+        request = self.submit(items)
+        try:
+            return request.future.result()
+        finally:
+            metrics.record(f'{self.name}_queue', request.wait_ms)
+
+    async def acall(self, items):
+        request = self.submit(items)
+        try:
+            return await asyncio.wrap_future(request.future)
+        finally:
+            metrics.record(f'{self.name}_queue', request.wait_ms)
+
+    def stats(self):
+        """Batch sizes and queue waits over the recent history of this process"""
+        with self._lock:
+            sizes, waits = list(self._sizes), list(self._waits)
+            batches, items = self._batches, self._items
+        return {
+            'batches': batches,
+            'items': items,
+            'mean_batch_size': round(items / batches, 2) if batches else None,
+            'batch_size': {'p50': _percentile(sizes, 50), 'p95': _percentile(sizes, 95),
+                           'max': max(sizes) if sizes else None},
+            'queue_wait_ms': {'p50': _percentile(waits, 50), 'p95': _percentile(waits, 95),
+                              'max': round(max(waits), 2) if waits else None},
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'workers': self.workers,
+        }
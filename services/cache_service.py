@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCache:
+    """Versioned cache for read endpoints.
+
+    Each cached entry is keyed by the current version of every scope it
+    depends on (e.g. a user's chat list, a chat's documents). Writers bump
+    the scope version instead of deleting keys, so stale entries are never
+    served and simply age out of the backend.
+    """
+
+    def __init__(self, alias=None, timeout=None):
+        self.cache = caches[alias or settings.RESPONSE_CACHE_ALIAS]
+        self.timeout = timeout if timeout is not None else settings.RESPONSE_CACHE_TIMEOUT
+
+    @staticmethod
+    def _version_key(scope):
+        return 'ver:%s:%s' % scope
+
+    def versions(self, scopes):
+        """Current version for each (kind, id) scope, initialising missing ones"""
+        keys = [self._version_key(scope) for scope in scopes]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                # add() keeps a concurrent bump from being overwritten
+                self.cache.add(key, 1, None)
+                found[key] = self.cache.get(key, 1)
+        return [found[key] for key in keys]
+
+    def bump(self, *scopes):
+        """Invalidate everything cached under the given scopes"""
+        for scope in scopes:
+            key = self._version_key(scope)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 2, None)
+
+    def get_or_build(self, name, scopes, builder, key=''):
+        """Return the cached value for name (+ key) under scopes, building it on a miss"""
+        versions = self.versions(scopes)
+        key = 'resp:%s:%s:%s' % (name, key, ':'.join(
+            '%s-%s-v%s' % (kind, ident, version)
+            for (kind, ident), version in zip(scopes, versions)
+        ))
+        value = self.cache.get(key)
+        if value is not None:
+            self._count(name, 'hits')
+            return value
+        self._count(name, 'misses')
+        value = builder()
+        self.cache.set(key, value, self.timeout)
+        return value
+
+    def _count(self, name, outcome):
+        key = 'stats:%s:%s' % (name, outcome)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            if not self.cache.add(key, 1, None):
+                self.cache.incr(key)
+
+    def stats(self, names):
+        """Hit/miss counters and hit rate per endpoint name"""
+        keys = ['stats:%s:%s' % (name, outcome) for name in names for outcome in ('hits', 'misses')]
+        counters = self.cache.get_many(keys)
+        result = {}
+        for name in names:
+            hits = counters.get('stats:%s:hits' % name, 0)
+            misses = counters.get('stats:%s:misses' % name, 0)
+            total = hits + misses
+            result[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / total, 4) if total else None,
+            }
+        return result
+
+
+def user_scope(user_id):
+    return ('user', user_id)
+
+
+def chat_scope(chat_id):
+    return ('chat', chat_id)
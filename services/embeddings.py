@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import os
+import threading
+import numpy as np
+from django.conf import settings
+from . import metrics
+from .batching import MicroBatcher
+from .shared_cache import SharedVectorCache
+
+
+class EmbeddingError(Exception):
+    """The backend couldn't embed the texts; callers must not index a stand-in vector"""
+
+
+def _as_matrix(result, count):
+    """(count, dim) float32 array from a feature-extraction response"""
+    matrix = np.asarray(result, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    if matrix.ndim != 2 or matrix.shape[0] != count:
+        raise EmbeddingError(f"Unexpected embedding shape {matrix.shape} for {count} texts")
+    return matrix
+
+
+class HFEmbeddingBackend:
+    """Hosted feature-extraction over HTTP (Inference API or a TEI endpoint)"""
+
+    name = 'hf'
+
+    def __init__(self):
+        from huggingface_hub import AsyncInferenceClient, InferenceClient
+        model = settings.HF_EMBEDDING_URL or settings.EMBEDDING_MODEL
+        self.client = InferenceClient(model=model, token=settings.HF_TOKEN)
+        self.async_client = AsyncInferenceClient(model=model, token=settings.HF_TOKEN)
+
+    def embed(self, texts):
+        try:
+            # A list input is embedded in one request
+            return _as_matrix(self.client.feature_extraction(texts if len(texts) > 1 else texts[0]), len(texts))
+        except EmbeddingError:
+            raise
+        except Exception as e:
+            raise EmbeddingError(f"Feature extraction failed: {e}") from e
+
+    async def aembed(self, texts):
+        try:
+            result = await self.async_client.feature_extraction(texts if len(texts) > 1 else texts[0])
+            return _as_matrix(result, len(texts))
+        except EmbeddingError:
+            raise
+        except Exception as e:
+            raise EmbeddingError(f"Feature extraction failed: {e}") from e
+
+
+class OnnxEmbeddingBackend:
+    """The embedding model run in-process with ONNX Runtime on CPU.
+
+    Loads a sentence-transformers ONNX export (by default the int8-quantized
+    one published in the EMBEDDING_MODEL repository) once per process.
+    Concurrent calls are coalesced by a single-worker MicroBatcher, so
+    simultaneous uploads and queries share session runs instead of competing
+    for the CPU threads.
+    """
+
+    name = 'onnx'
+
+    def __init__(self):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise EmbeddingError(
+                "EMBEDDING_BACKEND=onnx needs the onnxruntime and tokenizers packages"
+            ) from e
+        model_path, tokenizer_path = self._resolve_files()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.EMBEDDING_THREADS:
+            options.intra_op_num_threads = settings.EMBEDDING_THREADS
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(settings.EMBEDDING_MAX_LENGTH)
+        if self.tokenizer.padding is None:
+            pad = next((t for t in ('<pad>', '[PAD]') if self.tokenizer.token_to_id(t) is not None), None)
+            self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad) if pad else 0, pad_token=pad or '[PAD]')
+        # Whatever queued up while the last run was busy goes in the next one
+        self._batcher = MicroBatcher(self._run, 'onnx')
+        print(f"Embeddings: loaded {model_path} "
+              f"({settings.EMBEDDING_THREADS or 'default'} threads)")
+
+    @staticmethod
+    def _resolve_files():
+        """(model, tokenizer) paths: EMBEDDING_ONNX_MODEL_DIR, else the hub cache"""
+        if settings.EMBEDDING_ONNX_MODEL_DIR:
+            directory = settings.EMBEDDING_ONNX_MODEL_DIR
+            return os.path.join(directory, settings.EMBEDDING_ONNX_FILE), os.path.join(directory, 'tokenizer.json')
+        from huggingface_hub import hf_hub_download
+        return (
+            hf_hub_download(settings.EMBEDDING_MODEL, settings.EMBEDDING_ONNX_FILE),
+            hf_hub_download(settings.EMBEDDING_MODEL, 'tokenizer.json'),
+        )
+
+    def _run(self, texts):
+        """Embed texts in batches of similar length, so padding stays small"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        rows = [None] * len(texts)
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(order), batch_size):
+            picked = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in picked])
+            ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {'input_ids': ids, 'attention_mask': mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.zeros_like(ids)
+            hidden = self.session.run(None, feeds)[0]
+            if hidden.ndim == 3:
+                # Mean pooling over real tokens, as sentence-transformers does
+                weights = mask[:, :, None].astype(np.float32)
+                hidden = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+            hidden = hidden / np.maximum(np.linalg.norm(hidden, axis=1, keepdims=True), 1e-12)
+            for row, i in zip(hidden, picked):
+                rows[i] = row
+        return np.vstack(rows).astype(np.float32)
+
+    def embed(self, texts):
+        try:
+            return self._batcher.call(texts)
+        except Exception as e:
+            raise EmbeddingError(f"Local embedding failed: {e}") from e
+
+    async def aembed(self, texts):
+        try:
+            return await self._batcher.acall(texts)
+        except Exception as e:
+            raise EmbeddingError(f"Local embedding failed: {e}") from e
+
+
+BACKENDS = {
+    'hf': HFEmbeddingBackend,
+    'onnx': OnnxEmbeddingBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured embedding backend, created once per process"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                with metrics.stage('embedding_init'):
+                    _backend = BACKENDS[settings.EMBEDDING_BACKEND]()
+    return _backend
+
+
+_query_batcher = None
+
+
+def get_query_batcher():
+    """Micro-batcher for query embeddings, or None when EMBEDDING_QUERY_BATCH_MAX is 0"""
+    global _query_batcher
+    if _query_batcher is None and settings.EMBEDDING_QUERY_BATCH_MAX:
+        with _backend_lock:
+            if _query_batcher is None:
+                _query_batcher = MicroBatcher(
+                    lambda texts: get_backend().embed(texts),
+                    'embed',
+                    max_batch=settings.EMBEDDING_QUERY_BATCH_MAX,
+                    window_ms=settings.EMBEDDING_QUERY_BATCH_WINDOW_MS,
+                    workers=settings.EMBEDDING_QUERY_BATCH_WORKERS,
+                )
+    return _query_batcher
+
+
+_query_cache = None
+
+
+def model_fingerprint():
+    """Identifies the vectors the configured backend produces"""
+    parts = [settings.EMBEDDING_BACKEND, settings.EMBEDDING_MODEL]
+    if settings.EMBEDDING_BACKEND == 'onnx':
+        parts += [settings.EMBEDDING_ONNX_MODEL_DIR, settings.EMBEDDING_ONNX_FILE, str(settings.EMBEDDING_MAX_LENGTH)]
+    else:
+        parts.append(settings.HF_EMBEDDING_URL or '')
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:12]
+
+
+def get_query_cache():
+    """Query-embedding cache shared by all workers on the host, or None when
+    EMBEDDING_CACHE_SLOTS is 0. One file per model, so a model change starts cold."""
+    global _query_cache
+    if _query_cache is None and settings.EMBEDDING_CACHE_SLOTS:
+        with _backend_lock:
+            if _query_cache is None:
+                path = os.path.join(settings.WARM_STATE_DIR, f'query-embeddings-{model_fingerprint()}.bin')
+                _query_cache = SharedVectorCache(path, settings.EMBEDDING_CACHE_SLOTS)
+    return _query_cache
+
+
+def embed_query(text):
+    """Embedding of one query: from the shared cache, else batched with concurrent queries"""
+    cache = get_query_cache()
+    vector = cache.get(text) if cache is not None else None
+    if cache is not None:
+        metrics.note('query_embedding_cache', vector is not None)
+    if vector is not None:
+        return vector
+    backend = get_backend()
+    batcher = get_query_batcher()
+    if batcher is None:
+        vector = backend.embed([text])[0]
+    else:
+        vector = batcher.call([text])[0]
+    if cache is not None:
+        cache.put(text, vector)
+    return vector
+
+
+async def aembed_query(text):
+    cache = get_query_cache()
+    vector = cache.get(text) if cache is not None else None
+    if cache is not None:
+        metrics.note('query_embedding_cache', vector is not None)
+    if vector is not None:
+        return vector
+    backend = await asyncio.to_thread(get_backend)
+    batcher = get_query_batcher()
+    if batcher is None:
+        vector = (await backend.aembed([text]))[0]
+    else:
+        vector = (await batcher.acall([text]))[0]
+    if cache is not None:
+        cache.put(text, vector)
+    return vector
@@ -0,0 +1,56 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Per-request stage timings in milliseconds; a ContextVar so it follows the
+# request across threads (sync_to_async) and asyncio tasks.
+_timings = contextvars.ContextVar('stage_timings', default=None)
+# Other per-request facts for analytics (token counts, cache hits), same scope
+_notes = contextvars.ContextVar('request_notes', default=None)
+
+
+def begin():
+    """Start collecting stage timings for the current request"""
+    return _timings.set({}), _notes.set({})
+
+
+def end(token):
+    """Stop collecting and return the timings gathered since begin()"""
+    timings_token, notes_token = token
+    timings = _timings.get() or {}
+    _timings.reset(timings_token)
+    _notes.reset(notes_token)
+    return timings
+
+
+def current():
+    """Timings recorded so far in this request (empty outside a request)"""
+    return dict(_timings.get() or {})
+
+
+def notes():
+    """Notes recorded so far in this request (empty outside a request)"""
+    return dict(_notes.get() or {})
+
+
+def note(name, value):
+    """Attach a fact about the current request, e.g. note('prompt_tokens', 812)"""
+    current_notes = _notes.get()
+    if current_notes is not None:
+        current_notes[name] = value
+
+
+def record(name, elapsed_ms):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + elapsed_ms
+
+
+@contextmanager
+def stage(name):
+    """Time a block and add it to the current request's breakdown"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
@@ -1,9 +1,11 @@
+import asyncio
 from django.conf import settings
-from pinecone import Pinecone
 
 class PineconeService:
     """Service for Pinecone vector database operations"""
     
+    _hosts = {}
+    
     def __init__(self):
         self.api_key = settings.PINECONE_API_KEY
         self.index_name = settings.PINECONE_INDEX_NAME
@@ -18,32 +20,41 @@ class PineconeService:
                 print("Pinecone credentials not configured")
                 self.index = None
                 return
-            # Use new Pinecone API
+            # Use new Pinecone API (imported here: the client library is slow to load)
+            from pinecone import Pinecone
             self.pc = Pinecone(api_key=self.api_key)
-            self.index = self.pc.Index(self.index_name)
+            if settings.PINECONE_HOST:
+                self.index = self.pc.Index(host=settings.PINECONE_HOST)
+            else:
+                self.index = self.pc.Index(self.index_name)
         except Exception as e:
             print(f"Pinecone initialization failed: {e}")
             self.index = None
     
     def upsert_vectors(self, vectors):
-        """Upsert vectors to Pinecone"""
+        """Upsert (id, values, metadata) vectors to Pinecone"""
         if not self.index:
             return False
+        from services.vectors import payload_values
         try:
-            self.index.upsert(vectors=vectors)
+            self.index.upsert(vectors=[
+                (vector_id, payload_values(values), metadata) for vector_id, values, metadata in vectors
+            ])
             return True
         except Exception as e:
             print(f"Pinecone upsert failed: {e}")
             return False
     
-    def query_vectors(self, query_vector, top_k=5):
-        """Query vectors from Pinecone"""
+    def query_vectors(self, query_vector, top_k=5, filter=None):
+        """Query vectors from Pinecone, optionally restricted by a metadata filter"""
         if not self.index:
             return []
+        from services.vectors import payload_values
         try:
             results = self.index.query(
-                vector=query_vector,
+                vector=payload_values(query_vector),
                 top_k=top_k,
+                filter=filter,
                 include_metadata=True
             )
             return results.matches
@@ -51,6 +62,38 @@ class PineconeService:
             print(f"Pinecone query failed: {e}")
             return []
     
+    async def aquery_vectors(self, query_vector, top_k=5, filter=None):
+        """Query vectors with Pinecone's asyncio client"""
+        if not self.index:
+            return []
+        from services.vectors import payload_values
+        try:
+            host = await asyncio.to_thread(self._index_host)
+            async with self.pc.IndexAsyncio(host=host) as index:
+                results = await index.query(
+                    vector=payload_values(query_vector),
+                    top_k=top_k,
+                    filter=filter,
+                    include_metadata=True
+                )
+            return results.matches
+        except (ImportError, AttributeError):
+            # Older SDK or pinecone[asyncio] extra missing: run the sync client in a thread
+            return await asyncio.to_thread(self.query_vectors, query_vector, top_k, filter)
+        except Exception as e:
+            print(f"Pinecone async query failed: {e}")
+            return []
+    
+    def _index_host(self):
+        """Data-plane host of the index, resolved once per process"""
+        if settings.PINECONE_HOST:
+            return settings.PINECONE_HOST
+        host = PineconeService._hosts.get(self.index_name)
+        if not host:
+            host = self.pc.describe_index(self.index_name).host
+            PineconeService._hosts[self.index_name] = host
+        return host
+    
     def delete_vectors(self, ids):
         """Delete vectors from Pinecone"""
         if not self.index:
@@ -0,0 +1,100 @@
+import threading
+from django.conf import settings
+from .background import BackgroundWorker
+
+
+class RetrievalPrefetcher:
+    """Speculative retrieval of drafts the user is still typing.
+
+    Each client has at most one draft waiting; a newer draft replaces it, so
+    superseded drafts are never retrieved, and sending the message cancels
+    it. Drafts are retrieved one at a time per process on a background
+    thread (at most max_queued waiting across clients, the rest dropped), so
+    prefetching can't add more than one retrieval's worth of load per worker.
+    Results land in the query-embedding and retrieval caches, where the
+    message sent a moment later finds them.
+    """
+
+    def __init__(self, max_queued):
+        self._worker = BackgroundWorker('retrieval-prefetch', maxsize=max_queued)
+        self._pending = {}  # client ident -> (scope, draft, top_k)
+        self._lock = threading.Lock()
+        self._ai_service = None
+        self.submitted = 0
+        self.superseded = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.completed = 0
+
+    def submit(self, ident, scope, draft, top_k=3):
+        """Queue the client's latest draft: 'queued', 'replaced' (a waiting
+        draft was superseded by this one) or 'dropped' (queue full)"""
+        with self._lock:
+            self.submitted += 1
+            replaced = ident in self._pending
+            self._pending[ident] = (scope, draft, top_k)
+            if replaced:
+                self.superseded += 1
+                return 'replaced'
+        if self._worker.submit(self._run, ident):
+            return 'queued'
+        with self._lock:
+            self._pending.pop(ident, None)
+            self.dropped += 1
+        return 'dropped'
+
+    def cancel(self, ident):
+        """Forget the client's waiting draft, if any (a retrieval already
+        running is left to finish)"""
+        with self._lock:
+            if self._pending.pop(ident, None) is not None:
+                self.cancelled += 1
+                return True
+        return False
+
+    def _run(self, ident):
+        from django.db import close_old_connections
+        with self._lock:
+            job = self._pending.pop(ident, None)
+        if job is None:
+            return  # cancelled
+        scope, draft, top_k = job
+        if self._ai_service is None:
+            from .ai_service import AIService
+            self._ai_service = AIService()
+        close_old_connections()
+        try:
+            self._ai_service.retrieve_documents(draft, top_k=top_k, scope=scope)
+            self.completed += 1
+        finally:
+            close_old_connections()
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'superseded': self.superseded,
+            'cancelled': self.cancelled,
+            'dropped': self.dropped,
+            'completed': self.completed,
+            'waiting': len(self._pending),
+        }
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """The process's prefetcher, or None when PREFETCH_ENABLED is off"""
+    global _prefetcher
+    if _prefetcher is None and settings.PREFETCH_ENABLED:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = RetrievalPrefetcher(settings.PREFETCH_MAX_QUEUED)
+    return _prefetcher
+
+
+def cancel(ident):
+    """Drop a client's waiting draft: its message is being sent"""
+    if _prefetcher is not None:
+        _prefetcher.cancel(ident)
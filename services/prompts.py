@@ -0,0 +1,70 @@
+import time
+
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant. When excerpts from the user's uploaded "
+    "documents are provided, answer from them and cite them as [Source N]."
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+class PromptBuilder:
+    """Builds role-separated chat messages with a stable prefix.
+
+    Layout, from most to least stable so provider-side prefix caching can
+    reuse as much as possible between turns:
+
+        system     fixed instructions (identical for every request)
+        system     summary of earlier turns (changes only when memory updates)
+        user/asst  recent turns, oldest first (append-only between turns)
+        user       document excerpts for this question + the question itself
+    """
+
+    def __init__(self, system_prompt=SYSTEM_PROMPT):
+        self.system_prompt = system_prompt
+
+    def build(self, message, history=None, summary=None, sources=None):
+        """Return (messages, stats) for a chat_completion call"""
+        started = time.perf_counter()
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+
+        history = list(history or [])
+        # The current message is saved before generation; don't send it twice
+        if history and history[-1]['role'] == 'user' and history[-1]['content'] == message:
+            history.pop()
+        for msg in history:
+            role = "user" if msg['role'] == 'user' else "assistant"
+            messages.append({"role": role, "content": msg['content']})
+
+        messages.append({"role": "user", "content": self._user_turn(message, sources)})
+
+        stats = {
+            'messages': len(messages),
+            'prompt_tokens': sum(estimate_tokens(m['content']) for m in messages),
+            'build_ms': (time.perf_counter() - started) * 1000,
+        }
+        return messages, stats
+
+    def _user_turn(self, message, sources):
+        excerpts = [source.get('text', '') for source in sources or [] if source.get('text')]
+        if not excerpts:
+            return message
+        context = "\n\n".join(f"[Source {i+1}]: {text}" for i, text in enumerate(excerpts))
+        return f"Relevant excerpts from my uploaded documents:\n{context}\n\nQuestion: {message}"
+
+    @staticmethod
+    def flatten(messages):
+        """Render messages as a plain transcript for text-generation endpoints"""
+        lines = []
+        for msg in messages:
+            if msg['role'] == 'system':
+                lines.append(msg['content'])
+            else:
+                role = "Human" if msg['role'] == 'user' else "Assistant"
+                lines.append(f"{role}: {msg['content']}")
+        return "\n\n".join(lines) + "\n\nAssistant:"
@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from .cache_service import ResponseCache
+
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(query):
+    """Cache key form of a query: case, punctuation and spacing don't matter"""
+    return _SPACES.sub(' ', _PUNCTUATION.sub(' ', query.casefold())).strip()
+
+
+class RetrievalCache:
+    """In-process LRU of retrieved (hydrated) sources per retrieval scope.
+
+    Entries are keyed by the scope, its index version, top_k and the
+    normalised query, so a repeated question (a follow-up, a regeneration)
+    skips embedding, vector search and hydration. A differently worded query
+    whose embedding is at least `similarity` cosine-close to a cached one in
+    the same scope is a hit too, after its (usually cached) embedding.
+
+    Index versions live in the default Django cache, like ResponseCache's:
+    ingesting into or deleting from a scope bumps its version, and entries
+    under older versions are never served again. That reaches every worker
+    only with a shared CACHE_BACKEND (file or db); with locmem other
+    processes don't see the bump, so entries also expire after `ttl`
+    seconds (None: never) to bound how long they can serve stale sources.
+    """
+
+    def __init__(self, max_entries, similarity, ttl=None):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (bucket, text) -> (sources, vector, expires)
+        self._buckets = {}  # bucket -> {text: vector} of its entries with a vector
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.similar_hits = 0
+
+    @staticmethod
+    def _version_scope(scope):
+        return ('retrieval', scope.label)
+
+    def version(self, scope):
+        """Current index version of the scope (reads the shared cache)"""
+        return ResponseCache().versions([self._version_scope(scope)])[0]
+
+    def invalidate(self, scopes):
+        """Documents were added to or removed from these scopes"""
+        ResponseCache().bump(*[self._version_scope(scope) for scope in scopes])
+
+    @staticmethod
+    def _bucket(scope, version, top_k):
+        return scope.as_tuple(), version, top_k
+
+    def get(self, scope, version, query, top_k, vector=None):
+        """Copy of the cached sources for the query, or None. With the query's
+        vector, near-identical cached queries match as well."""
+        bucket = self._bucket(scope, version, top_k)
+        text = normalize(query)
+        with self._lock:
+            if vector is None:
+                self.lookups += 1
+            entry = self._entries.get((bucket, text))
+            if entry is None and vector is not None and self.similarity <= 1:
+                text = self._nearest(bucket, vector)
+                entry = self._entries.get((bucket, text)) if text is not None else None
+                if entry is not None:
+                    self.similar_hits += 1
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(bucket, text)
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end((bucket, text))
+            self.hits += 1
+        return [dict(source) for source in entry[0]]
+
+    def _remove(self, bucket, text):
+        """Drop an entry and its vector; the caller holds the lock"""
+        self._entries.pop((bucket, text), None)
+        candidates = self._buckets.get(bucket)
+        if candidates is not None:
+            candidates.pop(text, None)
+            if not candidates:
+                del self._buckets[bucket]
+
+    def _nearest(self, bucket, vector):
+        """Text of the bucket's cached query most similar to vector, if similar enough"""
+        candidates = self._buckets.get(bucket)
+        if not candidates:
+            return None
+        texts = list(candidates)
+        query = np.asarray(vector, dtype=np.float32)
+        matrix = np.vstack([candidates[text] for text in texts])
+        scores = matrix @ query / max(float(np.linalg.norm(query)), 1e-12)
+        best = int(np.argmax(scores))
+        return texts[best] if scores[best] >= self.similarity else None
+
+    def put(self, scope, version, query, top_k, sources, vector=None):
+        if self.max_entries <= 0:
+            return
+        bucket = self._bucket(scope, version, top_k)
+        text = normalize(query)
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[(bucket, text)] = ([dict(source) for source in sources], vector, expires)
+            self._entries.move_to_end((bucket, text))
+            if vector is not None:
+                self._buckets.setdefault(bucket, {})[text] = vector
+            while len(self._entries) > self.max_entries:
+                self._remove(*next(iter(self._entries)))
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.lookups - self.hits,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else None,
+        }
+
+
+class ChunkCache:
+    """In-process LRU of chunk (text, page number, content id) by key, for
+    hydrating vector matches and resolving stored citations. A stored chunk never changes (a re-upload of the same
+    bytes shares it), so entries need no invalidation; deleted ones age out."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """{key: (text, page, content id)} of the keys that are cached"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = entry
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        with self._lock:
+            self._entries.update(entries)
+            for key in entries:
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+_cache = None
+_chunk_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process's retrieval cache, or None when RETRIEVAL_CACHE_SIZE is 0"""
+    global _cache
+    if _cache is None and settings.RETRIEVAL_CACHE_SIZE:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache(
+                    settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_SIMILARITY,
+                    settings.RETRIEVAL_CACHE_TTL or None,
+                )
+    return _cache
+
+
+def get_chunk_cache():
+    """The process's chunk cache, or None when CHUNK_CACHE_SIZE is 0"""
+    global _chunk_cache
+    if _chunk_cache is None and settings.CHUNK_CACHE_SIZE:
+        with _cache_lock:
+            if _chunk_cache is None:
+                _chunk_cache = ChunkCache(settings.CHUNK_CACHE_SIZE)
+    return _chunk_cache
@@ -0,0 +1,124 @@
+def scopes_changed(scopes):
+    """Documents were added to or removed from these scopes: drop their cached
+    retrievals and repack their segments"""
+    from services import retrieval_cache, segments
+    cache = retrieval_cache.get_cache()
+    if cache is not None:
+        cache.invalidate(scopes)
+    segments.scopes_changed(scopes)
+
+
+class ScopeError(Exception):
+    """A retrieval scope the requester can't use; carries the HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class RetrievalScope:
+    """What a retrieval searches: one document, one chat, or every document
+    a user owns (across all of their chats).
+
+    A scope resolves to the ids of the DocumentContents behind it; the same
+    content shared by several chats or documents is searched once.
+    """
+
+    DOCUMENT = 'document'
+    CHAT = 'chat'
+    USER = 'user'
+    KINDS = (DOCUMENT, CHAT, USER)
+
+    def __init__(self, kind, key):
+        if kind not in self.KINDS:
+            raise ScopeError(f"Unknown scope '{kind}'; expected one of {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.key = str(key)
+
+    @classmethod
+    def document(cls, document_id):
+        return cls(cls.DOCUMENT, document_id)
+
+    @classmethod
+    def chat(cls, chat_id):
+        return cls(cls.CHAT, chat_id)
+
+    @classmethod
+    def user(cls, user_id):
+        return cls(cls.USER, user_id)
+
+    @classmethod
+    def for_request(cls, data, user, chat):
+        """The scope asked for by a chat request: 'scope' is chat (default),
+        document (with 'document_id', one of the requester's documents) or user
+        (all of a logged-in user's documents)"""
+        from documents.models import Document
+        kind = data.get('scope') or cls.CHAT
+        if kind == cls.CHAT:
+            return cls.chat(chat.supabase_id)
+        if kind == cls.DOCUMENT:
+            document_id = data.get('document_id')
+            if not document_id:
+                raise ScopeError('document_id is required for the document scope')
+            # Guests share one account, so they are limited to their own chat
+            try:
+                owned = Document.objects.filter(pk=int(document_id))
+            except (TypeError, ValueError):
+                raise ScopeError('document_id must be a document id')
+            owned = owned.filter(chat__user=user) if user.is_authenticated else owned.filter(chat=chat)
+            if not owned.exists():
+                raise ScopeError('Document not found', 404)
+            return cls.document(document_id)
+        if kind == cls.USER:
+            if not user.is_authenticated:
+                raise ScopeError('Searching all documents requires signing in', 403)
+            return cls.user(user.pk)
+        raise ScopeError(f"Unknown scope '{kind}'; expected one of {', '.join(cls.KINDS)}")
+
+    @property
+    def label(self):
+        return f'{self.kind}:{self.key}'
+
+    def as_tuple(self):
+        """(kind, key), the form services.cache_service scopes take"""
+        return self.kind, self.key
+
+    def contents(self):
+        """(content ids ascending, vector prefixes of those stored before content sharing)"""
+        from documents.models import DocumentContent
+        if self.kind == self.USER:
+            contents = DocumentContent.objects.filter(owner_id=self.key, ref_count__gt=0)
+        elif self.kind == self.CHAT:
+            contents = DocumentContent.objects.filter(documents__chat__supabase_id=self.key)
+        else:
+            contents = DocumentContent.objects.filter(documents__pk=self.key)
+        rows = set(contents.values_list('id', 'vector_prefix'))
+        return sorted(pk for pk, _ in rows), sorted(prefix for _, prefix in rows if prefix)
+
+    def vector_filter(self, content_ids, legacy_prefixes=()):
+        """Pinecone metadata filter for the scope's vectors"""
+        clauses = [{'content_id': {'$in': list(content_ids)}}]
+        # Vectors stored before content sharing carry their document's
+        # prefix as pdf_id, and the chat they were uploaded to
+        if legacy_prefixes:
+            clauses.append({'pdf_id': {'$in': list(legacy_prefixes)}})
+        if self.kind == self.CHAT:
+            clauses.append({'chat_id': self.key})
+        return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+    def allows(self, metadata, content_ids, legacy_prefixes=()):
+        """Whether a vector match (by its metadata) belongs to the scope"""
+        if metadata.get('content_id') in content_ids:
+            return True
+        if metadata.get('pdf_id') and metadata['pdf_id'] in legacy_prefixes:
+            return True
+        return self.kind == self.CHAT and metadata.get('chat_id') == self.key
+
+    def __eq__(self, other):
+        return isinstance(other, RetrievalScope) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return f'RetrievalScope({self.label})'
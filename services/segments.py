@@ -0,0 +1,361 @@
+import glob
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from . import ann, vectors
+from .background import BackgroundWorker
+
+
+class PackedSegment:
+    """A scope's packed segment, memory-mapped: chunk ids, vectors and the
+    content id of every row. With an inverted-file index the rows are
+    grouped by list, list l being rows offsets[l]:offsets[l + 1] around
+    centroids[l]."""
+
+    def __init__(self, manifest, ids, matrix, row_contents, centroids=None, offsets=None):
+        self.manifest = manifest
+        self.contents = frozenset(manifest['contents'])
+        self.ids = ids
+        self.matrix = matrix
+        self.row_contents = row_contents
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def ranges(self, query, nprobe):
+        """Row ranges to scan for the query: all rows, or the nprobe nearest lists"""
+        if self.centroids is None:
+            return [(0, len(self.ids))]
+        return ann.probe(query, self.centroids, self.offsets, nprobe)
+
+
+class SegmentStore:
+    """Per-document vector segments for local search, as .npy files.
+
+    A segment holds a ready content's chunk vectors (float32, normalised,
+    decoded from the full-precision copy where there is one) and their
+    DocumentChunk ids. Contents never change once ready, so a segment is
+    written once (at the end of ingestion, or by the first search that needs
+    it) and memory-mapped by every worker after that: opening one is a page
+    cache lookup, not a database scan.
+
+    Chat and user scopes also get a packed segment: the rows of all their
+    contents in one matrix, with a content id per row, so a search across a
+    large library is one matrix product instead of one per document. The
+    packed segment is searched together with the segments of contents added
+    since it was packed, rows of removed contents are masked out, and the
+    results are merged top-k. pack() replaces it (as a new generation of
+    files named in a small JSON manifest) once that gets too far behind.
+
+    Packed segments of LOCAL_ANN_MIN_ROWS rows or more are laid out as an
+    inverted-file (IVF) index: rows are grouped by nearest k-means centroid
+    and a search scans only the LOCAL_ANN_NPROBE lists nearest the query.
+    Repacking keeps the centroids and files new rows into their lists until
+    the segment outgrows the rows they were trained on by
+    LOCAL_ANN_RETRAIN_GROWTH.
+    """
+
+    def __init__(self, directory=None, max_open=None):
+        self.directory = directory or os.path.join(settings.WARM_STATE_DIR, 'segments')
+        self.max_open = max_open or settings.LOCAL_INDEX_OPEN_SEGMENTS
+        self._open = OrderedDict()  # content id -> (ids, matrix), most recent last
+        self._packed = OrderedDict()  # scope label -> (manifest stat, packed segment)
+        self._lock = threading.Lock()
+
+    def _paths(self, content_id):
+        base = os.path.join(self.directory, 'content-%d' % content_id)
+        return base + '.ids.npy', base + '.vectors.npy'
+
+    def build(self, content_id):
+        """Write the segment of a ready content from its stored chunks; (ids, matrix)"""
+        from documents.models import DocumentChunk
+        rows = list(
+            DocumentChunk.objects.filter(source_id=content_id)
+            .order_by('chunk_id')
+            .values_list('id', 'vector', 'vector_dtype', 'vector_scale', 'vector_full')
+        )
+        ids, matrix = vectors.decode_rows([
+            (pk, full, 'float32', 1.0) if full else (pk, codes, dtype, scale)
+            for pk, codes, dtype, scale, full in rows
+        ])
+        matrix = vectors.normalize(matrix)
+        ids = np.asarray(ids, dtype=np.int64)
+        os.makedirs(self.directory, exist_ok=True)
+        ids_path, vectors_path = self._paths(content_id)
+        # Vectors first, ids last: an ids file means the segment is complete
+        for path, array in ((vectors_path, matrix), (ids_path, ids)):
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+            np.save(temp_path, array)
+            os.replace(temp_path, path)
+        return ids, matrix
+
+    def _load(self, content_id):
+        ids_path, vectors_path = self._paths(content_id)
+        try:
+            ids = np.load(ids_path, mmap_mode='r')
+            matrix = np.load(vectors_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        return ids, matrix
+
+    def get(self, content_id, build=True):
+        """(ids, matrix) of a content's segment, building it if missing and allowed"""
+        with self._lock:
+            if content_id in self._open:
+                self._open.move_to_end(content_id)
+                return self._open[content_id]
+        segment = self._load(content_id)
+        if segment is None:
+            if not build:
+                return None
+            segment = self.build(content_id)
+        with self._lock:
+            self._open[content_id] = segment
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return segment
+
+    def discard(self, content_ids):
+        """Remove the segments of deleted contents"""
+        for content_id in content_ids:
+            with self._lock:
+                self._open.pop(content_id, None)
+            for path in self._paths(content_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _top(ids, scores, top_k):
+        """[(score, chunk id)] of the top_k scores, unordered"""
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        return [(float(scores[i]), int(ids[i])) for i in best if scores[i] > -np.inf]
+
+    def _search_contents(self, query, content_ids, top_k):
+        candidates = []
+        for content_id in content_ids:
+            ids, matrix = self.get(content_id)
+            if not len(ids) or matrix.shape[1] != query.shape[0]:
+                continue
+            candidates.extend(self._top(ids, matrix @ query, top_k))
+        return candidates
+
+    def search(self, query, content_ids, top_k):
+        """Top-k [(chunk id, cosine score)] across the contents' segments, best first"""
+        query = vectors.normalize(np.asarray(query, dtype=np.float32))
+        if not query.any():
+            return []
+        candidates = self._search_contents(query, content_ids, top_k)
+        return [(chunk_id, score) for score, chunk_id in heapq.nlargest(top_k, candidates)]
+
+    # Packed scope segments
+
+    def _scope_base(self, label):
+        digest = hashlib.blake2b(label.encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(self.directory, f'scope-{digest}')
+
+    def _load_packed(self, label):
+        """The scope's PackedSegment, or None"""
+        manifest_path = self._scope_base(label) + '.json'
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._packed.pop(label, None)
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._packed.get(label)
+            if cached and cached[0] == version:
+                self._packed.move_to_end(label)
+                return cached[1]
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            base = f"{self._scope_base(label)}-{manifest['generation']}"
+            arrays = [np.load(f'{base}.{name}.npy', mmap_mode='r') for name in ('ids', 'vectors', 'contents')]
+            if manifest.get('ann'):
+                arrays += [np.load(f'{base}.{name}.npy') for name in ('centroids', 'offsets')]
+            packed = PackedSegment(manifest, *arrays)
+        except (OSError, ValueError, KeyError):
+            # Replaced by another worker while we read it; the next search retries
+            return None
+        with self._lock:
+            self._packed[label] = (version, packed)
+            while len(self._packed) > self.max_open:
+                self._packed.popitem(last=False)
+        return packed
+
+    def search_scope(self, query, scope, content_ids, top_k, nprobe=None):
+        """Like search(), over a scope's ready contents: its packed segment
+        (without rows of contents no longer in content_ids) merged with the
+        segments of contents packed after it. Schedules a repack when the
+        packed segment is missing or too far behind."""
+        query = vectors.normalize(np.asarray(query, dtype=np.float32))
+        if not query.any():
+            return []
+        live = set(content_ids)
+        packed = self._load_packed(scope.label)
+        if packed is not None and packed.dim != query.shape[0]:
+            packed = None
+        packed_contents = packed.contents if packed is not None else frozenset()
+        delta = sorted(live - packed_contents)
+        dead = list(packed_contents - live)
+        candidates = []
+        if packed is not None and packed_contents & live:
+            for start, stop in packed.ranges(query, nprobe or settings.LOCAL_ANN_NPROBE):
+                scores = packed.matrix[start:stop] @ query
+                if dead:
+                    scores[np.isin(packed.row_contents[start:stop], dead)] = -np.inf
+                candidates.extend(self._top(packed.ids[start:stop], scores, top_k))
+        candidates.extend(self._search_contents(query, delta, top_k))
+        if self._stale(packed, live, delta, dead):
+            schedule_pack(scope)
+        return [(chunk_id, score) for score, chunk_id in heapq.nlargest(top_k, candidates)]
+
+    @staticmethod
+    def _stale(packed, live, delta, dead):
+        """Whether the scope's packed segment should be rebuilt"""
+        if packed is None:
+            return len(delta) > settings.SCOPE_SEGMENT_MAX_DELTA
+        if len(delta) > settings.SCOPE_SEGMENT_MAX_DELTA:
+            return True
+        if dead:
+            dead_rows = int(np.isin(packed.row_contents, list(dead)).sum())
+            return not live or dead_rows > settings.SCOPE_SEGMENT_MAX_DEAD * len(packed.row_contents)
+        return False
+
+    def _index(self, label, arrays):
+        """Lay the packed arrays out as an IVF index; returns (arrays, manifest entry)"""
+        rows, dim = arrays['vectors'].shape
+        previous = self._load_packed(label)
+        if (previous is not None and previous.centroids is not None and previous.dim == dim
+                and rows <= previous.manifest['ann']['trained_rows'] * settings.LOCAL_ANN_RETRAIN_GROWTH):
+            centroids = np.array(previous.centroids)
+            trained_rows = previous.manifest['ann']['trained_rows']
+        else:
+            centroids = ann.train(arrays['vectors'], settings.LOCAL_ANN_LISTS or ann.default_lists(rows))
+            trained_rows = rows
+        order, offsets = ann.layout(ann.assign(arrays['vectors'], centroids), len(centroids))
+        arrays = {name: array[order] for name, array in arrays.items()}
+        arrays.update(centroids=centroids, offsets=offsets)
+        return arrays, {'lists': len(centroids), 'trained_rows': trained_rows}
+
+    def pack(self, scope, content_ids):
+        """Write a new packed segment of the contents for the scope (none if
+        there are no contents) and remove older generations"""
+        base = self._scope_base(scope.label)
+        os.makedirs(self.directory, exist_ok=True)
+        generation = time.time_ns()
+        if content_ids:
+            parts = [(content_id,) + self.get(content_id) for content_id in content_ids]
+            dims = [matrix.shape[1] for _, ids, matrix in parts if len(ids)]
+            # Contents embedded by another model than most can't be packed with them
+            dim = max(set(dims), key=dims.count) if dims else 0
+            parts = [part for part in parts if len(part[1]) and part[2].shape[1] == dim]
+            arrays = {
+                'vectors': np.concatenate([matrix for _, _, matrix in parts]) if parts
+                else np.zeros((0, dim), dtype=np.float32),
+                'contents': np.concatenate([np.full(len(ids), content_id, dtype=np.int64)
+                                            for content_id, ids, _ in parts]) if parts
+                else np.zeros(0, dtype=np.int64),
+                'ids': np.concatenate([ids for _, ids, _ in parts]) if parts else np.zeros(0, dtype=np.int64),
+            }
+            manifest = {'scope': scope.label, 'generation': generation, 'contents': sorted(content_ids)}
+            if settings.LOCAL_ANN_MIN_ROWS and len(arrays['ids']) >= settings.LOCAL_ANN_MIN_ROWS:
+                arrays, manifest['ann'] = self._index(scope.label, arrays)
+            for name, array in arrays.items():
+                path = f'{base}-{generation}.{name}.npy'
+                temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+                np.save(temp_path, array)
+                os.replace(temp_path, path)
+            temp_path = f'{base}.json.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, base + '.json')
+        else:
+            try:
+                os.remove(base + '.json')
+            except FileNotFoundError:
+                pass
+        # Workers still reading an older generation keep their mapping of it
+        for path in glob.glob(f'{base}-*.npy'):
+            if not path.startswith(f'{base}-{generation}.'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._packed.pop(scope.label, None)
+
+    def refresh(self, scope):
+        """Repack the scope if its packed segment is missing or too far behind"""
+        from documents.models import DocumentContent
+        content_ids, _ = scope.contents()
+        ready = list(
+            DocumentContent.objects.filter(pk__in=content_ids, status=DocumentContent.STATUS_READY)
+            .order_by('id').values_list('id', flat=True)
+        )
+        packed = self._load_packed(scope.label)
+        packed_contents = packed.contents if packed is not None else frozenset()
+        live = set(ready)
+        delta = sorted(live - packed_contents)
+        dead = packed_contents - live
+        if (packed is not None and not live) or self._stale(packed, live, delta, dead):
+            started = time.perf_counter()
+            self.pack(scope, ready)
+            print(f"Segments: packed {scope.label} ({len(ready)} contents) in "
+                  f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+_store = None
+
+
+def get_store():
+    """The process-wide SegmentStore"""
+    global _store
+    if _store is None:
+        _store = SegmentStore()
+    return _store
+
+
+_packer = BackgroundWorker('scope-packer')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _refresh(scope):
+    with _pending_lock:
+        _pending.discard(scope)
+    get_store().refresh(scope)
+
+
+def schedule_pack(scope):
+    """Check (and if needed repack) the scope's packed segment off the request path"""
+    with _pending_lock:
+        if scope in _pending:
+            return
+        _pending.add(scope)
+    if not _packer.submit(_refresh, scope):
+        with _pending_lock:
+            _pending.discard(scope)
+
+
+def scopes_changed(scopes):
+    """Documents were added to or removed from these scopes"""
+    for scope in scopes:
+        if scope.kind != scope.DOCUMENT:
+            schedule_pack(scope)
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: the cache stays off
+    fcntl = None
+
+MAGIC = b'RAGVEC01'
+HEADER_SIZE = 64
+PROBES = 8
+
+
+class SharedVectorCache:
+    """Fixed-size text -> float32 vector table in a memory-mapped file.
+
+    Every worker on the host maps the same file, so an entry written by one
+    is a hit for all of them, and it survives worker recycles and restarts.
+    Slots are open-addressed by a 128-bit hash of the text; when all probe
+    slots are taken the first is overwritten. Writers serialise on a lock
+    file; readers don't lock but use a per-slot sequence number (odd while a
+    write is in progress) to skip torn entries.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.dim = None
+        self._keys = self._seq = self._vectors = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text):
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        return np.frombuffer(digest, dtype=np.uint64)
+
+    def _file_lock(self):
+        """Lock file descriptor for this process (flock locks are shared across fork)"""
+        if self._pid != os.getpid():
+            self._lock_file = open(self.path + '.lock', 'a+b')
+            self._pid = os.getpid()
+        return self._lock_file
+
+    def _layout(self, dim):
+        keys = self.slots * 16
+        seq = self.slots * 4
+        return HEADER_SIZE, HEADER_SIZE + keys, HEADER_SIZE + keys + seq, HEADER_SIZE + keys + seq + self.slots * dim * 4
+
+    def _map(self, dim):
+        keys_at, seq_at, vectors_at, _ = self._layout(dim)
+        self._keys = np.memmap(self.path, dtype=np.uint64, mode='r+', offset=keys_at, shape=(self.slots, 2))
+        self._seq = np.memmap(self.path, dtype=np.uint32, mode='r+', offset=seq_at, shape=(self.slots,))
+        self._vectors = np.memmap(self.path, dtype=np.float32, mode='r+', offset=vectors_at, shape=(self.slots, dim))
+        self.dim = dim
+
+    def _read_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(HEADER_SIZE)
+        except OSError:
+            return None
+        if len(header) < 16 or header[:8] != MAGIC:
+            return None
+        dim, slots = np.frombuffer(header[8:16], dtype=np.uint32)
+        return int(dim), int(slots)
+
+    def _attach(self, dim=None):
+        """Map the file, creating it (sparse) for dim-sized vectors if needed; False if unusable"""
+        if self.dim is not None:
+            return dim is None or dim == self.dim
+        header = self._read_header()
+        if header and header[1] == self.slots and (dim is None or header[0] == dim):
+            self._map(header[0])
+            return True
+        if dim is None or fcntl is None:
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock = self._file_lock()
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            header = self._read_header()
+            if not (header and header[1] == self.slots and header[0] == dim):
+                # New file, or one sized for another model or slot count
+                temp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(MAGIC + np.array([dim, self.slots], dtype=np.uint32).tobytes())
+                    f.truncate(self._layout(dim)[3])
+                os.replace(temp_path, self.path)
+            self._map(dim)
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get(self, text):
+        """Copy of the cached vector for text, or None"""
+        with self._lock:
+            if not self._attach():
+                self.misses += 1
+                return None
+        key = self._key(text)
+        start = int(key[0] % self.slots)
+        for probe in range(PROBES):
+            slot = (start + probe) % self.slots
+            before = int(self._seq[slot])
+            if before & 1 or not np.array_equal(self._keys[slot], key):
+                continue
+            vector = np.array(self._vectors[slot])
+            if int(self._seq[slot]) == before:
+                self.hits += 1
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, text, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if not self._attach(vector.shape[0]):
+                return
+            key = self._key(text)
+            start = int(key[0] % self.slots)
+            lock = self._file_lock()
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                target = start
+                for probe in range(PROBES):
+                    slot = (start + probe) % self.slots
+                    if np.array_equal(self._keys[slot], key) or not self._keys[slot].any():
+                        target = slot
+                        break
+                self._seq[target] += 1  # odd: readers skip the slot
+                self._keys[target] = key
+                self._vectors[target] = vector
+                self._seq[target] += 1
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'path': self.path,
+            'slots': self.slots,
+            'dim': self.dim,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
@@ -0,0 +1,133 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Serialises read-modify-write of a bucket within a process; across processes
+# the cache makes it approximate, which is fine for rate limiting.
+_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """'20/min' -> (capacity 20, refill 20/60 tokens per second)"""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBucket:
+    """Token bucket per client, stored in the configured cache.
+
+    A full bucket lets a client burst up to its capacity; after that requests
+    are admitted at the refill rate.
+    """
+
+    def __init__(self, name, rate, alias=None):
+        self.name = name
+        self.capacity, self.refill = parse_rate(rate)
+        self.cache = caches[alias or settings.THROTTLE_CACHE_ALIAS]
+        # An untouched bucket is full again after this long, so let it expire
+        self.timeout = int(self.capacity / self.refill) + 1
+
+    def consume(self, ident, tokens=1):
+        """Take tokens for ident; return 0 if allowed, else seconds until they are available"""
+        key = 'bucket:%s:%s' % (self.name, ident)
+        with _lock:
+            now = time.time()
+            level, stamp = self.cache.get(key) or (self.capacity, now)
+            level = min(self.capacity, level + (now - stamp) * self.refill)
+            if level >= tokens:
+                self.cache.set(key, (level - tokens, now), self.timeout)
+                return 0
+            self.cache.set(key, (level, now), self.timeout)
+            return (tokens - level) / self.refill
+
+
+def client_ip(request):
+    """Client address: each trusted proxy appends the address it saw to
+    X-Forwarded-For, so the client is TRUSTED_PROXY_COUNT entries from the
+    right; anything further left was written by the client itself"""
+    depth = settings.TRUSTED_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if depth and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        if len(addresses) >= depth and addresses[-depth]:
+            return addresses[-depth]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_ident(request):
+    """Stable identity for fairness and limits: user, else session, else IP"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:%s' % user.pk
+    if request.session.session_key:
+        return 'session:%s' % request.session.session_key
+    return 'ip:%s' % client_ip(request)
+
+
+def buckets_for(request, scope):
+    """(bucket, ident) pairs charged for one request in scope"""
+    rates = settings.THROTTLE_RATES.get(scope, {})
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        pairs = [('user', user.pk)]
+    else:
+        # Guests are limited per session and, since sessions are free to
+        # discard, per IP with a larger allowance for shared addresses
+        pairs = [('ip', client_ip(request))]
+        if request.session.session_key:
+            pairs.insert(0, ('session', request.session.session_key))
+    return [
+        (TokenBucket('%s_%s' % (scope, kind), rates[kind]), ident)
+        for kind, ident in pairs if rates.get(kind)
+    ]
+
+
+def throttle_wait(request, scope):
+    """Charge the request against its buckets; return seconds to wait, or 0 if allowed"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0
+    wait = 0
+    for bucket, ident in buckets_for(request, scope):
+        wait = max(wait, bucket.consume(ident))
+        if wait:
+            print(f"Throttle: {scope} limit hit for {bucket.name}:{ident}, retry in {wait:.1f}s")
+            break
+    return wait
+
+
+def too_many_requests(wait, message='Rate limit exceeded'):
+    """429 for plain Django views; DRF views get the same from their throttle classes"""
+    response = JsonResponse({'error': message, 'retry_after': round(wait, 1)}, status=429)
+    response['Retry-After'] = str(max(1, int(wait + 0.999)))
+    return response
+
+
+class ScopedBucketThrottle(BaseThrottle):
+    """DRF throttle backed by the token buckets for `scope`"""
+
+    scope = None
+
+    def allow_request(self, request, view):
+        self._wait = throttle_wait(request, self.scope)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class LLMThrottle(ScopedBucketThrottle):
+    scope = 'llm'
+
+
+class ChatCreateThrottle(ScopedBucketThrottle):
+    scope = 'chat_create'
+
+
+class PrefetchThrottle(ScopedBucketThrottle):
+    scope = 'prefetch'
@@ -0,0 +1,103 @@
+import numpy as np
+from django.conf import settings
+
+# Storage dtypes for chunk vectors; int8 codes carry a per-vector scale
+DTYPES = {
+    'float32': np.float32,
+    'float16': np.float16,
+    'int8': np.int8,
+}
+
+
+def encode(vector, dtype):
+    """Compact codes for a vector: (bytes, scale).
+
+    int8 maps [-max|x|, max|x|] onto [-127, 127], so each vector keeps its
+    own scale; float16/float32 store the values directly with scale 1.
+    """
+    values = np.asarray(vector, dtype=np.float32)
+    if dtype == 'int8':
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        codes = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+        return codes.tobytes(), scale
+    return values.astype(DTYPES[dtype]).tobytes(), 1.0
+
+
+def decode(codes, dtype, scale=1.0):
+    """Float32 vector back from encode()'s output"""
+    values = np.frombuffer(codes, dtype=DTYPES[dtype]).astype(np.float32)
+    return values * np.float32(scale) if dtype == 'int8' else values
+
+
+def chunk_fields(vector):
+    """DocumentChunk field values for an embedding, per EMBEDDING_STORAGE_DTYPE"""
+    dtype = settings.EMBEDDING_STORAGE_DTYPE
+    codes, scale = encode(vector, dtype)
+    keep_full = settings.EMBEDDING_KEEP_FULL_PRECISION and dtype != 'float32'
+    return {
+        'vector': codes,
+        'vector_dtype': dtype,
+        'vector_scale': scale,
+        # float32 copy for reranking; redundant when the codes are float32
+        'vector_full': encode(vector, 'float32')[0] if keep_full else b'',
+    }
+
+
+def payload_values(vector):
+    """Vector values for a JSON request, at float32 precision.
+
+    Pinecone stores float32, so the shortest decimal that round-trips to the
+    same float32 loses nothing and is about half the size of a float64 repr.
+    """
+    return [float(str(value)) for value in np.asarray(vector, dtype=np.float32)]
+
+
+def normalize(matrix):
+    """Rows (or a vector) scaled to unit length; zero rows stay zero"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def decode_rows(rows):
+    """(keys, float32 matrix) from (key, codes, dtype, scale) rows"""
+    keys, vectors = [], []
+    by_dtype = {}
+    for key, codes, dtype, scale in rows:
+        if codes:
+            by_dtype.setdefault(dtype, []).append((key, codes, scale))
+    for dtype, group in by_dtype.items():
+        # One frombuffer per dtype instead of one per row
+        matrix = np.frombuffer(b''.join(codes for _, codes, _ in group), dtype=DTYPES[dtype])
+        matrix = matrix.reshape(len(group), -1).astype(np.float32)
+        if dtype == 'int8':
+            matrix *= np.array([scale for _, _, scale in group], dtype=np.float32)[:, None]
+        keys.extend(key for key, _, _ in group)
+        vectors.append(matrix)
+    if not vectors:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return keys, np.vstack(vectors)
+
+
+def search(query, rows, top_k, load_full=None, oversample=None):
+    """Top-k [(key, cosine score)] over stored codes, best first.
+
+    rows are (key, codes, dtype, scale). Scores over quantized codes are
+    approximate, so the best top_k * oversample are rescored against
+    full-precision vectors from load_full(keys) -> {key: float32 bytes}.
+    """
+    query = normalize(np.asarray(query, dtype=np.float32))
+    keys, matrix = decode_rows(rows)
+    if not keys or not query.any() or matrix.shape[1] != query.shape[0]:
+        return []
+    scores = normalize(matrix) @ query
+    oversample = oversample or settings.VECTOR_RERANK_OVERSAMPLE
+    shortlist = np.argsort(-scores)[:top_k * oversample]
+    if load_full is not None:
+        full = load_full([keys[i] for i in shortlist])
+        for i in shortlist:
+            codes = full.get(keys[i])
+            if codes:
+                scores[i] = float(normalize(decode(codes, 'float32')) @ query)
+    best = sorted(shortlist, key=lambda i: -scores[i])[:top_k]
+    return [(keys[i], float(scores[i])) for i in best]
@@ -0,0 +1,53 @@
+import importlib
+import os
+import random
+import time
+from django.conf import settings
+
+
+def preload():
+    """Load what every worker needs once, in the gunicorn master (--preload).
+
+    Forked workers, including every replacement after a --max-requests
+    recycle, start with these modules and the URLconf already imported and
+    share their memory copy-on-write. Nothing here opens sockets or starts
+    threads: those don't survive a fork, so clients, model sessions and
+    worker threads are still created lazily in each worker.
+    """
+    started = time.perf_counter()
+    loaded = []
+    for name in settings.WARM_PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError as e:
+            print(f"Preload: skipping {name}: {e}")
+    if settings.EMBEDDING_BACKEND == 'onnx':
+        for name in ('onnxruntime', 'tokenizers'):
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    # Every view module, so the first request in a worker doesn't import them
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    os.makedirs(settings.WARM_STATE_DIR, exist_ok=True)
+    # A connection opened while importing must not be shared by the workers
+    from django.db import connections
+    connections.close_all()
+    print(f"Preload: {len(loaded)} modules in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+def post_fork():
+    """Per-worker setup after forking from a preloaded master"""
+    from django.db import connections
+    # Forget (without closing: the socket is the master's) any connection
+    # inherited from the master; each worker opens its own
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+    # Forked workers would otherwise share the master's random state
+    random.seed()
+    # Deletions left unfinished by the worker this one replaces (the master
+    # doesn't start threads, so this can't happen in preload())
+    from documents.services import sweeper
+    sweeper.schedule()
@@ -54,7 +54,7 @@ function loadChat(chatId) {
             chatMessages.innerHTML = '<div class="text-center text-muted"><i class="fas fa-comment-dots fa-2x mb-2"></i><p>No messages yet. Start the conversation!</p></div>';
         } else {
             messages.forEach(message => {
-                addMessageToChat(message.role, message.content, message.sources);
+                addMessageToChat(message.role, message.content, message.sources, message.id);
             });
         }
     })
@@ -102,7 +102,7 @@ function sendMessage() {
         if (data.error) {
             addMessageToChat('assistant', 'Error: ' + data.error);
         } else {
-            addMessageToChat('assistant', data.response, data.sources);
+            addMessageToChat('assistant', data.response, data.sources, data.message_id);
         }
     })
     .catch(error => {
@@ -111,7 +111,7 @@ function sendMessage() {
     });
 }
 
-function addMessageToChat(role, content, sources = []) {
+function addMessageToChat(role, content, sources = [], messageId = null) {
     const chatMessages = document.getElementById('chat-messages');
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${role}`;
@@ -120,9 +120,11 @@ function addMessageToChat(role, content, sources = []) {
     if (sources && sources.length > 0) {
         sourcesHtml = '<div class="sources"><small><i class="fas fa-book me-1"></i>Sources: ';
         sources.forEach((source, index) => {
-            sourcesHtml += `[S${index + 1}] Page ${source.page} `;
+            sourcesHtml += messageId
+                ? `<a href="#" class="source-link" data-index="${index}">[S${index + 1}] Page ${source.page}</a> `
+                : `[S${index + 1}] Page ${source.page} `;
         });
-        sourcesHtml += '</small></div>';
+        sourcesHtml += '</small><div class="source-text small text-muted"></div></div>';
     }
     
     messageDiv.innerHTML = `
@@ -133,10 +135,42 @@ function addMessageToChat(role, content, sources = []) {
         </div>
     `;
     
+    messageDiv.querySelectorAll('.source-link').forEach(link => {
+        link.addEventListener('click', function(e) {
+            e.preventDefault();
+            showSource(messageDiv, messageId, Number(this.dataset.index));
+        });
+    });
+    
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
+// Messages carry only chunk references; the texts of a message's sources
+// are fetched the first time one of its citations is opened
+function showSource(messageDiv, messageId, index) {
+    const panel = messageDiv.querySelector('.source-text');
+    if (panel.dataset.index === String(index)) {
+        panel.textContent = '';
+        panel.dataset.index = '';
+        return;
+    }
+    if (!messageDiv.sourcesRequest) {
+        messageDiv.sourcesRequest = fetch(`/api/chat/${currentChatId}/messages/${messageId}/sources/`)
+            .then(response => response.json());
+    }
+    messageDiv.sourcesRequest
+    .then(sources => {
+        const source = sources[index];
+        panel.textContent = source && source.text ? source.text : 'This source is no longer available.';
+        panel.dataset.index = String(index);
+    })
+    .catch(error => {
+        console.error('Error loading source:', error);
+        messageDiv.sourcesRequest = null;
+    });
+}
+
 // Enter key handler
 document.getElementById('message-input').addEventListener('keypress', function(e) {
     if (e.key === 'Enter') {